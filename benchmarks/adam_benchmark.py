@@ -0,0 +1,89 @@
+"""
+Compares the step time of inferno's multi-tensor `Adam`
+with a per-parameter python loop (the previous implementation) and
+with `torch.optim.Adam(foreach=True)`, for a model with many
+parameter tensors.
+"""
+
+import argparse
+import math
+import time
+
+import torch
+import torch.nn as nn
+from torch.optim import Optimizer
+from inferno.extensions.optimizers import Adam
+
+
+class LoopAdam(Optimizer):
+    """The per-parameter loop inferno's Adam used to be (with L1 penalty)."""
+    def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-8,
+                 lambda_l1=0, weight_decay=0):
+        defaults = dict(lr=lr, betas=betas, eps=eps,
+                        lambda_l1=lambda_l1, weight_decay=weight_decay)
+        super(LoopAdam, self).__init__(params, defaults)
+
+    @torch.no_grad()
+    def step(self, closure=None):
+        for group in self.param_groups:
+            beta1, beta2 = group['betas']
+            for p in group['params']:
+                if p.grad is None:
+                    continue
+                grad = p.grad
+                state = self.state[p]
+                if len(state) == 0:
+                    state['step'] = 0
+                    state['exp_avg'] = torch.zeros_like(p)
+                    state['exp_avg_sq'] = torch.zeros_like(p)
+                exp_avg, exp_avg_sq = state['exp_avg'], state['exp_avg_sq']
+                state['step'] += 1
+                if group['lambda_l1'] != 0:
+                    grad.add_(p.sign(), alpha=group['lambda_l1'])
+                if group['weight_decay'] != 0:
+                    grad.add_(p, alpha=group['weight_decay'])
+                exp_avg.mul_(beta1).add_(grad, alpha=1 - beta1)
+                exp_avg_sq.mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
+                denom = exp_avg_sq.sqrt().add_(group['eps'])
+                bias_correction1 = 1 - beta1 ** state['step']
+                bias_correction2 = 1 - beta2 ** state['step']
+                step_size = group['lr'] * math.sqrt(bias_correction2) / bias_correction1
+                p.addcdiv_(exp_avg, denom, value=-step_size)
+
+
+def benchmark(optimizer, model, num_steps, device):
+    for p in model.parameters():
+        p.grad = torch.rand_like(p)
+    # warm up
+    optimizer.step()
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    start = time.perf_counter()
+    for _ in range(num_steps):
+        optimizer.step()
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    return (time.perf_counter() - start) / num_steps
+
+
+# many small parameter tensors is where the python
+# overhead of the loop dominates
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--num-layers', type=int, default=500)
+    parser.add_argument('--width', type=int, default=64)
+    parser.add_argument('--num-steps', type=int, default=20)
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    model = nn.Sequential(*[nn.Linear(args.width, args.width)
+                            for _ in range(args.num_layers)]).to(device)
+    print("{} parameter tensors".format(len(list(model.parameters()))))
+    print("{:<25}{:>18}".format('optimizer', 'time / step [ms]'))
+    for name, optimizer in [('loop', LoopAdam(model.parameters())),
+                            ('inferno', Adam(model.parameters())),
+                            ('torch (foreach)', torch.optim.Adam(model.parameters(),
+                                                                 foreach=True))]:
+        step_time = benchmark(optimizer, model, args.num_steps, device)
+        print("{:<25}{:>18.3f}".format(name, 1000 * step_time))
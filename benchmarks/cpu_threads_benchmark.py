@@ -0,0 +1,82 @@
+"""
+Measures the training throughput on the CPU for different
+splits of the available cores between the computation (`num_threads`) and
+the data loading workers, and reports the best split for `Trainer.cpu`.
+"""
+
+import argparse
+import time
+import multiprocessing as mp
+
+import numpy as np
+import torch
+from scipy.ndimage import gaussian_filter
+from torch.utils.data import Dataset, DataLoader
+
+from inferno.trainers.basic import Trainer
+from inferno.extensions.models import UNet
+from inferno.utils.torch_utils import get_available_cores
+
+
+class SmoothedNoise(Dataset):
+    """A synthetic dataset with a SciPy transform, as a stand-in for a real pipeline."""
+    def __init__(self, length, shape):
+        self.length = length
+        self.shape = shape
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        image = gaussian_filter(np.random.rand(*self.shape).astype('float32'), sigma=2.)
+        target = (image > image.mean()).astype('float32')
+        return torch.from_numpy(image[None]), torch.from_numpy(target[None])
+
+
+def measure_throughput(num_threads, num_workers, args, results):
+    loader = DataLoader(SmoothedNoise(args.num_samples, (args.size, args.size)),
+                        batch_size=args.batch_size, num_workers=num_workers)
+    trainer = Trainer(UNet(1, 1, dim=2, depth=3, initial_features=16)) \
+        .build_optimizer('Adam') \
+        .build_criterion('BCEWithLogitsLoss') \
+        .bind_loader('train', loader) \
+        .cpu(num_threads=num_threads) \
+        .quiet()
+    trainer.console.toggle_info(False)
+    # warm up
+    trainer.train_for(2)
+    start = time.perf_counter()
+    trainer.train_for(args.num_iterations)
+    elapsed = time.perf_counter() - start
+    results.put(args.num_iterations * args.batch_size / elapsed)
+
+
+# every split runs in a fresh process, since the
+# thread pools and the cpu affinity can't be reset
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=256)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--num-samples', type=int, default=10000)
+    parser.add_argument('--num-iterations', type=int, default=10)
+    args = parser.parse_args()
+
+    num_cores = len(get_available_cores())
+    # Candidate numbers of compute threads (the remaining cores go to the workers)
+    candidates = sorted({max(num_cores * fraction // 4, 1) for fraction in range(1, 5)})
+    context = mp.get_context('spawn')
+    print("{:>12}{:>12}{:>20}".format('threads', 'workers', 'samples / s'))
+    best = None
+    for num_threads in candidates:
+        num_workers = num_cores - num_threads
+        results = context.Queue()
+        process = context.Process(target=measure_throughput,
+                                  args=(num_threads, num_workers, args, results))
+        process.start()
+        throughput = results.get()
+        process.join()
+        print("{:>12}{:>12}{:>20.2f}".format(num_threads, num_workers, throughput))
+        if best is None or throughput > best[0]:
+            best = (throughput, num_threads, num_workers)
+    print("Best split: trainer.cpu(num_threads={}) with DataLoader(num_workers={})"
+          .format(best[1], best[2]))
@@ -0,0 +1,57 @@
+"""
+Compares the runtime and peak memory of the
+`SorensenDiceLoss` with a straightforward implementation,
+which flattens the tensors and materializes all products.
+"""
+
+import argparse
+import time
+
+import torch
+from inferno.utils.torch_utils import flatten_samples
+from inferno.extensions.criteria import SorensenDiceLoss
+
+
+def reference_dice_loss(input, target, eps=1e-6):
+    input = flatten_samples(input)
+    target = flatten_samples(target)
+    numerator = (input * target).sum(-1)
+    denominator = (input * input).sum(-1) + (target * target).sum(-1)
+    return (-2 * (numerator / denominator.clamp(min=eps))).sum()
+
+
+def benchmark(loss_function, input, target, num_steps):
+    device = input.device
+    # warm up
+    loss_function(input, target).backward()
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+        torch.cuda.reset_peak_memory_stats(device)
+        baseline = torch.cuda.memory_allocated(device)
+    start = time.perf_counter()
+    for _ in range(num_steps):
+        input.grad = None
+        loss_function(input, target).backward()
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+        peak_memory = (torch.cuda.max_memory_allocated(device) - baseline) / 2 ** 20
+    else:
+        peak_memory = float('nan')
+    return (time.perf_counter() - start) / num_steps, peak_memory
+
+
+# the peak memory (on top of input and target) is only reported on the gpu
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--shape', type=int, nargs='+', default=[2, 8, 64, 128, 128])
+    parser.add_argument('--num-steps', type=int, default=10)
+    args = parser.parse_args()
+
+    input = torch.rand(*args.shape, device=args.device, requires_grad=True)
+    target = torch.rand(*args.shape, device=args.device)
+    print("{:<12}{:>12}{:>22}".format('loss', 'time [s]', 'peak memory [MB]'))
+    for name, loss_function in [('reference', reference_dice_loss),
+                                ('inferno', SorensenDiceLoss())]:
+        step_time, peak_memory = benchmark(loss_function, input, target, args.num_steps)
+        print("{:<12}{:>12.4f}{:>22.1f}".format(name, step_time, peak_memory))
@@ -0,0 +1,61 @@
+"""
+Compares the per-update cost of `ParameterEMA` with a
+per-parameter python loop, for a model with many parameter tensors.
+"""
+
+import argparse
+import time
+
+import torch
+import torch.nn as nn
+from inferno.trainers.callbacks.essentials import ParameterEMA
+
+
+class _Trainer(object):
+    # ParameterEMA only needs `trainer.model`
+    def __init__(self, model):
+        self.model = model
+
+
+def reference_maintain(model, averages, momentum):
+    for p_model, p_ema in zip(model.parameters(), averages):
+        p_ema.mul_(momentum).add_(p_model.data.mul(1. - momentum))
+
+
+def benchmark(maintain, num_steps, device):
+    # warm up
+    maintain()
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    start = time.perf_counter()
+    for _ in range(num_steps):
+        maintain()
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    return (time.perf_counter() - start) / num_steps
+
+
+# a deep stack of small layers is the worst case
+# for the per-parameter python loop
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--num-layers', type=int, default=200)
+    parser.add_argument('--width', type=int, default=512)
+    parser.add_argument('--num-steps', type=int, default=20)
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    model = nn.Sequential(*[nn.Linear(args.width, args.width)
+                            for _ in range(args.num_layers)]).to(device)
+    num_parameters = sum(p.numel() for p in model.parameters())
+    print("{} parameters in {} tensors".format(num_parameters, len(list(model.parameters()))))
+
+    averages = [p.detach().clone() for p in model.parameters()]
+    print("{:<20}{:>20}".format('implementation', 'time / update [ms]'))
+    timings = [('reference', lambda: reference_maintain(model, averages, 0.99))]
+    for offload in ([False, True] if device.type == 'cuda' else [False]):
+        ema = ParameterEMA(0.99, offload=offload).bind_trainer(_Trainer(model))
+        timings.append(('offloaded' if offload else 'foreach', ema.maintain))
+    for name, maintain in timings:
+        print("{:<20}{:>20.3f}".format(name, 1000 * benchmark(maintain, args.num_steps, device)))
@@ -0,0 +1,67 @@
+"""
+Compares the time of a training step of a model split over
+two devices with `OnDevice`, run naively (every stage waits for the
+previous one) and with `PipelineParallel` for different numbers of
+micro-batches. Without two GPUs, both stages run on the CPU (in threads).
+"""
+
+import argparse
+import time
+
+import torch
+import torch.nn as nn
+from inferno.extensions.containers import PipelineParallel
+from inferno.extensions.layers.device import OnDevice
+
+
+def make_stage(num_layers, width, target_device, device_ordinal):
+    layers = []
+    for _ in range(num_layers):
+        layers.extend([nn.Conv3d(width, width, 3, padding=1), nn.ReLU()])
+    return OnDevice(nn.Sequential(*layers), target_device, device_ordinal=device_ordinal)
+
+
+def benchmark(model, input_, num_steps, synchronize):
+    # warm up
+    model(input_).mean().backward()
+    synchronize()
+    start = time.perf_counter()
+    for _ in range(num_steps):
+        model(input_).mean().backward()
+    synchronize()
+    return (time.perf_counter() - start) / num_steps
+
+
+# the naive split keeps only one device busy at a
+# time, the pipeline overlaps the stages
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--size', type=int, default=32)
+    parser.add_argument('--width', type=int, default=16)
+    parser.add_argument('--num-layers', type=int, default=4)
+    parser.add_argument('--num-steps', type=int, default=5)
+    parser.add_argument('--num-micro-batches', type=int, nargs='+', default=[2, 4, 8])
+    args = parser.parse_args()
+
+    if torch.cuda.device_count() >= 2:
+        placements = [('cuda', 0), ('cuda', 1)]
+
+        def synchronize():
+            for device_ordinal in range(2):
+                torch.cuda.synchronize(device_ordinal)
+    else:
+        placements = [('cpu', None), ('cpu', None)]
+
+        def synchronize():
+            pass
+
+    stages = [make_stage(args.num_layers, args.width, *placement) for placement in placements]
+    input_ = torch.rand(args.batch_size, args.width, args.size, args.size, args.size)
+    print("{:<25}{:>18}".format('model', 'time / step [s]'))
+    print("{:<25}{:>18.4f}".format('naive', benchmark(nn.Sequential(*stages), input_,
+                                                      args.num_steps, synchronize)))
+    for num_micro_batches in args.num_micro_batches:
+        pipeline = PipelineParallel(*stages, num_micro_batches=num_micro_batches)
+        print("{:<25}{:>18.4f}".format('pipeline ({} micro)'.format(num_micro_batches),
+                                       benchmark(pipeline, input_, args.num_steps, synchronize)))
@@ -0,0 +1,99 @@
+"""
+Compares the memory and step time of a 3D UNet with and without
+activation checkpointing. Besides the peak memory of the process (which,
+on the CPU, is dominated by torch itself), the size of the activations
+autograd keeps for the backward pass is reported.
+"""
+
+import argparse
+import resource
+import time
+import multiprocessing as mp
+
+import torch
+from inferno.extensions.models import UNet
+
+
+# the settings to compare
+SETTINGS = [
+    ('default', dict()),
+    ('checkpoint bottom', dict(checkpoint_levels=[3])),
+    ('checkpoint deep levels', dict(checkpoint_levels=[2, 3])),
+    ('memory efficient', dict(memory_efficient=True)),
+]
+
+
+def peak_memory_mb(device):
+    if device.type == 'cuda':
+        return torch.cuda.max_memory_allocated(device) / 2 ** 20
+    # maximum resident set size of this process (in kilobytes on linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+
+def saved_activations_mb(model, input_):
+    # size of the tensors autograd saves for the backward pass (counting shared
+    # storages once)
+    storages = {}
+
+    def pack(tensor):
+        storage = tensor.untyped_storage()
+        storages[storage.data_ptr()] = storage.nbytes()
+        return tensor
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        output = model(input_)
+    del output
+    return sum(storages.values()) / 2 ** 20
+
+
+def run_setting(unet_kwargs, args, results):
+    device = torch.device(args.device)
+    model = UNet(1, 1, dim=3, depth=3, initial_features=args.features,
+                 **unet_kwargs).to(device)
+    optimizer = torch.optim.Adam(model.parameters())
+    input_ = torch.rand(args.batch_size, 1, args.size, args.size, args.size, device=device)
+    target = torch.rand_like(input_)
+
+    def step():
+        optimizer.zero_grad()
+        loss = ((model(input_) - target) ** 2).mean()
+        loss.backward()
+        optimizer.step()
+
+    activations = saved_activations_mb(model, input_)
+    # warm up
+    step()
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+        torch.cuda.reset_peak_memory_stats(device)
+    start = time.perf_counter()
+    for _ in range(args.num_steps):
+        step()
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    step_time = (time.perf_counter() - start) / args.num_steps
+    results.put((activations, peak_memory_mb(device), step_time))
+
+
+# every setting runs in a fresh process, such that
+# the peak memory of the settings is not mixed up
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--size', type=int, default=64)
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--features', type=int, default=16)
+    parser.add_argument('--num-steps', type=int, default=5)
+    args = parser.parse_args()
+
+    context = mp.get_context('spawn')
+    print("{:<25}{:>18}{:>18}{:>15}".format('setting', 'activations [MB]', 'peak memory [MB]',
+                                            'step time [s]'))
+    for name, unet_kwargs in SETTINGS:
+        results = context.Queue()
+        process = context.Process(target=run_setting, args=(unet_kwargs, args, results))
+        process.start()
+        activations, peak_memory, step_time = results.get()
+        process.join()
+        print("{:<25}{:>18.1f}{:>18.1f}{:>15.3f}".format(name, activations, peak_memory,
+                                                         step_time))
@@ -2,14 +2,14 @@
 
 """Top-level package for inferno."""
 
-from . import extensions
-from . import io
-from . import trainers
-from . import utils
+from .utils.python_utils import lazy_module_attributes
 from .version import __version__
 
 
 __all__ = ['extensions', 'io', 'trainers', 'utils']
 
+# The subpackages (and their dependencies) are imported on first access
+__getattr__, __dir__ = lazy_module_attributes(__name__, submodules=__all__)
+
 __author__ = """Nasim Rahaman"""
 __email__ = 'nasim.rahaman@iwr.uni-heidelberg.de'
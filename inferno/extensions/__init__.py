@@ -1,12 +1,14 @@
-from . import containers
-from . import criteria
-from . import initializers
-from . import layers
-from . import metrics
-from . import optimizers
-from . import models
-# Backward support
-from . import models as model
+from ..utils.python_utils import lazy_module_attributes
 
 __all__ = ['containers', 'criteria', 'initializers', 'layers', 'metrics', 'optimizers',
-           'models', 'model']
\ No newline at end of file
+           'models', 'model']
+
+_getattr, __dir__ = lazy_module_attributes(__name__, submodules=__all__[:-1])
+
+
+def __getattr__(name):
+    # Backward support
+    if name == 'model':
+        globals()['model'] = _getattr('models')
+        return globals()['model']
+    return _getattr(name)
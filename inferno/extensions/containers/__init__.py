@@ -1,2 +1,3 @@
 from .graph import *
 from .sequential import *
+from .pipeline import *
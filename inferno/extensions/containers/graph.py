@@ -1,9 +1,8 @@
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
 import sys
 import threading
 import multiprocessing as mp
 import copy
-import gc
 
 import networkx as nx
 from networkx import is_directed_acyclic_graph, topological_sort
@@ -17,26 +16,35 @@ from ..layers.identity import Identity
 __all__ = ['NNGraph', 'Graph']
 
 
+# A compiled forward pass through the graph. Tensors are routed through a flat list of slots:
+# the first `num_inputs` slots hold the inputs to the graph, and every edge that is used gets
+# a slot of its own. Each step is a tuple (node name, input slots, output slots), where an
+# output slot is None if the corresponding edge leads to a node that is never evaluated.
+ExecutionPlan = namedtuple('ExecutionPlan', ['steps', 'num_slots', 'num_inputs', 'output_slots'])
+
+
 class NNGraph(nx.DiGraph):
     """A NetworkX DiGraph, except that node and edge ordering matters."""
     # We don't copy torch tensors, only to have them deleted.
     ATTRIBUTES_TO_NOT_COPY = {'payload'}
     node_dict_factory = OrderedDict
     adjlist_dict_factory = OrderedDict
+    adjlist_outer_dict_factory = OrderedDict
+    adjlist_inner_dict_factory = OrderedDict
 
     def copy(self, **init_kwargs):
         new = type(self)(**init_kwargs)
         # Remove all attributes and copy only the graph structure
-        for source, target in self.edges_iter():
+        for source, target in self.edges():
             # Add new nodes
             new.add_node(source)
             new.add_node(target)
             # Copy attributes
-            new.node[source].update(copy.deepcopy({key: value
-                                                   for key, value in self.node[source].items()
+            new.nodes[source].update(copy.deepcopy({key: value
+                                                   for key, value in self.nodes[source].items()
                                                    if key not in self.ATTRIBUTES_TO_NOT_COPY}))
-            new.node[target].update(copy.deepcopy({key: value
-                                                   for key, value in self.node[target].items()
+            new.nodes[target].update(copy.deepcopy({key: value
+                                                   for key, value in self.nodes[target].items()
                                                    if key not in self.ATTRIBUTES_TO_NOT_COPY}))
             # Add new edge
             new.add_edge(copy.deepcopy(source), copy.deepcopy(target))
@@ -89,6 +97,7 @@ class Graph(nn.Module):
         """
         super(Graph, self).__init__()
         # Privates
+        self._execution_plan = None
         self._thread_to_graph_mapping = {}
         self._creator_thread = threading.get_ident()
         self._creator_pid = mp.current_process().pid
@@ -116,6 +125,7 @@ class Graph(nn.Module):
     def graph(self, value):
         assert_(isinstance(value, NNGraph), exception_type=TypeError)
         self._thread_to_graph_mapping.update({threading.get_ident(): value})
+        self.invalidate_execution_plan()
 
     def is_node_in_graph(self, name):
         """
@@ -130,7 +140,7 @@ class Graph(nn.Module):
         -------
         bool
         """
-        return name in self.graph.node
+        return name in self.graph.nodes
 
     def is_source_node(self, name):
         """
@@ -187,7 +197,7 @@ class Graph(nn.Module):
         list
             A list of names (str) of the output nodes.
         """
-        return [name for name, node_attributes in self.graph.node.items()
+        return [name for name, node_attributes in self.graph.nodes.items()
                 if node_attributes.get('is_output_node', False)]
 
     @property
@@ -201,7 +211,7 @@ class Graph(nn.Module):
         list
             A list of names (str) of the input nodes.
         """
-        return [name for name, node_attributes in self.graph.node.items()
+        return [name for name, node_attributes in self.graph.nodes.items()
                 if node_attributes.get('is_input_node', False)]
 
     @property
@@ -253,6 +263,7 @@ class Graph(nn.Module):
         assert isinstance(module, nn.Module)
         self.add_module(name, module)
         self.graph.add_node(name)
+        self.invalidate_execution_plan()
         if previous is not None:
             for _previous in pyu.to_iterable(previous):
                 self.add_edge(_previous, name)
@@ -275,6 +286,7 @@ class Graph(nn.Module):
         """
         self.add_module(name, Identity())
         self.graph.add_node(name, is_input_node=True)
+        self.invalidate_execution_plan()
         return self
 
     def add_output_node(self, name, previous=None):
@@ -293,6 +305,7 @@ class Graph(nn.Module):
             self
         """
         self.graph.add_node(name, is_output_node=True)
+        self.invalidate_execution_plan()
         if previous is not None:
             for _previous in pyu.to_iterable(previous):
                 self.add_edge(_previous, name)
@@ -323,6 +336,7 @@ class Graph(nn.Module):
         assert self.is_node_in_graph(from_node)
         assert self.is_node_in_graph(to_node)
         self.graph.add_edge(from_node, to_node)
+        self.invalidate_execution_plan()
         assert self.graph_is_valid
         return self
 
@@ -436,41 +450,100 @@ class Graph(nn.Module):
                                                                               name)
             for (this, outgoing), output in zip(outgoing_edges, outputs):
                 self.graph[this][outgoing].update({'payload': output})
-        # Collect garbage to free some GPU memory?
-        del input
-        gc.collect()
         # Return outputs
         return pyu.from_iterable(outputs)
 
-    def forward(self, *inputs):
+    def invalidate_execution_plan(self):
+        """Discards the compiled execution plan. It's rebuilt at the next forward pass."""
+        self._execution_plan = None
+        return self
+
+    def build_execution_plan(self):
+        """
+        Compiles the graph to an `ExecutionPlan`, which is what the forward pass runs.
+        This is done automatically (and only once, unless the graph is modified).
+
+        Returns
+        -------
+        ExecutionPlan
+        """
         self.assert_graph_is_valid()
+        graph = self.graph
         input_nodes = self.input_nodes
         output_nodes = self.output_nodes
-        assert len(inputs) == len(input_nodes), "Was expecting {} " \
-                                                "arguments for as many input nodes, got {}."\
-            .format(len(input_nodes), len(inputs))
-        # Unpack inputs to input nodes
-        for input, input_node in zip(inputs, input_nodes):
-            self.forward_through_node(input_node, input=input)
-        # Toposort the graph
-        toposorted = topological_sort(self.graph)
-        # Remove all input and output nodes
-        toposorted = [name for name in toposorted
-                      if name not in input_nodes and name not in output_nodes]
-        # Since we'll be clearing payloads anyway, it makes no sense whatsoever
-        # to evaluate sink nodes
-        toposorted = [name for name in toposorted if not self.is_sink_node(name)]
-        # Forward
-        for node in toposorted:
-            self.forward_through_node(node)
+        # The graph inputs occupy the first slots
+        num_slots = len(input_nodes)
+        edge_slots = {}
+        # Edges to output nodes are always read, but the sink nodes that are not output nodes
+        # are never evaluated, so there's no point in keeping their inputs around
+        for source, target in graph.edges():
+            if target in output_nodes or not self.is_sink_node(target):
+                edge_slots[(source, target)] = num_slots
+                num_slots += 1
+        steps = []
+        for input_num, name in enumerate(input_nodes):
+            steps.append((name, (input_num,),
+                          tuple(edge_slots.get(edge) for edge in graph.out_edges(name))))
+        for name in topological_sort(graph):
+            if name in input_nodes or name in output_nodes or self.is_sink_node(name):
+                continue
+            steps.append((name,
+                          tuple(edge_slots[edge] for edge in graph.in_edges(name)),
+                          tuple(edge_slots.get(edge) for edge in graph.out_edges(name))))
+        output_slots = [tuple(edge_slots[edge] for edge in graph.in_edges(name))
+                        for name in output_nodes]
+        return ExecutionPlan(steps=steps, num_slots=num_slots, num_inputs=len(input_nodes),
+                             output_slots=output_slots)
+
+    @property
+    def execution_plan(self):
+        # Graphs unpickled from old versions might not have '_execution_plan'
+        if getattr(self, '_execution_plan', None) is None:
+            self._execution_plan = self.build_execution_plan()
+        return self._execution_plan
+
+    def _input_spec_string(self, name, input):
+        return "\n".join(["--[{}]-{}-->[{}]".format(incoming, tuple(_input.size()), this)
+                          for (incoming, this), _input in zip(self.graph.in_edges(name), input)
+                          if hasattr(_input, 'size')])
+
+    def forward(self, *inputs):
+        plan = self.execution_plan
+        assert len(inputs) == plan.num_inputs, "Was expecting {} " \
+                                               "arguments for as many input nodes, got {}."\
+            .format(plan.num_inputs, len(inputs))
+        slots = [None] * plan.num_slots
+        slots[:plan.num_inputs] = inputs
+        # Modules are looked up by name, because replicas (e.g. for data-parallelism) share
+        # the execution plan but not the modules
+        modules = self._modules
+        for name, input_slots, output_slots in plan.steps:
+            input = [slots[slot] for slot in input_slots]
+            # Release the inputs as soon as they're consumed (every slot is read exactly once)
+            for slot in input_slots:
+                slots[slot] = None
+            try:
+                outputs = pyu.to_iterable(modules[name](*input))
+            except Exception as e:
+                message = "In node '{}': {}\n" \
+                          "Inputs to this node were:\n{}"\
+                    .format(name, str(e), self._input_spec_string(name, input))
+                raise type(e)(message).with_traceback(sys.exc_info()[2])
+            del input
+            if len(outputs) == 1:
+                # Support for replication
+                outputs = outputs * len(output_slots)
+            # Make sure the number of outputs check out
+            assert len(outputs) == len(output_slots), \
+                "Number of outputs from the model ({}) does not match the number " \
+                "of out-edges ({}) in the graph for this node ('{}').".format(len(outputs),
+                                                                              len(output_slots),
+                                                                              name)
+            for slot, output in zip(output_slots, outputs):
+                if slot is not None:
+                    slots[slot] = output
         # Read outputs from output nodes
-        outputs = []
-        for output_node in output_nodes:
-            # Get all incoming edges to output node
-            outputs_from_node = [self.graph[incoming][this]['payload']
-                                 for incoming, this in self.graph.in_edges(output_node)]
-            outputs.append(pyu.from_iterable(outputs_from_node))
-        # Clear payloads for next pass
-        self.clear_payloads()
+        outputs = [pyu.from_iterable([slots[slot] for slot in output_slots])
+                   for output_slots in plan.output_slots]
         # Done.
         return pyu.from_iterable(outputs)
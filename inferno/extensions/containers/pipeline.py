@@ -0,0 +1,205 @@
+import queue
+import threading
+
+import torch
+import torch.nn as nn
+
+from ...utils import python_utils as pyu
+from ...utils.exceptions import assert_
+from ..layers.device import OnDevice
+
+__all__ = ['PipelineParallel']
+
+
+class _StageFailure(object):
+    def __init__(self, exception):
+        self.exception = exception
+
+
+_DONE = object()
+
+
+class PipelineParallel(nn.Module):
+    """
+    Pipeline parallel (GPipe-style) container for models split into stages on different
+    devices, e.g. with `inferno.extensions.layers.device.OnDevice`.
+
+    The batch is split into micro-batches, which are streamed through the stages such that
+    stage `s` works on micro-batch `m` while stage `s + 1` works on micro-batch `m - 1`.
+    If all stages are on GPUs, every stage gets its own CUDA stream and the stages are
+    synchronized with events, i.e. the host only enqueues the work. Otherwise, every stage
+    runs in its own thread.
+
+    Note that layers which compute statistics over the batch (e.g. batch normalization) only
+    see one micro-batch at a time.
+    """
+    def __init__(self, *stages, num_micro_batches=4, batch_dim=0):
+        """
+        Parameters
+        ----------
+        stages : torch.nn.Module
+            The stages, in order. Inputs are transferred to the device of a stage (that of
+            `OnDevice` stages, or otherwise that of the stage's first parameter) before it's
+            applied.
+        num_micro_batches : int
+            Number of micro-batches to split the batch into.
+        batch_dim : int
+            The batch axis of the inputs and outputs.
+        """
+        super(PipelineParallel, self).__init__()
+        if len(stages) == 1 and isinstance(stages[0], (list, tuple)):
+            stages = stages[0]
+        assert_(len(stages) > 0, "Need at least one stage.", ValueError)
+        assert_(num_micro_batches >= 1,
+                "Number of micro-batches must be positive, got {}.".format(num_micro_batches),
+                ValueError)
+        self.stages = nn.ModuleList(stages)
+        self.num_micro_batches = num_micro_batches
+        self.batch_dim = batch_dim
+
+    @staticmethod
+    def get_stage_device(stage):
+        """Returns the device of a stage, or None if it doesn't have one."""
+        if isinstance(stage, OnDevice):
+            if stage.target_device == 'cpu':
+                return torch.device('cpu')
+            if stage.device_ordinal is None:
+                return torch.device('cuda', torch.cuda.current_device())
+            return torch.device('cuda', stage.device_ordinal)
+        parameter = next(stage.parameters(), None)
+        return None if parameter is None else parameter.device
+
+    @property
+    def devices(self):
+        return [self.get_stage_device(stage) for stage in self.stages]
+
+    def split(self, inputs):
+        """Splits the inputs to micro-batches (tuples of inputs)."""
+        chunks = [torch.chunk(input_, self.num_micro_batches, dim=self.batch_dim)
+                  if torch.is_tensor(input_) else None for input_ in inputs]
+        num_chunks = {len(chunk) for chunk in chunks if chunk is not None}
+        assert_(len(num_chunks) == 1,
+                "All tensor inputs must have the same batch size.",
+                ValueError)
+        num_chunks, = num_chunks
+        # Inputs that aren't tensors go to all micro-batches
+        return [tuple(input_ if chunk is None else chunk[num]
+                      for input_, chunk in zip(inputs, chunks))
+                for num in range(num_chunks)]
+
+    def merge(self, micro_batch_outputs):
+        """Concatenates the outputs of the micro-batches."""
+        return tuple(torch.cat(outputs, dim=self.batch_dim)
+                     for outputs in zip(*micro_batch_outputs))
+
+    @staticmethod
+    def _transfer(inputs, device):
+        if device is None:
+            return inputs
+        return tuple(input_.to(device, non_blocking=True) if torch.is_tensor(input_) else input_
+                     for input_ in inputs)
+
+    def _apply_stage(self, stage_num, inputs, device):
+        return tuple(pyu.to_iterable(self.stages[stage_num](*self._transfer(inputs, device))))
+
+    def _forward_streamed(self, micro_batches, devices):
+        num_stages, num_micro_batches = len(self.stages), len(micro_batches)
+        streams = [torch.cuda.Stream(device=device) for device in devices]
+        # The inputs are produced on the current streams of their devices
+        ready = []
+        for micro_batch in micro_batches:
+            input_devices = {input_.device for input_ in micro_batch
+                             if torch.is_tensor(input_) and input_.is_cuda}
+            events = []
+            for device in input_devices:
+                event = torch.cuda.Event()
+                event.record(torch.cuda.current_stream(device))
+                events.append(event)
+            ready.append(events)
+        # On clock tick `clock`, stage `stage_num` processes micro-batch `clock - stage_num`.
+        # Only the host iterates in this order; the devices work through their streams in
+        # parallel.
+        for clock in range(num_micro_batches + num_stages - 1):
+            for stage_num in range(max(0, clock - num_micro_batches + 1),
+                                   min(num_stages, clock + 1)):
+                micro_batch_num = clock - stage_num
+                stream, device = streams[stage_num], devices[stage_num]
+                inputs = micro_batches[micro_batch_num]
+                with torch.cuda.device(device), torch.cuda.stream(stream):
+                    for event in ready[micro_batch_num]:
+                        stream.wait_event(event)
+                    for input_ in inputs:
+                        if torch.is_tensor(input_) and input_.is_cuda:
+                            # The caching allocator must not reuse the memory before this
+                            # stream is done with it
+                            input_.record_stream(stream)
+                    outputs = self._apply_stage(stage_num, inputs, device)
+                    event = torch.cuda.Event()
+                    event.record(stream)
+                micro_batches[micro_batch_num] = outputs
+                ready[micro_batch_num] = [event]
+        # Hand the outputs over to the current stream of the last device
+        current_stream = torch.cuda.current_stream(devices[-1])
+        for outputs, events in zip(micro_batches, ready):
+            for event in events:
+                current_stream.wait_event(event)
+            for output in outputs:
+                if torch.is_tensor(output) and output.is_cuda:
+                    output.record_stream(current_stream)
+        return micro_batches
+
+    def _forward_threaded(self, micro_batches, devices):
+        num_stages = len(self.stages)
+        # The queue `queues[stage_num]` feeds the stage `stage_num`, the last one collects
+        queues = [queue.Queue() for _ in range(num_stages + 1)]
+        # Grad mode is thread local
+        grad_enabled = torch.is_grad_enabled()
+
+        def run_stage(stage_num):
+            with torch.set_grad_enabled(grad_enabled):
+                while True:
+                    item = queues[stage_num].get()
+                    if item is _DONE or isinstance(item, _StageFailure):
+                        queues[stage_num + 1].put(item)
+                        return
+                    try:
+                        outputs = self._apply_stage(stage_num, item, devices[stage_num])
+                    except Exception as exception:
+                        queues[stage_num + 1].put(_StageFailure(exception))
+                        return
+                    queues[stage_num + 1].put(outputs)
+
+        threads = [threading.Thread(target=run_stage, args=(stage_num,),
+                                    name='PipelineStage{}'.format(stage_num), daemon=True)
+                   for stage_num in range(num_stages)]
+        for thread in threads:
+            thread.start()
+        for micro_batch in micro_batches:
+            queues[0].put(micro_batch)
+        queues[0].put(_DONE)
+        outputs = []
+        while True:
+            item = queues[-1].get()
+            if item is _DONE or isinstance(item, _StageFailure):
+                break
+            outputs.append(item)
+        for thread in threads:
+            thread.join()
+        if isinstance(item, _StageFailure):
+            raise item.exception
+        return outputs
+
+    def forward(self, *inputs):
+        devices = self.devices
+        micro_batches = self.split(inputs)
+        if len(micro_batches) == 1 or len(self.stages) == 1:
+            # Nothing to pipeline
+            outputs = micro_batches[0]
+            for stage_num in range(len(self.stages)):
+                outputs = self._apply_stage(stage_num, outputs, devices[stage_num])
+            return pyu.from_iterable(outputs)
+        if all(device is not None and device.type == 'cuda' for device in devices):
+            outputs = self._forward_streamed(micro_batches, devices)
+        else:
+            outputs = self._forward_threaded(micro_batches, devices)
+        return pyu.from_iterable(self.merge(outputs))
@@ -1,14 +1,96 @@
+import torch
 import torch.nn as nn
-from ...utils.torch_utils import flatten_samples
 
 __all__ = ['SorensenDiceLoss', 'GeneralizedDiceLoss']
 
 
+def _batched_dot(a, b):
+    # (N, G, S) x (N, G, S) --> (N, G), without materializing the product a * b
+    num_batches, num_groups, num_samples = a.shape
+    return torch.bmm(a.reshape(-1, 1, num_samples),
+                     b.reshape(-1, num_samples, 1)).view(num_batches, num_groups)
+
+
+class _ProductSums(torch.autograd.Function):
+    """
+    Computes the sums of `input * target` (and, if `squares` is True, of `input * input`
+    and `target * target`) over the last axis of tensors of the shape (N, G, S).
+    Neither the products are materialized in the forward pass, nor are they saved for
+    the backward pass, where the gradients are computed analytically.
+    """
+    @staticmethod
+    def forward(ctx, input, target, squares):
+        ctx.save_for_backward(input, target)
+        ctx.squares = squares
+        sums = [_batched_dot(input, target)]
+        if squares:
+            sums.extend([_batched_dot(input, input), _batched_dot(target, target)])
+        return tuple(sums)
+
+    @staticmethod
+    def backward(ctx, *grad_sums):
+        input, target = ctx.saved_tensors
+        grad_sums = [grad_sum.unsqueeze(-1) for grad_sum in grad_sums]
+        grad_input = grad_target = None
+        if ctx.needs_input_grad[0]:
+            grad_input = target * grad_sums[0]
+            if ctx.squares:
+                grad_input.addcmul_(input, grad_sums[1], value=2.)
+        if ctx.needs_input_grad[1]:
+            grad_target = input * grad_sums[0]
+            if ctx.squares:
+                grad_target.addcmul_(target, grad_sums[2], value=2.)
+        return grad_input, grad_target, None
+
+
+def _product_sums(input, target, num_groups, squares=True):
+    # Reduce the tensors to (num_groups,) by summing over the batch axis and
+    # all axes following the first `num_groups` elements.
+    # The reshapes do not copy for contiguous tensors.
+    batch_size = input.size(0)
+    input = input.reshape(batch_size, num_groups, -1)
+    target = target.reshape(batch_size, num_groups, -1)
+    return [product_sum.sum(0) for product_sum in _ProductSums.apply(input, target, squares)]
+
+
+def _label_sums(input, labels, class_dim=1):
+    # Sums of `input * one_hot(labels)` and of `one_hot(labels)` over the batch and the
+    # spatial axes, where the one-hot axis of `input` is `class_dim`. The one-hot labels
+    # are not materialized, and labels outside of [0, num_classes) count as all-zero
+    # vectors. Returns tensors of the shape `input.shape[1:class_dim + 1]`.
+    num_classes = input.size(class_dim)
+    labels = labels.long().unsqueeze(class_dim)
+    valid = (labels >= 0) & (labels < num_classes)
+    labels = labels.masked_fill(~valid, 0)
+    selected = input.gather(class_dim, labels) * valid
+    if class_dim == 1:
+        index = labels
+    else:
+        # Classes of different channels go to different groups
+        channels = torch.arange(input.size(1), device=labels.device)
+        index = channels.view(1, -1, *([1] * (labels.dim() - 2))) * num_classes + labels
+    group_shape = input.shape[1:class_dim + 1]
+    num_groups = group_shape.numel()
+    index = index.expand_as(selected).reshape(-1)
+    selected = selected.reshape(-1)
+    sums = selected.new_zeros(num_groups).index_add(0, index, selected)
+    counts = selected.new_zeros(num_groups).index_add_(
+        0, index, valid.reshape(-1).to(selected.dtype))
+    return sums.view(group_shape), counts.view(group_shape)
+
+
+def _is_label_target(input, target):
+    return target.dim() == input.dim() - 1 and not target.is_floating_point()
+
+
 class SorensenDiceLoss(nn.Module):
     """
     Computes a loss scalar, which when minimized maximizes the Sorensen-Dice similarity
     between the input and the target. For both inputs and targets it must be the case that
     `input_or_target.size(1) = num_channels`.
+
+    Alternatively, the target can be a tensor of integer labels without the channel axis, which
+    are then used as if they were one-hot encoded (without ever expanding them).
     """
     def __init__(self, weight=None, channelwise=True, eps=1e-6):
         """
@@ -32,26 +114,22 @@ class SorensenDiceLoss(nn.Module):
 
         Expected shape of the inputs: (batch_size, nb_channels, ...)
         """
+        if _is_label_target(input, target):
+            return self._forward_with_labels(input, target)
         assert input.size() == target.size()
         if not self.channelwise:
-            numerator = (input * target).sum()
-            denominator = (input * input).sum() + (target * target).sum()
-            loss = -2. * (numerator / denominator.clamp(min=self.eps))
+            numerator, input_squared, target_squared = \
+                _product_sums(input, target, num_groups=1)
+            denominator = input_squared + target_squared
+            loss = -2. * (numerator / denominator.clamp(min=self.eps)).sum()
         else:
-            # TODO This should be compatible with Pytorch 0.2, but check
-            # Flatten input and target to have the shape (C, N),
-            # where N is the number of samples
-            input = flatten_samples(input)
-            target = flatten_samples(target)
-            # Compute numerator and denominator (by summing over samples and
-            # leaving the channels intact)
-            numerator = (input * target).sum(-1)
-            denominator = (input * input).sum(-1) + (target * target).sum(-1)
+            # Compute numerator and denominator (by summing over the batch and the
+            # spatial axes and leaving the channels intact)
+            numerator, input_squared, target_squared = \
+                _product_sums(input, target, num_groups=input.size(1))
+            denominator = input_squared + target_squared
             channelwise_loss = -2 * (numerator / denominator.clamp(min=self.eps))
             if self.weight is not None:
-                # With pytorch < 0.2, channelwise_loss.size = (C, 1).
-                if channelwise_loss.dim() == 2:
-                    channelwise_loss = channelwise_loss.squeeze(1)
                 assert self.weight.size() == channelwise_loss.size()
                 # Apply weight
                 channelwise_loss = self.weight * channelwise_loss
@@ -59,13 +137,28 @@ class SorensenDiceLoss(nn.Module):
             loss = channelwise_loss.sum()
         return loss
 
+    def _forward_with_labels(self, input, labels):
+        numerator, target_squared = _label_sums(input, labels)
+        input_squared, = _product_sums(input, input, num_groups=input.size(1), squares=False)
+        if not self.channelwise:
+            numerator, input_squared, target_squared = \
+                numerator.sum(), input_squared.sum(), target_squared.sum()
+            denominator = input_squared + target_squared
+            return -2. * (numerator / denominator.clamp(min=self.eps))
+        channelwise_loss = -2 * (numerator / (input_squared + target_squared).clamp(min=self.eps))
+        if self.weight is not None:
+            assert self.weight.size() == channelwise_loss.size()
+            channelwise_loss = self.weight * channelwise_loss
+        return channelwise_loss.sum()
+
 
 class GeneralizedDiceLoss(nn.Module):
     """
     Computes the scalar Generalized Dice Loss defined in https://arxiv.org/abs/1707.03237
 
     This version works for multiple classes and expects predictions for every class (e.g. softmax output) and
-    one-hot targets for every class.
+    one-hot targets for every class, or integer labels (i.e. the target without the class axis),
+    which are then used without expanding them.
     """
     def __init__(self, weight=None, channelwise=False, eps=1e-6):
         super(GeneralizedDiceLoss, self).__init__()
@@ -82,52 +175,51 @@ class GeneralizedDiceLoss(nn.Module):
             - if not channelwise: (batch_size, nb_classes, ...)
             - if channelwise:     (batch_size, nb_channels, nb_classes, ...)
         """
-        assert input.size() == target.size()
+        is_label_target = _is_label_target(input, target)
+        assert is_label_target or input.size() == target.size()
         if not self.channelwise:
-            # Flatten input and target to have the shape (nb_classes, N),
-            # where N is the number of samples
-            input = flatten_samples(input)
-            target = flatten_samples(target)
+            num_classes = input.size(1)
+            sum_axes = [0] + list(range(2, input.dim()))
+            sum_inputs = input.sum(sum_axes)
+            # Sum over the batch and the spatial axes, to get the shape (nb_classes,)
+            if is_label_target:
+                numer, sum_targets = _label_sums(input, target)
+            else:
+                numer, = _product_sums(input, target, num_groups=num_classes, squares=False)
+                sum_targets = target.sum(sum_axes)
 
             # Find classes weights:
-            sum_targets = target.sum(-1)
             class_weigths = 1. / (sum_targets * sum_targets).clamp(min=self.eps)
 
             # Compute generalized Dice loss:
-            numer = ((input * target).sum(-1) * class_weigths).sum()
-            denom = ((input + target).sum(-1) * class_weigths).sum()
+            numer = (numer * class_weigths).sum()
+            denom = ((sum_inputs + sum_targets) * class_weigths).sum()
 
             loss = 1. - 2. * numer / denom.clamp(min=self.eps)
         else:
-            def flatten_and_preserve_channels(tensor):
-                tensor_dim = tensor.dim()
-                assert tensor_dim >= 3
-                num_channels = tensor.size(1)
-                num_classes = tensor.size(2)
-                # Permute the channel axis to first
-                permute_axes = list(range(tensor_dim))
-                permute_axes[0], permute_axes[1], permute_axes[2] = permute_axes[1], permute_axes[2], permute_axes[0]
-                permuted = tensor.permute(*permute_axes).contiguous()
-                flattened = permuted.view(num_channels, num_classes, -1)
-                return flattened
-
-            # Flatten input and target to have the shape (nb_channels, nb_classes, N)
-            input = flatten_and_preserve_channels(input)
-            target = flatten_and_preserve_channels(target)
+            assert input.dim() >= 3
+            num_channels, num_classes = input.size(1), input.size(2)
+            sum_axes = [0] + list(range(3, input.dim()))
+            sum_inputs = input.sum(sum_axes)
+            # Sum over the batch and the spatial axes, to get the shape (nb_channels, nb_classes)
+            if is_label_target:
+                numer, sum_targets = _label_sums(input, target, class_dim=2)
+            else:
+                numer, = _product_sums(input, target, num_groups=num_channels * num_classes,
+                                       squares=False)
+                numer = numer.view(num_channels, num_classes)
+                sum_targets = target.sum(sum_axes)
 
             # Find classes weights:
-            sum_targets = target.sum(-1)
             class_weigths = 1. / (sum_targets * sum_targets).clamp(min=self.eps)
 
             # Compute generalized Dice loss:
-            numer = ((input * target).sum(-1) * class_weigths).sum(-1)
-            denom = ((input + target).sum(-1) * class_weigths).sum(-1)
+            numer = (numer * class_weigths).sum(-1)
+            denom = ((sum_inputs + sum_targets) * class_weigths).sum(-1)
 
             channelwise_loss = 1. - 2. * numer / denom.clamp(min=self.eps)
 
             if self.weight is not None:
-                if channelwise_loss.dim() == 2:
-                    channelwise_loss = channelwise_loss.squeeze(1)
                 assert self.weight.size() == channelwise_loss.size(),\
                     """`weight` should have shape (nb_channels, ),
                        `target` should have shape (batch_size, nb_channels, nb_classes, ...)"""
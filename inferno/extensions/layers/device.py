@@ -30,11 +30,12 @@ class DeviceTransfer(nn.Module):
                     DeviceError)
         self.target_device = target_device
         self.device_ordinal = device_ordinal
+        self.asynchronous = asynchronous
 
     def forward(self, *inputs):
         if self.target_device == 'cuda':
             transferred = tuple(input_.cuda(device=self.device_ordinal,
-                                            non_blocking=self.asynchronous)
+                                            non_blocking=getattr(self, 'asynchronous', False))
                                 for input_ in inputs)
         elif self.target_device == 'cpu':
             transferred = tuple(input_.cpu() for input_ in inputs)
@@ -83,7 +84,7 @@ class OnDevice(nn.Module):
 
     def transfer_module(self, module):
         if self.target_device == 'cuda':
-            return module.cuda(device_id=self.device_ordinal)
+            return module.cuda(device=self.device_ordinal)
         elif self.target_device == 'cpu':
             return module.cpu()
         else:
@@ -1,6 +1,5 @@
 from .base import Metric
 import numpy as np
-import scipy.sparse as sparse
 import logging
 
 
@@ -128,6 +127,8 @@ def adapted_rand(seg, gt):
     n_labels_A = int(np.amax(segA)) + 1
     n_labels_B = int(np.amax(segB)) + 1
 
+    # scipy is only imported when needed
+    import scipy.sparse as sparse
     ones_data = np.ones(n)
     p_ij = sparse.csr_matrix((ones_data, (segA.ravel(), segB.ravel())),
                              shape=(n_labels_A, n_labels_B),
@@ -1,5 +1,10 @@
+import contextlib
+import itertools
+import numpy as np
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
+from torch.utils.checkpoint import checkpoint
 from ..layers.identity import Identity
 from ..layers.convolutional import ConvELU2D, ConvELU3D, Conv2D, Conv3D
 from ..layers.sampling import Upsample as InfernoUpsample
@@ -10,6 +15,24 @@ __all__ = ['UNetBase', 'UNet', 'ResBlockUNet']
 _all = __all__
 
 
+@contextlib.contextmanager
+def _frozen_running_stats(module):
+    # batchnorms keep their running statistics (which were already updated in the forward
+    # pass) when recomputed: with a momentum of zero, the update leaves them unchanged
+    batchnorms = [m for m in module.modules() if isinstance(m, nn.modules.batchnorm._BatchNorm)
+                  and m.training and m.track_running_stats]
+    states = [(batchnorm.momentum, batchnorm.num_batches_tracked.clone())
+              for batchnorm in batchnorms]
+    for batchnorm in batchnorms:
+        batchnorm.momentum = 0.
+    try:
+        yield
+    finally:
+        for batchnorm, (momentum, num_batches_tracked) in zip(batchnorms, states):
+            batchnorm.momentum = momentum
+            batchnorm.num_batches_tracked.copy_(num_batches_tracked)
+
+
 class UNetBase(nn.Module):
 
     """ Base class for implementing UNets.
@@ -33,10 +56,22 @@ class UNetBase(nn.Module):
         residual (bool): If residual is true, the output of the down-streams
             are added to the up-stream results.
             Otherwise the results are concatenated (default: False).
+        memory_efficient (bool): If true, the convolutional blocks of all levels
+            are recomputed in the backward pass instead of storing their intermediate
+            activations (unless `checkpoint_levels` is given). Batchnorms update their
+            running statistics only once per forward pass, i.e. not when recomputed,
+            so the results in eval mode are the same as without recomputation.
+            This has no effect without autograd (e.g. under `torch.no_grad()`)
+            (default: False).
+        checkpoint_levels (list): Levels whose convolutional blocks are recomputed
+            in the backward pass. Level 0 is the level with the highest resolution,
+            level `depth` is the bottom block (default: None, i.e. all levels if
+            `memory_efficient` is true, and none otherwise).
     """
 
     def __init__(self, in_channels, dim, out_channels=None, depth=3,
-                 gain=2, residual=False, upsample_mode=None, p_dropout=None):
+                 gain=2, residual=False, upsample_mode=None, p_dropout=None,
+                 memory_efficient=False, checkpoint_levels=None):
 
         super(UNetBase, self).__init__()
 
@@ -53,6 +88,13 @@ class UNetBase(nn.Module):
         self.gain         = int(gain)
         self.residual     = bool(residual)
         self.p_dropout = p_dropout
+        self.memory_efficient = bool(memory_efficient)
+        if checkpoint_levels is None:
+            checkpoint_levels = range(self.depth + 1) if self.memory_efficient else []
+        self.checkpoint_levels = set(int(level) for level in checkpoint_levels)
+        if not all(0 <= level <= self.depth for level in self.checkpoint_levels):
+            raise RuntimeError("checkpoint_levels must be between 0 and depth (%d), got %s"%
+                (self.depth, str(sorted(self.checkpoint_levels))))
 
         # members to remember what to store as side output
         self._store_conv_down = []
@@ -239,6 +281,128 @@ class UNetBase(nn.Module):
             raise RuntimeError("cannot downsample %d times, with shape %s"%
                 (self.depth, str(input.size())) )
 
+    def _get_tile_shape(self, tile_shape, halo):
+        # grow the tiles (including the halo) to the next shape that can be
+        # downsampled `depth` times
+        multiple = 2 ** self.depth
+        full_shape = [int(np.ceil((size + 2 * h) / multiple)) * multiple
+                      for size, h in zip(tile_shape, halo)]
+        self._check_scaling(torch.empty([1, 1] + full_shape, device='meta'))
+        return [size - 2 * h for size, h in zip(full_shape, halo)]
+
+    @staticmethod
+    def _read_tile(input, sample, slices):
+        # works for torch tensors, numpy arrays (incl. memmaps) and h5py datasets
+        tile = input[(sample, slice(None)) + tuple(slices)]
+        if not torch.is_tensor(tile):
+            tile = torch.from_numpy(np.ascontiguousarray(tile))
+        return tile
+
+    def predict_tiled(self, input, tile_shape, halo=0, batch_size=1, out=None, device=None):
+        """Predict an input that is too large to be processed at once.
+
+        The input is split into tiles, which are extended by a halo on each
+        side and grown such that they can be downsampled `depth` times.
+        The tiles are predicted in batches, the halos are cropped
+        and the results are stitched together. At the borders of the input,
+        the halo is filled by replicating the border values.
+        If the network uses valid convolutions (i.e. its output is smaller
+        than its input), the output is assumed to be centered in the input
+        and the halo must be at least as large as the border that is lost.
+
+        Note that this does not change the train / eval mode of the model.
+
+        Args:
+            input (tensor or array): input of shape (N, C, *spatial). Besides torch
+                tensors, this can be a numpy array (or memmap) or a h5py dataset,
+                from which the tiles are read one by one.
+            tile_shape (int or listlike): spatial shape of the tiles without halo.
+            halo (int or listlike): size of the halo on each side (default: 0).
+            batch_size (int): number of tiles predicted at once (default: 1).
+            out (tensor or array): optional output to write the result to.
+                Like the input, this can be a numpy array (or memmap) or a h5py dataset.
+            device (torch.device): device for the prediction (default: the
+                device of the model parameters).
+
+        Returns:
+            tensor or array: the prediction, i.e. `out` if it is given and
+                a tensor (on the cpu) otherwise.
+        """
+        spatial_shape = list(input.shape[2:])
+        if len(spatial_shape) != self.dim:
+            raise RuntimeError("wrong number of dim: expected %d, got %d"%
+                (self.dim+2, len(input.shape)))
+        tile_shape = [tile_shape] * self.dim if isinstance(tile_shape, int) else list(tile_shape)
+        halo = [halo] * self.dim if isinstance(halo, int) else list(halo)
+        tile_shape = self._get_tile_shape(tile_shape, halo)
+        if device is None:
+            parameter = next(self.parameters(), None)
+            device = parameter.device if parameter is not None else torch.device('cpu')
+
+        # (sample, core slices) for all tiles
+        tile_starts = list(itertools.product(*[range(0, size, step) for size, step
+                                               in zip(spatial_shape, tile_shape)]))
+        tiles = [(sample, [slice(start, min(start + step, size))
+                           for start, step, size in zip(starts, tile_shape, spatial_shape)])
+                 for sample in range(input.shape[0]) for starts in tile_starts]
+
+        def halo_slices(core):
+            # the tile with its halo, and the padding where it exceeds the input
+            slices = [slice(max(sl.start - h, 0), min(sl.start + step + h, size))
+                      for sl, step, h, size in zip(core, tile_shape, halo, spatial_shape)]
+            padding = []
+            for sl, read, step, h in reversed(list(zip(core, slices, tile_shape, halo))):
+                padding += [read.start - (sl.start - h), (sl.start + step + h) - read.stop]
+            return slices, padding
+
+        result = out
+        for batch_start in range(0, len(tiles), batch_size):
+            batch_tiles = tiles[batch_start:batch_start + batch_size]
+            batch = []
+            for sample, core in batch_tiles:
+                slices, padding = halo_slices(core)
+                tile = self._read_tile(input, sample, slices).to(device).unsqueeze(0)
+                if not tile.is_floating_point():
+                    tile = tile.float()
+                if any(padding):
+                    tile = F.pad(tile, padding, mode='replicate')
+                batch.append(tile)
+            batch = torch.cat(batch, 0)
+
+            with torch.no_grad():
+                prediction = self(batch)
+            if isinstance(prediction, tuple):
+                raise RuntimeError("predict_tiled does not support side outputs")
+
+            # offset of the (centered) output with respect to the input tiles
+            offset = [(in_size - out_size) // 2 for in_size, out_size
+                      in zip(batch.shape[2:], prediction.shape[2:])]
+            if any(o > h for o, h in zip(offset, halo)):
+                raise RuntimeError("halo %s is too small for the output shape %s of tile shape %s"%
+                    (str(halo), str(tuple(prediction.shape[2:])), str(tuple(batch.shape[2:]))))
+
+            if result is None:
+                result = torch.empty((input.shape[0], prediction.shape[1]) + tuple(spatial_shape),
+                                     dtype=prediction.dtype)
+            for prediction_tile, (sample, core) in zip(prediction, batch_tiles):
+                crop = tuple(slice(h - o, h - o + sl.stop - sl.start)
+                             for sl, h, o in zip(core, halo, offset))
+                prediction_tile = prediction_tile[(slice(None),) + crop].cpu()
+                index = (sample, slice(None)) + tuple(core)
+                if torch.is_tensor(result):
+                    result[index] = prediction_tile
+                else:
+                    result[index] = prediction_tile.numpy()
+        return result
+
+    def _apply_conv_op(self, op, input, level):
+        # recompute the conv block in the backward pass if requested
+        if level in self.checkpoint_levels and torch.is_grad_enabled():
+            return checkpoint(op, input, use_reentrant=False,
+                              context_fn=lambda: (contextlib.nullcontext(),
+                                                  _frozen_running_stats(op)))
+        return op(input)
+
     def forward(self, input):
 
         # check if input is suitable
@@ -257,7 +421,7 @@ class UNetBase(nn.Module):
         out = input
         for d in range(self.depth):
 
-            out = self._conv_down_ops[d](out)
+            out = self._apply_conv_op(self._conv_down_ops[d], out, level=d)
             #out = self.dropout
 
             down_res.append(out)
@@ -270,7 +434,7 @@ class UNetBase(nn.Module):
         #################################
         # bottom part
         #################################
-        out = self._conv_bottom_op(out)
+        out = self._apply_conv_op(self._conv_bottom_op, out, level=self.depth)
         if self._store_conv_bottom:
             side_out.append(out)
 
@@ -291,9 +455,10 @@ class UNetBase(nn.Module):
                 out = a + out
             else:
                 out = torch.cat([a, out], 1)
+            down_res[d] = None
 
             # the convolutional block
-            out = self._conv_up_ops[d](out)
+            out = self._apply_conv_op(self._conv_up_ops[d], out, level=self.depth - d - 1)
 
             if self._store_conv_up[d]:
                 side_out.append(out)
@@ -331,14 +496,17 @@ class UNet(UNetBase):
     """
     def __init__(self, in_channels, out_channels, dim,
                  depth=4, initial_features=64, gain=2,
-                 final_activation=None, p_dropout=None):
+                 final_activation=None, p_dropout=None,
+                 memory_efficient=False, checkpoint_levels=None):
         # convolutional types for inner convolutions and output convolutions
         self.default_conv = ConvELU2D if dim == 2 else ConvELU3D
         last_conv = Conv2D if dim == 2 else Conv3D
 
         # init the base class
         super(UNet, self).__init__(in_channels=initial_features, dim=dim,
-                                   depth=depth, gain=gain, p_dropout=p_dropout)
+                                   depth=depth, gain=gain, p_dropout=p_dropout,
+                                   memory_efficient=memory_efficient,
+                                   checkpoint_levels=checkpoint_levels)
         # initial conv layer to go from the number of input channels, which are defined by the data
         # (usually 1 or 3) to the initial number of feature maps
         self._initial_conv = self.default_conv(in_channels, initial_features, 3)
@@ -1,4 +1,5 @@
 import math
+import torch
 from torch.optim import Optimizer
 
 
@@ -15,8 +16,13 @@ class Adam(Optimizer):
             running averages of gradient and its square (default: (0.9, 0.999))
         eps (float, optional): term added to the denominator to improve
             numerical stability (default: 1e-8)
+        lambda_l1 (float, optional): L1 penalty (default: 0)
         weight_decay (float, optional): weight decay (L2 penalty) (default: 0)
 
+    The parameters are updated with multi-tensor (`torch._foreach_*`) operations, i.e. a
+    handful of kernel launches per device and dtype instead of several per parameter.
+    Unlike previous versions, the penalties are not added to `p.grad` in place.
+
     .. _Adam\: A Method for Stochastic Optimization:
         https://arxiv.org/abs/1412.6980
     """
@@ -28,6 +34,18 @@ class Adam(Optimizer):
                         **kwargs)
         super(Adam, self).__init__(params, defaults)
 
+    @staticmethod
+    def _group_by_device_and_dtype(*tensor_lists):
+        # The multi-tensor (foreach) kernels need tensors on the same device and of the
+        # same dtype
+        groups = {}
+        for index, tensor in enumerate(tensor_lists[0]):
+            groups.setdefault((tensor.device, tensor.dtype), []).append(index)
+        for indices in groups.values():
+            yield tuple([tensor_list[index] for index in indices]
+                        for tensor_list in tensor_lists)
+
+    @torch.no_grad()
     def step(self, closure=None):
         """Performs a single optimization step.
 
@@ -37,43 +55,59 @@ class Adam(Optimizer):
         """
         loss = None
         if closure is not None:
-            loss = closure()
+            with torch.enable_grad():
+                loss = closure()
 
         for group in self.param_groups:
+            params, grads, exp_avgs, exp_avg_sqs, step_sizes = [], [], [], [], []
+            beta1, beta2 = group['betas']
             for p in group['params']:
                 if p.grad is None:
                     continue
-                grad = p.grad.data
                 state = self.state[p]
 
                 # State initialization
                 if len(state) == 0:
                     state['step'] = 0
                     # Exponential moving average of gradient values
-                    state['exp_avg'] = grad.new().resize_as_(grad).zero_()
+                    state['exp_avg'] = torch.zeros_like(p, memory_format=torch.preserve_format)
                     # Exponential moving average of squared gradient values
-                    state['exp_avg_sq'] = grad.new().resize_as_(grad).zero_()
-
-                exp_avg, exp_avg_sq = state['exp_avg'], state['exp_avg_sq']
-                beta1, beta2 = group['betas']
+                    state['exp_avg_sq'] = torch.zeros_like(p,
+                                                           memory_format=torch.preserve_format)
 
                 state['step'] += 1
-
-                if group['lambda_l1'] != 0:
-                    grad.add_(group['lambda_l1'], p.data.sign())
-                if group['weight_decay'] != 0:
-                    grad.add_(group['weight_decay'], p.data)
-                
-                # Decay the first and second moment running average coefficient
-                exp_avg.mul_(beta1).add_(1 - beta1, grad)
-                exp_avg_sq.mul_(beta2).addcmul_(1 - beta2, grad, grad)
-
-                denom = exp_avg_sq.sqrt().add_(group['eps'])
-
                 bias_correction1 = 1 - beta1 ** state['step']
                 bias_correction2 = 1 - beta2 ** state['step']
-                step_size = group['lr'] * math.sqrt(bias_correction2) / bias_correction1
 
-                p.data.addcdiv_(-step_size, exp_avg, denom)
+                params.append(p)
+                grads.append(p.grad)
+                exp_avgs.append(state['exp_avg'])
+                exp_avg_sqs.append(state['exp_avg_sq'])
+                step_sizes.append(-group['lr'] * math.sqrt(bias_correction2) / bias_correction1)
+
+            for group_tensors in self._group_by_device_and_dtype(params, grads, exp_avgs,
+                                                                 exp_avg_sqs, step_sizes):
+                self._multi_tensor_step(*group_tensors, beta1=beta1, beta2=beta2,
+                                        eps=group['eps'], lambda_l1=group['lambda_l1'],
+                                        weight_decay=group['weight_decay'])
 
         return loss
+
+    @staticmethod
+    def _multi_tensor_step(params, grads, exp_avgs, exp_avg_sqs, step_sizes,
+                           beta1, beta2, eps, lambda_l1, weight_decay):
+        # The penalties are added to (copies of) the gradients
+        if lambda_l1 != 0:
+            grads = torch._foreach_add(grads, torch._foreach_sign(params), alpha=lambda_l1)
+        if weight_decay != 0:
+            grads = torch._foreach_add(grads, params, alpha=weight_decay)
+
+        # Decay the first and second moment running average coefficient
+        torch._foreach_lerp_(exp_avgs, grads, 1 - beta1)
+        torch._foreach_mul_(exp_avg_sqs, beta2)
+        torch._foreach_addcmul_(exp_avg_sqs, grads, grads, 1 - beta2)
+
+        denoms = torch._foreach_sqrt(exp_avg_sqs)
+        torch._foreach_add_(denoms, eps)
+
+        torch._foreach_addcdiv_(params, exp_avgs, denoms, step_sizes)
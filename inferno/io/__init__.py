@@ -1,4 +1,5 @@
-from . import box
-from . import core
-from . import transform
-from . import volumetric
\ No newline at end of file
+from ..utils.python_utils import lazy_module_attributes
+
+__all__ = ['box', 'core', 'transform', 'volumetric']
+
+__getattr__, __dir__ = lazy_module_attributes(__name__, submodules=__all__)
@@ -1,11 +1,16 @@
 """Things that work out of the box. ;)"""
 
-from .camvid import CamVid, get_camvid_loaders
-from .cityscapes import Cityscapes, get_cityscapes_loaders
-from .cifar import get_cifar10_loaders, get_cifar100_loaders
+from ...utils.python_utils import lazy_module_attributes
 
 
 __all__ = [
     'CamVid','get_camvid_loaders', 'Cityscapes', 'get_cityscapes_loaders',
     'get_cifar10_loaders','get_cifar100_loaders'
-]
\ No newline at end of file
+]
+
+# The datasets (and torchvision) are imported on first access
+__getattr__, __dir__ = lazy_module_attributes(
+    __name__, submodules=['binary_blobs', 'camvid', 'cityscapes', 'cifar'],
+    attributes={'CamVid': 'camvid', 'get_camvid_loaders': 'camvid',
+                'Cityscapes': 'cityscapes', 'get_cityscapes_loaders': 'cityscapes',
+                'get_cifar10_loaders': 'cifar', 'get_cifar100_loaders': 'cifar'})
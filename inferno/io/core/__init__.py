@@ -1,3 +1,4 @@
 from .base import SyncableDataset
 from .zip import Zip, ZipReject
 from .concatenate import Concatenate
+from .sampler import UnpaddedDistributedSampler
@@ -0,0 +1,25 @@
+import torch
+from torch.utils.data import DistributedSampler
+
+
+class UnpaddedDistributedSampler(DistributedSampler):
+    """
+    A `DistributedSampler` that doesn't pad the shards with duplicate samples, such that
+    every sample is loaded by exactly one process (and some processes may get one sample
+    less). This is meant for evaluation, where the duplicates would bias the results.
+    """
+    def __init__(self, dataset, num_replicas=None, rank=None, shuffle=False, seed=0):
+        super(UnpaddedDistributedSampler, self).__init__(dataset, num_replicas=num_replicas,
+                                                         rank=rank, shuffle=shuffle,
+                                                         seed=seed, drop_last=False)
+        self.total_size = len(self.dataset)
+        self.num_samples = len(range(self.rank, self.total_size, self.num_replicas))
+
+    def __iter__(self):
+        if self.shuffle:
+            generator = torch.Generator()
+            generator.manual_seed(self.seed + self.epoch)
+            indices = torch.randperm(self.total_size, generator=generator).tolist()
+        else:
+            indices = list(range(self.total_size))
+        return iter(indices[self.rank:self.total_size:self.num_replicas])
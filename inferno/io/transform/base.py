@@ -1,5 +1,6 @@
 from ...utils import python_utils as pyu
 import numpy as np
+import torch
 
 
 class Transform(object):
@@ -16,6 +17,12 @@ class Transform(object):
     For example, if both `volume_function` and `image_function` are defined, this means that
     only the former will be called. If the inputs are therefore not 5D batch-tensors of 3D
     volumes, a `NotImplementedError` is raised.
+
+    Transforms can also be applied to collated batches (torch tensors with a leading sample
+    axis, possibly on the GPU) with `apply_to_collated_batch`. This uses the method
+    `collated_batch_function` where available, which applies to all tensors of the batch
+    at once (and draws the random variables per sample); otherwise, the transform is
+    applied to every sample separately.
     """
     def __init__(self, apply_to=None):
         """
@@ -77,6 +84,34 @@ class Transform(object):
         else:
             raise NotImplementedError
 
+    def apply_to_collated_batch(self, *tensors):
+        """
+        Applies the transform to collated batches, i.e. tensors whose leading axis is the
+        sample axis.
+        """
+        tensors = pyu.to_iterable(tensors)
+        if hasattr(self, 'collated_batch_function'):
+            self.clear_random_variables()
+            return pyu.from_iterable(self.collated_batch_function(tensors))
+        # Fall back to applying the transform to every sample, as a dataset would
+        batch_sizes = {len(tensor) for tensor in tensors if torch.is_tensor(tensor)}
+        assert len(batch_sizes) == 1, "All tensors must have the same number of samples."
+        batch_size, = batch_sizes
+        transformed_samples = []
+        for sample_num in range(batch_size):
+            sample = [tensor[sample_num].cpu().numpy() if torch.is_tensor(tensor) else tensor
+                      for tensor in tensors]
+            transformed_samples.append(pyu.to_iterable(self(*sample)))
+        # Collate the transformed samples back to the devices of the inputs
+        transformed = [torch.stack([torch.as_tensor(np.array(sample))
+                                    for sample in samples]).to(tensor.device)
+                       if torch.is_tensor(tensor) else samples[0]
+                       for tensor, samples in zip(tensors, zip(*transformed_samples))]
+        return pyu.from_iterable(transformed)
+
+    def _get_apply_to_indices(self, tensors):
+        return list(range(len(tensors))) if self._apply_to is None else self._apply_to
+
     # noinspection PyUnresolvedReferences
     def _apply_image_function(self, tensor, **transform_function_kwargs):
         assert pyu.has_callable_attr(self, 'image_function')
@@ -161,6 +196,17 @@ class Compose(object):
             intermediate = pyu.to_iterable(transform(*intermediate))
         return pyu.from_iterable(intermediate)
 
+    def apply_to_collated_batch(self, *tensors):
+        """
+        Applies the transforms to collated batches (see `Transform.apply_to_collated_batch`).
+        Callables that aren't transforms are called with the collated batches.
+        """
+        intermediate = tensors
+        for transform in self.transforms:
+            apply = getattr(transform, 'apply_to_collated_batch', transform)
+            intermediate = pyu.to_iterable(apply(*intermediate))
+        return pyu.from_iterable(intermediate)
+
 
 class DTypeMapping(object):
     DTYPE_MAPPING = {'float32': 'float32',
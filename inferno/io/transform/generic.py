@@ -2,6 +2,7 @@ import numpy as np
 import torch
 from .base import Transform, DTypeMapping
 from ...utils.exceptions import assert_, DTypeError
+from ...utils import torch_utils as tu
 
 
 class Normalize(Transform):
@@ -33,6 +34,29 @@ class Normalize(Transform):
         tensor = (tensor - mean.reshape(*reshape_as))/(std.reshape(*reshape_as) + self.eps)
         return tensor
 
+    def _normalize_collated(self, tensor):
+        if not tensor.is_floating_point():
+            tensor = tensor.float()
+        # Statistics per sample, or given per channel
+        sample_dims = tuple(range(1, tensor.dim()))
+        reshape_as = [-1] + [1] * (tensor.dim() - 2)
+        if self.mean is None:
+            mean = tensor.mean(dim=sample_dims, keepdim=True)
+        else:
+            mean = torch.as_tensor(self.mean, dtype=tensor.dtype,
+                                   device=tensor.device).reshape(*reshape_as)
+        if self.std is None:
+            std = tensor.std(dim=sample_dims, keepdim=True, unbiased=False)
+        else:
+            std = torch.as_tensor(self.std, dtype=tensor.dtype,
+                                  device=tensor.device).reshape(*reshape_as)
+        return (tensor - mean) / (std + self.eps)
+
+    def collated_batch_function(self, tensors):
+        apply_to = self._get_apply_to_indices(tensors)
+        return [self._normalize_collated(tensor) if tensor_index in apply_to else tensor
+                for tensor_index, tensor in enumerate(tensors)]
+
 
 class NormalizeRange(Transform):
     """Normalizes input by a constant."""
@@ -51,6 +75,11 @@ class NormalizeRange(Transform):
     def tensor_function(self, tensor):
         return tensor / self.normalize_by
 
+    def collated_batch_function(self, tensors):
+        apply_to = self._get_apply_to_indices(tensors)
+        return [tensor / self.normalize_by if tensor_index in apply_to else tensor
+                for tensor_index, tensor in enumerate(tensors)]
+
 
 class Project(Transform):
     """
@@ -78,7 +107,13 @@ class Project(Transform):
 
 
 class Label2OneHot(Transform, DTypeMapping):
-    """Convert integer labels to one-hot vectors for arbitrary dimensional data."""
+    """
+    Convert integer labels to one-hot vectors for arbitrary dimensional data.
+
+    Applied to collated batches (e.g. as batch transform, see
+    `inferno.trainers.basic.Trainer.bind_loader`), the labels are expanded on the device they
+    are on. The labels then stay compact till after the transfer to the device.
+    """
     def __init__(self, num_classes, dtype='float', **super_kwargs):
         """
         Parameters
@@ -104,6 +139,12 @@ class Label2OneHot(Transform, DTypeMapping):
         #     output[class_num] = tensor == class_num
         return output
 
+    def collated_batch_function(self, tensors):
+        apply_to = self._get_apply_to_indices(tensors)
+        return [tu.label_to_one_hot(tensor, self.num_classes, dtype=getattr(torch, self.dtype))
+                if tensor_index in apply_to else tensor
+                for tensor_index, tensor in enumerate(tensors)]
+
 
 class Cast(Transform, DTypeMapping):
     """Casts inputs to a specified datatype."""
@@ -123,6 +164,11 @@ class Cast(Transform, DTypeMapping):
     def tensor_function(self, tensor):
         return getattr(np, self.dtype)(tensor)
 
+    def collated_batch_function(self, tensors):
+        apply_to = self._get_apply_to_indices(tensors)
+        return [tensor.to(getattr(torch, self.dtype)) if tensor_index in apply_to else tensor
+                for tensor_index, tensor in enumerate(tensors)]
+
 
 class AsTorchBatch(Transform):
     """Converts a given numpy array to a torch batch tensor.
@@ -5,6 +5,7 @@ from scipy.ndimage.interpolation import map_coordinates, rotate
 from scipy.ndimage.morphology import binary_dilation, binary_erosion
 from skimage.exposure import adjust_gamma
 from warnings import catch_warnings, simplefilter
+import torch
 
 from .base import Transform
 from ...utils.exceptions import assert_, ShapeError
@@ -392,6 +393,12 @@ class AdditiveGaussianNoise(Transform):
         image = image + self.get_random_variable('noise', imshape=image.shape)
         return image
 
+    def collated_batch_function(self, tensors):
+        # The noise is drawn independently for every pixel, i.e. also for every sample
+        apply_to = self._get_apply_to_indices(tensors)
+        return [tensor + self.sigma * torch.randn_like(tensor) if tensor_index in apply_to
+                else tensor for tensor_index, tensor in enumerate(tensors)]
+
 
 class RandomRotate(Transform):
     """Random 90-degree rotations."""
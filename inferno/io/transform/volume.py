@@ -1,4 +1,5 @@
 import numpy as np
+import torch
 import scipy
 from .base import Transform
 
@@ -109,6 +110,11 @@ class AdditiveNoise(Transform):
         volume += np.random.normal(loc=0, scale=self.sigma, size=volume.shape)
         return volume
 
+    def collated_batch_function(self, tensors):
+        apply_to = self._get_apply_to_indices(tensors)
+        return [tensor + self.sigma * torch.randn_like(tensor) if tensor_index in apply_to
+                else tensor for tensor_index, tensor in enumerate(tensors)]
+
 
 class CentralSlice(Transform):
     def volume_function(self, volume):
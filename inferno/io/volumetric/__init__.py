@@ -1 +1 @@
-from .volume import VolumeLoader, HDF5VolumeLoader, TIFVolumeLoaderfrom .lazy_volume_loader import LazyHDF5VolumeLoader, LazyZarrVolumeLoader, LazyN5VolumeLoader
\ No newline at end of file
+from .volume import VolumeLoader, HDF5VolumeLoader, TIFVolumeLoaderfrom .lazy_volume_loader import LazyHDF5VolumeLoader, LazyZarrVolumeLoader, LazyN5VolumeLoaderfrom .sampler import WindowStatistics, BalancedWindowSampler
\ No newline at end of file
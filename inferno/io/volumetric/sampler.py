@@ -0,0 +1,299 @@
+import itertools
+import os
+
+import numpy as np
+from torch.utils.data import Sampler
+
+from .volume import VolumeLoader
+from .lazy_volume_loader import LazyVolumeLoaderBase
+from ...utils.exceptions import assert_, ShapeError
+
+__all__ = ['WindowStatistics', 'BalancedWindowSampler']
+
+
+def _window_bounds(loader):
+    # Returns the label array and the bounds of the loader's windows in it, clipped to the
+    # data (i.e. padded voxels of lazy loaders aren't counted)
+    starts = np.array([[slice_.start for slice_ in window] for window in loader.base_sequence],
+                      dtype='int64')
+    stops = np.array([[slice_.stop for slice_ in window] for window in loader.base_sequence],
+                     dtype='int64')
+    if isinstance(loader, VolumeLoader):
+        assert_(not loader.is_multichannel,
+                "Can't compute label statistics of multichannel volumes.",
+                NotImplementedError)
+        return loader.volume, starts, stops
+    elif isinstance(loader, LazyVolumeLoaderBase):
+        if loader.padding is not None:
+            pad_left = np.array([pad[0] for pad in loader.padding], dtype='int64')
+            starts, stops = starts - pad_left, stops - pad_left
+        data_shape = np.array(loader._data_shape, dtype='int64')
+        starts, stops = np.clip(starts, 0, data_shape), np.clip(stops, 0, data_shape)
+        if loader.data_slice is not None:
+            offset = np.array([slice_.start for slice_ in loader.data_slice], dtype='int64')
+            starts, stops = starts + offset, stops + offset
+        return loader.dataset, starts, stops
+    else:
+        raise NotImplementedError("Can't compute window statistics for {}."
+                                  .format(type(loader).__name__))
+
+
+def _block_histograms(labels, block_shape, num_classes=None):
+    # Counts the labels in every block, in one vectorized pass. Returns an array of the shape
+    # (num_classes, *num_blocks). Labels >= num_classes (if given) are not counted; they're
+    # masked out before the bincount, which would otherwise allocate max_label * num_blocks
+    # entries.
+    assert_(labels.size == 0 or labels.min() >= 0, "Labels must not be negative.", ValueError)
+    num_blocks = np.array(labels.shape) // block_shape
+    total_num_blocks = int(np.prod(num_blocks))
+    block_index = np.zeros((1,) * labels.ndim, dtype='int64')
+    for axis, (size, block_size) in enumerate(zip(labels.shape, block_shape)):
+        axis_index = (np.arange(size, dtype='int64') // block_size)
+        axis_index = axis_index.reshape([-1 if axis_ == axis else 1
+                                         for axis_ in range(labels.ndim)])
+        block_index = block_index * num_blocks[axis] + axis_index
+    flat_index = labels.astype('int64') * total_num_blocks + block_index
+    if num_classes is not None:
+        flat_index = flat_index[labels < num_classes]
+    histogram = np.bincount(flat_index.ravel(),
+                            minlength=(num_classes or 0) * total_num_blocks)
+    num_classes = -(-histogram.size // total_num_blocks)
+    histogram = np.pad(histogram, (0, num_classes * total_num_blocks - histogram.size))
+    return histogram.reshape(num_classes, *num_blocks)
+
+
+def compute_window_counts(labels, starts, stops, num_classes=None, max_slab_size=2 ** 24):
+    """
+    Counts the labels in the windows (given by their `starts` and `stops`) of the label
+    volume `labels`, which can be a numpy array or a lazily loaded dataset (e.g. from HDF5).
+
+    The volume is read once, in slabs of about `max_slab_size` voxels, and the labels are
+    counted in the largest blocks that tile all windows. The counts of the windows are then
+    read from the summed-area table of the block counts. Returns an array of the shape
+    (num_windows, num_classes).
+
+    Labels >= `num_classes` (e.g. an ignore label of 255) are not counted. If `num_classes`
+    is not given, all labels are counted (and the number of classes is the largest label
+    plus one), so it should be given if the labels contain an ignore label.
+    """
+    starts, stops = np.asarray(starts, dtype='int64'), np.asarray(stops, dtype='int64')
+    assert_(starts.shape == stops.shape and starts.shape[1] == len(labels.shape),
+            "Window bounds don't match the volume.",
+            ShapeError)
+    region_start, region_stop = starts.min(0), stops.max(0)
+    region_shape = region_stop - region_start
+    # The largest blocks such that all windows are made of whole blocks
+    block_shape = np.gcd.reduce(np.concatenate([starts - region_start, stops - region_start,
+                                                region_shape[None]]), axis=0)
+    block_shape = np.maximum(block_shape, 1)
+    num_blocks = region_shape // block_shape
+    # Stream through the volume along the first axis
+    slab_size = int(block_shape[0] * np.prod(region_shape[1:]))
+    rows_per_slab = max(1, max_slab_size // max(slab_size, 1))
+    slab_histograms = []
+    for row in range(0, num_blocks[0], rows_per_slab):
+        row_stop = min(row + rows_per_slab, num_blocks[0])
+        slab = np.asarray(labels[(slice(region_start[0] + row * block_shape[0],
+                                        region_start[0] + row_stop * block_shape[0]),) +
+                                 tuple(slice(start, stop) for start, stop
+                                       in zip(region_start[1:], region_stop[1:]))])
+        slab_histograms.append(_block_histograms(slab, block_shape, num_classes))
+    if num_classes is None:
+        num_classes = max(histogram.shape[0] for histogram in slab_histograms)
+    block_counts = np.concatenate([np.pad(histogram,
+                                          [(0, num_classes - histogram.shape[0])] +
+                                          [(0, 0)] * len(block_shape))
+                                   for histogram in slab_histograms], axis=1)
+    # Summed-area table, with a leading zero along every spatial axis
+    summed = np.zeros((num_classes,) + tuple(num_blocks + 1), dtype='int64')
+    cumulative = block_counts
+    for axis in range(1, block_counts.ndim):
+        cumulative = cumulative.cumsum(axis=axis)
+    summed[(slice(None),) + (slice(1, None),) * len(block_shape)] = cumulative
+    block_starts = (starts - region_start) // block_shape
+    block_stops = (stops - region_start) // block_shape
+    # Inclusion-exclusion over the corners of the windows
+    window_counts = np.zeros((num_classes, len(starts)), dtype='int64')
+    for corner in itertools.product([False, True], repeat=len(block_shape)):
+        index = tuple(np.where(upper, block_stops[:, axis], block_starts[:, axis])
+                      for axis, upper in enumerate(corner))
+        sign = (-1) ** (len(block_shape) - sum(corner))
+        window_counts += sign * summed[(slice(None),) + index]
+    return window_counts.T
+
+
+class WindowStatistics(object):
+    """
+    Label counts in the sliding windows of a volume loader (see `compute_window_counts`),
+    which can be saved to and loaded from an `.npz` file.
+    """
+    def __init__(self, counts, starts, stops):
+        self.counts = np.asarray(counts)
+        self.starts = np.asarray(starts)
+        self.stops = np.asarray(stops)
+
+    @property
+    def num_windows(self):
+        return self.counts.shape[0]
+
+    @property
+    def num_classes(self):
+        return self.counts.shape[1]
+
+    @classmethod
+    def compute(cls, loader, num_classes=None, max_slab_size=2 ** 24):
+        """Computes the statistics of a `VolumeLoader` or lazy volume loader of labels."""
+        labels, starts, stops = _window_bounds(loader)
+        return cls(compute_window_counts(labels, starts, stops, num_classes=num_classes,
+                                         max_slab_size=max_slab_size), starts, stops)
+
+    @staticmethod
+    def get_default_path(loader):
+        """Path next to the file a (lazy) loader reads from, or None if there's no file."""
+        path = getattr(loader, 'path', None)
+        if not isinstance(path, str):
+            return None
+        path_in_file = getattr(loader, 'path_in_file', None)
+        if path_in_file:
+            path = '{}.{}'.format(path, path_in_file.strip('/').replace('/', '.'))
+        return '{}.window_statistics.npz'.format(path)
+
+    @classmethod
+    def for_loader(cls, loader, num_classes=None, path=None, max_slab_size=2 ** 24):
+        """
+        Loads the statistics of `loader` from `path` (by default next to the data), or
+        computes and saves them there if they're missing or were computed for other windows.
+        """
+        path = cls.get_default_path(loader) if path is None else path
+        _, starts, stops = _window_bounds(loader)
+        if path is not None and os.path.exists(path):
+            statistics = cls.load(path)
+            if np.array_equal(statistics.starts, starts) and \
+                    np.array_equal(statistics.stops, stops) and \
+                    (num_classes is None or statistics.num_classes == num_classes):
+                return statistics
+        statistics = cls.compute(loader, num_classes=num_classes, max_slab_size=max_slab_size)
+        if path is not None:
+            statistics.save(path)
+        return statistics
+
+    def save(self, path):
+        # Write to a temporary file first, such that readers never see a partial file
+        temporary_path = '{}.tmp.npz'.format(path)
+        np.savez(temporary_path, counts=self.counts, starts=self.starts, stops=self.stops)
+        os.replace(temporary_path, path)
+        return self
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            return cls(saved['counts'], saved['starts'], saved['stops'])
+
+
+class BalancedWindowSampler(Sampler):
+    """
+    Samples window indices of a volume loader (or of datasets zipping synced volume loaders)
+    with weights computed from their label statistics, e.g. such that windows with rare
+    classes are drawn as often as windows with frequent ones.
+
+    Modes:
+        - 'balanced': Every class (that occurs) gets the same total probability (times its
+          class weight), which is split between the windows by their share of the class.
+        - 'importance': The weight of a window is the sum of its label counts times the class
+          weights (by default, the inverse class frequencies).
+
+    The indices are drawn with the alias method, i.e. in constant time per sample.
+    """
+    MODES = ('balanced', 'importance')
+
+    def __init__(self, window_statistics, num_samples=None, mode='balanced',
+                 class_weights=None, smoothing=0., seed=None):
+        """
+        Parameters
+        ----------
+        window_statistics : WindowStatistics or numpy.ndarray
+            Label counts of the windows, of the shape (num_windows, num_classes).
+        num_samples : int
+            Number of indices per iteration (i.e. epoch). Defaults to the number of windows.
+        mode : {'balanced', 'importance'}
+            How to weight the windows (see above).
+        class_weights : list or numpy.ndarray
+            Weights of the classes.
+        smoothing : float
+            Fraction of the probability that is distributed uniformly over all windows, such
+            that every window is drawn every once in a while.
+        seed : int
+            Seed of the random number generator.
+        """
+        counts = window_statistics.counts if isinstance(window_statistics, WindowStatistics) \
+            else np.asarray(window_statistics)
+        assert_(counts.ndim == 2,
+                "Expected window statistics of the shape (num_windows, num_classes), "
+                "got {} instead.".format(counts.shape),
+                ShapeError)
+        assert_(mode in self.MODES,
+                "Mode must be one of {}, got '{}' instead.".format(self.MODES, mode),
+                ValueError)
+        assert_(0. <= smoothing <= 1.,
+                "Smoothing must be between 0 and 1, got {}.".format(smoothing),
+                ValueError)
+        self.mode = mode
+        self.smoothing = smoothing
+        self.num_samples = counts.shape[0] if num_samples is None else num_samples
+        self.probabilities = self._get_probabilities(counts.astype('float64'), class_weights)
+        self._probability_table, self._alias_table = \
+            self._build_alias_tables(self.probabilities)
+        self._random = np.random.default_rng(seed)
+
+    def _get_probabilities(self, counts, class_weights):
+        class_totals = counts.sum(0)
+        present = class_totals > 0
+        assert_(present.any(), "No labels in any window.", ValueError)
+        if class_weights is None:
+            if self.mode == 'balanced':
+                class_weights = np.ones(counts.shape[1])
+            else:
+                class_weights = np.zeros(counts.shape[1])
+                class_weights[present] = class_totals.sum() / class_totals[present]
+        class_weights = np.asarray(class_weights, dtype='float64')
+        assert_(class_weights.shape == (counts.shape[1],),
+                "Expected {} class weights, got {}."
+                .format(counts.shape[1], class_weights.shape),
+                ShapeError)
+        if self.mode == 'balanced':
+            weights = (counts[:, present] / class_totals[present]) @ class_weights[present]
+        else:
+            weights = counts @ class_weights
+        assert_(weights.sum() > 0, "All windows have zero weight.", ValueError)
+        probabilities = weights / weights.sum()
+        return (1. - self.smoothing) * probabilities + self.smoothing / len(probabilities)
+
+    @staticmethod
+    def _build_alias_tables(probabilities):
+        # Vose's alias method: window `index` is drawn if a uniform sample is below
+        # `probability_table[index]`, and its alias otherwise
+        num_windows = len(probabilities)
+        scaled = probabilities * num_windows
+        probability_table = np.ones(num_windows)
+        alias_table = np.arange(num_windows)
+        small = list(np.flatnonzero(scaled < 1.))
+        large = list(np.flatnonzero(scaled >= 1.))
+        while small and large:
+            small_index, large_index = small.pop(), large.pop()
+            probability_table[small_index] = scaled[small_index]
+            alias_table[small_index] = large_index
+            scaled[large_index] -= 1. - scaled[small_index]
+            (small if scaled[large_index] < 1. else large).append(large_index)
+        return probability_table, alias_table
+
+    def sample(self, num_samples):
+        """Draws `num_samples` window indices."""
+        indices = self._random.integers(len(self.probabilities), size=num_samples)
+        keep = self._random.random(num_samples) < self._probability_table[indices]
+        return np.where(keep, indices, self._alias_table[indices])
+
+    def __iter__(self):
+        return iter(self.sample(self.num_samples).tolist())
+
+    def __len__(self):
+        return self.num_samples
@@ -1,25 +1,27 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from inspect import signature
+import copy
+import importlib
+import itertools
 import os
 import shutil
 
-# These are fetched from globals, they're not unused
-# noinspection PyUnresolvedReferences
-import dill
-# noinspection PyUnresolvedReferences
-import pickle
-
-
 import torch
+import torch.distributed as dist
 from numpy import inf
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, DistributedSampler, RandomSampler, SequentialSampler
+from torch.utils.data import IterableDataset
 from torch.nn.parallel.data_parallel import data_parallel
+from torch.nn.parallel import DistributedDataParallel
 from .callbacks.logging.base import Logger
 from .callbacks.logging import get_logger
 
 from ..utils import train_utils as tu
 from ..utils import python_utils as pyu
 from ..utils import torch_utils as thu
+from ..utils.checkpoint_utils import ShardedCheckpointStore
+from ..io.core.sampler import UnpaddedDistributedSampler
 from ..extensions import metrics
 from ..extensions import optimizers
 from ..extensions import criteria
@@ -58,6 +60,9 @@ class Trainer(object):
         self._optimizer = None
         self._criterion = None
         self._retain_graph = False
+        # Gradient scaling (e.g. for mixed precision training)
+        self._grad_scaler = None
+        self._gradients_unscaled = False
 
         # Metric evaluation
         self._metric = None
@@ -86,6 +91,13 @@ class Trainer(object):
         self._dtype = 'float'
         self._devices = None
         self._base_device_ordinal = None
+        # torch.compile options (None if the model is not to be compiled)
+        self._compile_options = None
+        self._compiled_model = None
+        # Distributed data-parallel training
+        self._distributed = False
+        self._distributed_options = {}
+        self._distributed_model = None
 
         # Validation
         self._save_at_best_validation_score = False
@@ -101,11 +113,32 @@ class Trainer(object):
         # This is to allow a callback to trigger a validation by setting
         # trainer.validate_now = True
         self._validation_externally_triggered = False
+        # Fixed validation batches (by loader name) and asynchronous validation
+        self._validation_cache = {}
+        # Names of the loaders whose cached batches are already wrapped (i.e. transformed,
+        # on the device and cast)
+        self._wrapped_validation_caches = set()
+        self._asynchronous_validation = None
+        self._validation_executor = None
+        self._pending_validation = None
+        # Weights of the pending asynchronous validation, and of the last one if it was
+        # the best so far (and the best checkpoint is yet to be written)
+        self._pending_validation_state = None
+        self._best_validated_state = None
+
+        # Matches the frequencies (built when first needed)
+        self._schedule = None
+
+        # Thread settings (see Trainer.cpu), and the cores this process could run on
+        # before it was pinned
+        self._cpu_threads = None
+        self._available_cores = None
 
         # Checkpointing
         self._save_every = None
         self._save_to_directory = None
         self._pickle_module = 'pickle'
+        self._checkpoint_format = 'pickle'
         # Defaults for file names
         self._checkpoint_filename = 'checkpoint.pytorch'
         self._best_checkpoint_filename = 'best_checkpoint.pytorch'
@@ -202,11 +235,46 @@ class Trainer(object):
                 "Model must be a torch.nn.Module.",
                 NotTorchModuleError)
         self._model = model
+        self._compiled_model = None
+        self._distributed_model = None
         # Transfer model to GPU if required
         if self._use_cuda:
             self._model.cuda()
         return self
 
+    def compile(self, mode=None, **compile_kwargs):
+        """
+        Compile the model with `torch.compile`. The model is compiled once (when it is
+        first applied) and the compiled model is reused for training and validation.
+        Note that `Trainer.model` still returns (and checkpoints contain) the original
+        model, and that the model is not compiled for data-parallel training.
+
+        Parameters
+        ----------
+        mode : str
+            Compilation mode, e.g. 'default', 'reduce-overhead' or 'max-autotune'.
+            Set to False to disable compilation.
+        compile_kwargs : dict
+            Further keyword arguments to `torch.compile`.
+
+        Returns
+        -------
+        Trainer
+            self.
+        """
+        self._compile_options = None if mode is False else dict(compile_kwargs, mode=mode)
+        self._compiled_model = None
+        return self
+
+    @property
+    def compiled_model(self):
+        """Gets the compiled model if compilation is enabled, and the model otherwise."""
+        if getattr(self, '_compile_options', None) is None:
+            return self.model
+        if getattr(self, '_compiled_model', None) is None:
+            self._compiled_model = torch.compile(self.model, **self._compile_options)
+        return self._compiled_model
+
     @property
     def model_is_defined(self):
         return self._model is not None
@@ -471,6 +539,7 @@ class Trainer(object):
             self
         """
         self._evaluate_metric_every = tu.Frequency.build_from(frequency, priority='iterations')
+        self.schedule.register('evaluate_metric', self._evaluate_metric_every)
         assert self._evaluate_metric_every.is_consistent
         return self
 
@@ -489,11 +558,13 @@ class Trainer(object):
                 return False
             else:
                 # If we haven't evaluated this epoch, check if we should
-                return self._evaluate_metric_every.match(epoch_count=self._epoch_count)
+                return self.schedule.fires('evaluate_metric', self._evaluate_metric_every,
+                                           epoch_count=self._epoch_count)
         else:
             # This is reached when evaluate_metric_every is defined and matching by
             # iteration count
-            return self._evaluate_metric_every.match(iteration_count=self._iteration_count)
+            return self.schedule.fires('evaluate_metric', self._evaluate_metric_every,
+                                       iteration_count=self._iteration_count)
 
     @evaluate_metric_now.setter
     def evaluate_metric_now(self, value):
@@ -605,9 +676,11 @@ class Trainer(object):
 
     @property
     def pickle_module(self):
-        module_ = globals().get(self._pickle_module, None)
-        assert_(module_ is not None, "Pickle module not found!", ModuleNotFoundError)
-        return module_
+        # Imported on first use (dill is slow to import)
+        try:
+            return importlib.import_module(self._pickle_module)
+        except ImportError:
+            raise ModuleNotFoundError("Pickle module not found!")
 
     _ALLOWED_PICKLE_MODULES = {'pickle', 'dill'}
 
@@ -619,6 +692,44 @@ class Trainer(object):
                 f"got {value} instead.", ValueError)
         self._pickle_module = value
 
+    _ALLOWED_CHECKPOINT_FORMATS = {'pickle', 'state_dict', 'sharded'}
+
+    @property
+    def checkpoint_format(self):
+        # Trainers loaded from old checkpoints might not have '_checkpoint_format'
+        return getattr(self, '_checkpoint_format', 'pickle')
+
+    @checkpoint_format.setter
+    def checkpoint_format(self, value):
+        assert_(value in self._ALLOWED_CHECKPOINT_FORMATS,
+                f"Checkpoint format must be one of {self._ALLOWED_CHECKPOINT_FORMATS}, "
+                f"got {value} instead.", ValueError)
+        self._checkpoint_format = value
+
+    def set_checkpoint_format(self, checkpoint_format):
+        """
+        Set the format in which checkpoints are written.
+
+        Parameters
+        ----------
+        checkpoint_format : {'pickle', 'state_dict'}
+            With 'pickle' (the default), the entire trainer (including the model and
+            optimizer objects) is pickled. With 'state_dict', only the `state_dict`s of the
+            model and the optimizer are saved alongside the rest of the trainer
+            configuration (counters, callbacks, scalar states, etc.). With 'sharded', the
+            'state_dict' checkpoint is written to a `ShardedCheckpointStore` in the save
+            directory, where every tensor is stored once and shared between checkpoints.
+            Loading 'state_dict' and 'sharded' checkpoints requires the model (and optionally
+            the optimizer) to be bound to the trainer beforehand.
+
+        Returns
+        -------
+        Trainer
+            self
+        """
+        self.checkpoint_format = checkpoint_format
+        return self
+
     @property
     def saving_every(self):
         """Gets the frequency at which checkpoints are made."""
@@ -646,11 +757,13 @@ class Trainer(object):
                     return False
                 else:
                     # If we haven't saved this epoch, check if we should
-                    return self._save_every.match(epoch_count=self._epoch_count)
+                    return self.schedule.fires('save', self._save_every,
+                                               epoch_count=self._epoch_count)
             else:
                 # We're saving by iterations
                 return self._save_every is not None and \
-                   self._save_every.match(iteration_count=self._iteration_count)
+                   self.schedule.fires('save', self._save_every,
+                                       iteration_count=self._iteration_count)
 
     @save_now.setter
     def save_now(self, value):
@@ -678,6 +791,7 @@ class Trainer(object):
             self.
         """
         self._save_every = tu.Frequency.build_from(frequency, priority='iterations')
+        self.schedule.register('save', self._save_every)
         assert self._save_every.is_consistent
         self.save_to_directory(to_directory, checkpoint_filename, best_checkpoint_filename)
         return self
@@ -707,6 +821,25 @@ class Trainer(object):
     def validating_every(self):
         return self._validate_every
 
+    @property
+    def schedule(self):
+        """
+        The `inferno.utils.train_utils.Schedule` that matches the trainer's (and the
+        callbacks') frequencies against the iteration and epoch counts. It can be used to
+        look ahead, e.g. `trainer.schedule.iterations_until('validate', trainer.iteration_count)`.
+        """
+        schedule = getattr(self, '_schedule', None)
+        if schedule is None:
+            # Not checkpointed, so this is rebuilt after loading
+            schedule = self._schedule = tu.Schedule()
+            for name, frequency, match_zero in \
+                    [('evaluate_metric', self._evaluate_metric_every, True),
+                     ('save', self._save_every, True),
+                     ('validate', self._validate_every, False)]:
+                if frequency is not None:
+                    schedule.register(name, frequency, match_zero=match_zero)
+        return schedule
+
     @property
     def validate_now(self):
         if self._validation_externally_triggered:
@@ -719,8 +852,8 @@ class Trainer(object):
                 return False
             else:
                 # If we haven't validated this epoch, check if we should
-                return self._validate_every.match(epoch_count=self._epoch_count,
-                                                  match_zero=False)
+                return self.schedule.fires('validate', self._validate_every,
+                                           epoch_count=self._epoch_count, match_zero=False)
         else:
             # Don't validate if we've done once already this iteration
             if self._last_validated_at_iteration == self._iteration_count:
@@ -729,8 +862,9 @@ class Trainer(object):
                 # If we haven't validated this iteration, check if we should. The `match_zero` is
                 # redundant, but we'll leave it on anyway.
                 return self._validate_every is not None and \
-                       self._validate_every.match(iteration_count=self._iteration_count,
-                                                  match_zero=False)
+                       self.schedule.fires('validate', self._validate_every,
+                                           iteration_count=self._iteration_count,
+                                           match_zero=False)
 
     @validate_now.setter
     def validate_now(self, value):
@@ -756,10 +890,106 @@ class Trainer(object):
             self
         """
         self._validate_every = tu.Frequency.build_from(frequency, priority='iterations')
+        self.schedule.register('validate', self._validate_every, match_zero=False)
         assert self._validate_every.is_consistent
         self._num_validation_iterations = for_num_iterations
         return self
 
+    def cache_validation_set(self, loader_name='validate', num_iterations=None, on_device=False):
+        """
+        Loads a fixed set of validation batches once, which is then used for all subsequent
+        validation runs (instead of the data loader). This way, the data is decoded and
+        transformed only once, and all runs see exactly the same batches.
+
+        Parameters
+        ----------
+        loader_name : str
+            Name of the loader to cache.
+        num_iterations : int
+            Number of batches to cache. If not set, the entire loader is cached.
+        on_device : bool
+            Whether to keep the batches on the device (e.g. the GPU). The batch transforms
+            are then applied once, when the batches are cached. Otherwise, the batches are
+            kept in pinned memory (when training on the GPU), and are wrapped (transformed,
+            sent to the device and cast) on every validation run.
+
+        Returns
+        -------
+        Trainer
+            self
+        """
+        assert_(loader_name in self._loaders,
+                "No loader named '{}' is bound.".format(loader_name), KeyError)
+        num_iterations = \
+            self._num_validation_iterations if num_iterations is None else num_iterations
+        pin_memory = self._use_cuda and not on_device and torch.cuda.is_available()
+        batches = []
+        for batch in itertools.islice(self._loaders[loader_name], num_iterations):
+            self.verify_batch(batch, loader_name)
+            if on_device:
+                batch = self.wrap_batch(batch, from_loader=loader_name)
+            elif pin_memory:
+                batch = type(batch)([_batch.pin_memory() if thu.is_tensor(_batch) else
+                                     [__batch.pin_memory() for __batch in _batch]
+                                     for _batch in batch])
+            batches.append(batch)
+        if not hasattr(self, '_validation_cache'):
+            self._validation_cache = {}
+        if not hasattr(self, '_wrapped_validation_caches'):
+            self._wrapped_validation_caches = set()
+        self._validation_cache[loader_name] = batches
+        if on_device:
+            self._wrapped_validation_caches.add(loader_name)
+        else:
+            self._wrapped_validation_caches.discard(loader_name)
+        return self
+
+    def get_validation_cache(self, loader_name='validate'):
+        """Gets the cached validation batches (or None if the loader isn't cached)."""
+        return getattr(self, '_validation_cache', {}).get(loader_name)
+
+    def validation_cache_is_wrapped(self, loader_name='validate'):
+        """Whether the cached validation batches are already wrapped (see `wrap_batch`)."""
+        return (self.get_validation_cache(loader_name) is not None and
+                loader_name in getattr(self, '_wrapped_validation_caches', set()))
+
+    def validate_asynchronously(self, yes=True, device=None):
+        """
+        Validate on a snapshot of the model in a background thread, while training
+        continues. The results are recorded (and `END_OF_VALIDATION_RUN` is called) once
+        they are ready. Note that the per-iteration validation callbacks and states are
+        not available for asynchronous validation runs. A best checkpoint contains the
+        weights that were validated, but the rest of the trainer's state (e.g. the
+        iteration count and the optimizer) at the time the results are recorded.
+
+        Validating on a fixed set (see `Trainer.cache_validation_set`) is recommended.
+
+        Parameters
+        ----------
+        yes : bool
+            Whether to validate asynchronously.
+        device : str or torch.device
+            Device to validate on (e.g. a second GPU). Defaults to the training device.
+
+        Returns
+        -------
+        Trainer
+            self
+        """
+        assert_(not (yes and self.is_distributed),
+                "Asynchronous validation is not supported with distributed training.",
+                RuntimeError)
+        self._asynchronous_validation = {'device': device} if yes else None
+        return self
+
+    @property
+    def validating_asynchronously(self):
+        return getattr(self, '_asynchronous_validation', None) is not None
+
+    @property
+    def validation_is_pending(self):
+        return getattr(self, '_pending_validation', None) is not None
+
     @property
     def iteration_count(self):
         return self._iteration_count
@@ -851,6 +1081,36 @@ class Trainer(object):
         self._state.update({key: value})
         return self
 
+    def keep_states_on_device(self, yes=True):
+        """
+        Keep the training states of every iteration (e.g. 'training_loss', 'training_error'
+        and 'training_prediction') as (detached) tensors on the device, instead of copying
+        them to the CPU. Copying them synchronizes with the device every iteration; without
+        it, the host can run ahead. Callbacks copy the states when they need them (e.g.
+        when logging), and the `NaNDetector` checks the loss on the device.
+
+        Note that the states then hold on to device memory until the next iteration.
+
+        Parameters
+        ----------
+        yes : bool
+            Whether to keep the states on the device.
+
+        Returns
+        -------
+        Trainer
+            self
+        """
+        self._keep_states_on_device = yes
+        return self
+
+    def _unwrap_state(self, state):
+        if not getattr(self, '_keep_states_on_device', False):
+            return thu.unwrap(state)
+        if isinstance(state, (list, tuple)):
+            return type(state)([self._unwrap_state(_state) for _state in state])
+        return state.detach() if torch.is_tensor(state) else state
+
     def update_state_from_dictionary(self, dictionary):
         # Unwrap variables (or tensors)
         self._state.update({
@@ -945,12 +1205,31 @@ class Trainer(object):
             self.criterion.cpu()
         self._use_cuda = True
         self._devices = devices
+        # The DDP wrapper is bound to the device of the model
+        self._distributed_model = None
         return self
 
-    def cpu(self):
+    def cpu(self, num_threads=None, interop_threads=None, pin_workers=True):
         """
         Train on the CPU.
 
+        Optionally, the CPU cores are partitioned between the computation (i.e. torch's
+        intra-op threads) and the data loading workers, which are restricted to a single
+        thread each (including the OpenMP / BLAS threads of e.g. SciPy transforms).
+        This prevents the processes from oversubscribing the CPU.
+
+        Parameters
+        ----------
+        num_threads : int
+            Number of threads for the computation. If None, the thread settings are
+            left alone.
+        interop_threads : int
+            Number of inter-op threads. Note that torch only allows to set this before
+            any inter-op parallel work was started.
+        pin_workers : bool
+            Whether to pin this process to the first `num_threads` available cores and
+            the data loading workers to the remaining ones (round-robin).
+
         Returns
         -------
         Trainer
@@ -962,8 +1241,52 @@ class Trainer(object):
             self.criterion.cpu()
         self._use_cuda = False
         self._devices = None
+        self._distributed_model = None
+        if num_threads is not None or interop_threads is not None:
+            self._cpu_threads = {'num_threads': num_threads,
+                                 'interop_threads': interop_threads,
+                                 'pin_workers': pin_workers}
+            self.apply_cpu_threads()
         return self
 
+    def apply_cpu_threads(self):
+        """Applies the thread settings of `Trainer.cpu` to this process and the loaders."""
+        cpu_threads = getattr(self, '_cpu_threads', None)
+        if cpu_threads is None:
+            return self
+        if cpu_threads['interop_threads'] is not None:
+            try:
+                torch.set_num_interop_threads(cpu_threads['interop_threads'])
+            except RuntimeError:
+                self.console.warning("Could not set the number of inter-op threads, "
+                                     "since inter-op parallel work has already started.")
+        num_threads = cpu_threads['num_threads']
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+            # The split is always computed from the cores before the first pinning (and not
+            # from the cores this process was restricted to by an earlier call)
+            if getattr(self, '_available_cores', None) is None:
+                self._available_cores = thu.get_available_cores()
+            cores = self._available_cores
+            if cpu_threads['pin_workers'] and len(cores) > num_threads:
+                thu.set_cpu_affinity(cores[:num_threads])
+                cpu_threads['worker_cores'] = cores[num_threads:]
+            else:
+                thu.set_cpu_affinity(cores)
+                cpu_threads.pop('worker_cores', None)
+        for loader in self._loaders.values():
+            self._limit_loader_threads(loader)
+        return self
+
+    def _limit_loader_threads(self, loader):
+        cpu_threads = getattr(self, '_cpu_threads', None)
+        if cpu_threads is None or loader.num_workers == 0:
+            return loader
+        loader.worker_init_fn = thu.WorkerThreadLimiter(
+            num_threads=1, cores=cpu_threads.get('worker_cores'),
+            worker_init_fn=loader.worker_init_fn)
+        return loader
+
     def is_cuda(self):
         """Returns whether using GPU for training."""
         return self._use_cuda
@@ -983,8 +1306,141 @@ class Trainer(object):
         if self._devices is not None:
             return data_parallel(self.model, inputs, list(self._devices),
                                  output_device=base_device_ordinal)
+        elif self.is_distributed and self.model.training:
+            # Gradients are synchronized in the backward pass. Evaluation doesn't need
+            # the wrapper (and must not, if the processes see different numbers of batches).
+            return self.distributed_model(*inputs)
+        else:
+            return self.compiled_model(*inputs)
+
+    def distributed(self, backend=None, init_method=None, world_size=None, rank=None,
+                    **ddp_kwargs):
+        """
+        Use distributed data-parallel (DDP) training, with one trainer per process.
+
+        This initializes the default process group (unless it is already initialized),
+        shards the data loaders across the processes with a `DistributedSampler` and wraps
+        the model in a `DistributedDataParallel` for training. Only the process with rank 0
+        writes checkpoints, logs and prints to the console (except warnings), and the
+        validation results are averaged over all processes.
+
+        For training on GPUs, select the device of each process
+        (e.g. with `torch.cuda.set_device`) before calling `Trainer.cuda`.
+
+        Parameters
+        ----------
+        backend : str
+            Backend of the process group. Defaults to 'nccl' on the GPU and 'gloo' on the CPU.
+        init_method : str
+            URL specifying how to initialize the process group. Defaults to 'env://',
+            i.e. the environment variables MASTER_ADDR, MASTER_PORT, WORLD_SIZE and RANK.
+        world_size : int
+            Number of processes.
+        rank : int
+            Rank of this process.
+        ddp_kwargs : dict
+            Keyword arguments to `torch.nn.parallel.DistributedDataParallel`.
+
+        Returns
+        -------
+        Trainer
+            self.
+        """
+        assert_(dist.is_available(), "torch.distributed is not available.", RuntimeError)
+        assert_(self._devices is None or isinstance(self._devices, int) or
+                len(self._devices) == 1,
+                "Distributed training can't be combined with data-parallel training.",
+                DeviceError)
+        if not dist.is_initialized():
+            init_kwargs = {key: value for key, value in
+                           [('init_method', init_method), ('world_size', world_size),
+                            ('rank', rank)] if value is not None}
+            dist.init_process_group(backend or ('nccl' if self._use_cuda else 'gloo'),
+                                    **init_kwargs)
+        self._distributed = True
+        self._distributed_options = ddp_kwargs
+        self._distributed_model = None
+        if not self.is_main_process:
+            self.console.toggle_info(False)
+            self.console.toggle_progress(False)
+        # Shard the loaders that are already bound
+        for name, loader in list(self._loaders.items()):
+            self.bind_loader(name, loader, **self._loader_specs.get(name, {}))
+        return self
+
+    @property
+    def is_distributed(self):
+        return getattr(self, '_distributed', False)
+
+    @property
+    def rank(self):
+        """Rank of this process (0 if not training distributed)."""
+        return dist.get_rank() if self.is_distributed else 0
+
+    @property
+    def world_size(self):
+        """Number of processes (1 if not training distributed)."""
+        return dist.get_world_size() if self.is_distributed else 1
+
+    @property
+    def is_main_process(self):
+        """Whether this process writes checkpoints and logs."""
+        return self.rank == 0
+
+    @property
+    def distributed_model(self):
+        """Gets the model wrapped in a `DistributedDataParallel`."""
+        assert_(self.is_distributed, "Distributed training is not enabled.", RuntimeError)
+        if getattr(self, '_distributed_model', None) is None:
+            ddp_kwargs = dict(self._distributed_options)
+            if self._use_cuda:
+                ddp_kwargs.setdefault('device_ids', [torch.cuda.current_device()])
+            self._distributed_model = DistributedDataParallel(self.model, **ddp_kwargs)
+        return self._distributed_model
+
+    def get_distributed_loader(self, loader, pad=True):
+        """
+        Rebuilds a data loader such that it only loads this process' share of the data.
+        Loaders that can't be rebuilt (e.g. with a custom sampler) are returned as is.
+
+        With `pad`, the shards are padded with duplicate samples such that all processes
+        get the same number of batches (as required for training). Otherwise (e.g. for
+        validation), every sample is loaded exactly once.
+        """
+        if isinstance(loader.sampler, DistributedSampler):
+            return loader
+        if isinstance(loader.dataset, IterableDataset) or loader.batch_size is None or \
+                not isinstance(loader.sampler, (RandomSampler, SequentialSampler)):
+            self.console.warning("Can't shard a loader with a custom (batch) sampler or "
+                                 "an iterable dataset. It is used as is.")
+            return loader
+        shuffle = isinstance(loader.sampler, RandomSampler)
+        if pad:
+            sampler = DistributedSampler(loader.dataset, shuffle=shuffle,
+                                         drop_last=loader.drop_last)
         else:
-            return self.model(*inputs)
+            sampler = UnpaddedDistributedSampler(loader.dataset, shuffle=shuffle)
+        # Options that not all torch versions have
+        loader_kwargs = {name: getattr(loader, name)
+                         for name in ['prefetch_factor', 'persistent_workers', 'generator',
+                                      'multiprocessing_context', 'pin_memory_device']
+                         if hasattr(loader, name)}
+        return DataLoader(loader.dataset, batch_size=loader.batch_size, sampler=sampler,
+                          num_workers=loader.num_workers, collate_fn=loader.collate_fn,
+                          pin_memory=loader.pin_memory, drop_last=loader.drop_last,
+                          timeout=loader.timeout, worker_init_fn=loader.worker_init_fn,
+                          **loader_kwargs)
+
+    def _all_reduce_meters(self, *meters):
+        # Sum up the meters over all processes, such that they agree on the averages
+        device = torch.device('cuda', torch.cuda.current_device()) \
+            if dist.get_backend() == 'nccl' else torch.device('cpu')
+        totals = torch.tensor([[float(meter.sum), float(meter.count)] for meter in meters],
+                              dtype=torch.float64, device=device)
+        dist.all_reduce(totals)
+        for meter, (total, count) in zip(meters, totals.tolist()):
+            meter.sum, meter.count = total, count
+            meter.avg = total / count if count > 0 else 0
 
     def cast(self, objects):
         if isinstance(objects, (list, tuple)):
@@ -1018,6 +1474,8 @@ class Trainer(object):
         assert dtype in ['double', 'float', 'half']
         self._dtype = dtype
         self._model = getattr(self._model, dtype)()
+        self._compiled_model = None
+        self._distributed_model = None
         return self
 
     @property
@@ -1028,7 +1486,54 @@ class Trainer(object):
     def dtype(self, value):
         self.set_precision(value)
 
-    def bind_loader(self, name, loader, num_inputs=None, num_targets=1):
+    def set_grad_scaler(self, scaler=True):
+        """
+        Scale the loss (and thereby the gradients) with a `torch.amp.GradScaler`, e.g. for
+        mixed precision training. The loss is scaled before the backward pass, and the
+        optimizer is stepped (and the scale updated) through the scaler. Callbacks that
+        need the actual gradients (e.g. `GradientClip`) call `Trainer.unscale_gradients`.
+
+        Parameters
+        ----------
+        scaler : torch.amp.GradScaler or bool
+            The scaler, or True to build one for the device the trainer is on (so this
+            should be called after `Trainer.cuda`). None or False to not scale.
+
+        Returns
+        -------
+        Trainer
+            self
+        """
+        if scaler is True:
+            scaler = torch.amp.GradScaler('cuda' if self._use_cuda else 'cpu')
+        self._grad_scaler = scaler or None
+        return self
+
+    @property
+    def grad_scaler(self):
+        # Trainers loaded from old checkpoints might not have '_grad_scaler'
+        scaler = getattr(self, '_grad_scaler', None)
+        return scaler if scaler is not None and scaler.is_enabled() else None
+
+    def unscale_gradients(self):
+        """
+        Unscales the gradients of the current training iteration, if they are scaled (see
+        `Trainer.set_grad_scaler`). This happens at most once per iteration, so any number
+        of callbacks can call it.
+
+        Returns
+        -------
+        Trainer
+            self
+        """
+        scaler = self.grad_scaler
+        if scaler is not None and not getattr(self, '_gradients_unscaled', False):
+            scaler.unscale_(self.optimizer)
+            self._gradients_unscaled = True
+        return self
+
+    def bind_loader(self, name, loader, num_inputs=None, num_targets=1,
+                    batch_transforms=None, batch_transforms_on_device=True):
         """
         Bind a data loader to the trainer.
 
@@ -1042,6 +1547,16 @@ class Trainer(object):
             Number of input tensors from the `loader`.
         num_targets : int
             Number of target tensors from the `loader`.
+        batch_transforms : callable
+            Transforms (e.g. `inferno.io.transform.Transform` or `Compose` objects) to apply
+            to the collated batches from the `loader` in the main process, once per batch (see
+            `inferno.io.transform.Transform.apply_to_collated_batch`). Other callables are
+            called with all tensors of the batch. The transforms are not saved with the
+            checkpoints (such that lambdas and closures are fine), bind the loader again
+            after loading.
+        batch_transforms_on_device : bool
+            Whether to apply the `batch_transforms` after the batch is sent to the device (or
+            before, on the CPU).
 
         Returns
         -------
@@ -1063,6 +1578,10 @@ class Trainer(object):
                 "`loader` must be a DataLoader object. "
                 "Got {} instead.".format(type(loader).__name__),
                 TypeError)
+        if self.is_distributed:
+            # Padding the validation shards with duplicates would bias the results
+            loader = self.get_distributed_loader(loader, pad=(name == 'train'))
+        self._limit_loader_threads(loader)
         # Check to see if the loader is actually new. This should usually be True.
         is_new_loader = loader is not self._loaders.get(name)
         self._loaders.update({name: loader})
@@ -1075,8 +1594,14 @@ class Trainer(object):
         # Trainers loaded from pickle files might not have '_loader_specs', therefore:
         if not hasattr(self, '_loader_specs'):
             setattr(self, '_loader_specs', {})
+        assert_(batch_transforms is None or callable(batch_transforms),
+                "`batch_transforms` must be callable.",
+                TypeError)
         self._loader_specs.update({name: {'num_inputs': num_inputs,
-                                          'num_targets': num_targets}})
+                                          'num_targets': num_targets,
+                                          'batch_transforms': batch_transforms,
+                                          'batch_transforms_on_device':
+                                              batch_transforms_on_device}})
         return self
 
     def get_loader_specs(self, name):
@@ -1085,11 +1610,18 @@ class Trainer(object):
                 .format(name, set(self._loader_specs.keys()))
         return self._loader_specs.get(name)
 
+    def _make_loader_iter(self, name, epoch=None):
+        loader = self._loaders[name]
+        if isinstance(loader.sampler, DistributedSampler):
+            # Reshuffle the shards every epoch
+            loader.sampler.set_epoch(self._epoch_count if epoch is None else epoch)
+        return loader.__iter__()
+
     def fetch_next_batch(self, from_loader='train', restart_exhausted_generators=True,
                          update_batch_count=True, update_epoch_count_if_generator_exhausted=True):
         # Check if the iterator is built
         if from_loader not in self._loader_iters:
-            self._loader_iters.update({from_loader: self._loaders[from_loader].__iter__()})
+            self._loader_iters.update({from_loader: self._make_loader_iter(from_loader)})
         # Try to fetch from iterator
         try:
             # Fetch
@@ -1102,7 +1634,9 @@ class Trainer(object):
         except StopIteration:
             # This if clause prevents infinite recursion if the loader is empty
             if restart_exhausted_generators:
-                self._loader_iters.update({from_loader: self._loaders[from_loader].__iter__()})
+                epoch = self._epoch_count + int(update_epoch_count_if_generator_exhausted)
+                self._loader_iters.update({from_loader: self._make_loader_iter(from_loader,
+                                                                               epoch=epoch)})
                 # Update epoch count
                 if update_epoch_count_if_generator_exhausted:
                     self.next_epoch()
@@ -1155,13 +1689,25 @@ class Trainer(object):
                 "Key {} not in loaders ({})".format(of_loader, list(self._loaders))
             of_loader = pyu.to_iterable(of_loader)
 
-        self._loader_iters.update({from_loader: self._loaders[from_loader].__iter__()
+        self._loader_iters.update({from_loader: self._make_loader_iter(from_loader)
                                    for from_loader in of_loader})
         return self
 
+    def apply_batch_transforms(self, batch, from_loader=None, on_device=True):
+        """Applies the batch transforms bound with the loader `from_loader` to `batch`."""
+        loader_spec = getattr(self, '_loader_specs', {}).get(from_loader) or {}
+        batch_transforms = loader_spec.get('batch_transforms')
+        if batch_transforms is None or \
+                loader_spec.get('batch_transforms_on_device', True) != on_device:
+            return batch
+        apply = getattr(batch_transforms, 'apply_to_collated_batch', batch_transforms)
+        return type(batch)(pyu.to_iterable(apply(*batch)))
+
     def wrap_batch(self, batch, from_loader=None, requires_grad=False):
         base_device_ordinal = \
             self._base_device_ordinal if hasattr(self, '_base_device_ordinal') else None
+        # Apply the transforms that run on the CPU
+        batch = self.apply_batch_transforms(batch, from_loader, on_device=False)
         # First, send to the right device
         if base_device_ordinal is None:
             # Both inputs and labels are sent to the device
@@ -1189,6 +1735,8 @@ class Trainer(object):
             raise ValueError("Internal Error: Invalid base_device_ordinal: {}."
                              .format(base_device_ordinal))
 
+        # Apply the transforms that run on the device
+        batch = self.apply_batch_transforms(batch, from_loader, on_device=True)
         # Cast to the right dtype and return
         batch = self.cast(batch)
         # Set gradients if required
@@ -1338,14 +1886,21 @@ class Trainer(object):
                                                                           max_num_epochs))
             # Check if it's time to validate
             if self.validate_now:
-                self.console.info("Validating.")
-                self.validate_for()
+                if self.validating_asynchronously:
+                    self.console.info("Validating asynchronously.")
+                    self.start_asynchronous_validation()
+                else:
+                    self.console.info("Validating.")
+                    self.validate_for()
             # Check if it's time to save
             if self.save_now:
                 self.console.info("Saving.")
                 self.save()
             run_num += 1
 
+        # Wait for the last asynchronous validation
+        self.poll_asynchronous_validation(wait=True)
+
         # Call callback
         self.callbacks.call(self.callbacks.END_OF_FIT,
                             max_num_iterations=max_num_iterations,
@@ -1378,7 +1933,9 @@ class Trainer(object):
             # Backprop if required
             # retain_graph option is needed for some custom
             # loss functions like malis, False per default
-            loss.backward(retain_graph=self.retain_graph)
+            scaler = self.grad_scaler
+            (loss if scaler is None else scaler.scale(loss)).backward(
+                retain_graph=self.retain_graph)
         return prediction, loss
 
     def train_for(self, num_iterations=None, break_callback=None):
@@ -1406,6 +1963,7 @@ class Trainer(object):
                                 iteration_num=iteration_num)
             # Zero out the grads
             self.optimizer.zero_grad()
+            self._gradients_unscaled = False
             # No interrupts while computing - a SIGINT could shoot down the driver if
             # done at the wrong time. Not sure if this has something to do with pinned memory
             with pyu.delayed_keyboard_interrupt():
@@ -1426,21 +1984,29 @@ class Trainer(object):
                 # TODO Make unwrap a method for folks to overload
                 error = self.metric(thu.unwrap(prediction, to_cpu=False),
                                     thu.unwrap(target, to_cpu=False))
-                self.update_state('training_error', thu.unwrap(error))
+                self.update_state('training_error', self._unwrap_state(error))
             else:
                 error = None
             # Update state from computation
-            self.update_state('training_inputs', thu.unwrap(inputs))
-            self.update_state('training_target', thu.unwrap(target))
-            self.update_state('training_prediction', thu.unwrap(prediction))
-            self.update_state('training_loss', thu.unwrap(loss))
+            self.update_state('training_inputs', self._unwrap_state(inputs))
+            self.update_state('training_target', self._unwrap_state(target))
+            self.update_state('training_prediction', self._unwrap_state(prediction))
+            self.update_state('training_loss', self._unwrap_state(loss))
             # Update state from model's state hooks
             self.update_state_from_model_state_hooks()
             # Update parameters
-            self.optimizer.step()
+            scaler = self.grad_scaler
+            if scaler is None:
+                self.optimizer.step()
+            else:
+                # This skips the step if the gradients are not finite, and adapts the scale
+                scaler.step(self.optimizer)
+                scaler.update()
             # Call callback
             self.callbacks.call(self.callbacks.END_OF_TRAINING_ITERATION,
                                 iteration_num=iteration_num)
+            # Record the results of an asynchronous validation if they're ready
+            self.poll_asynchronous_validation()
             # Prepare for next iteration
             self.next_iteration()
             # Break if validating or saving. It's important that the next_iteration() method is
@@ -1489,20 +2055,27 @@ class Trainer(object):
         # Switch to eval mode (e.g. for batchnorm, etc.)
         self.eval_mode()
 
-        if loader_name not in self._loader_iters:
-            self._loader_iters.update({loader_name: self._loaders[loader_name].__iter__()})
+        cached_batches = self.get_validation_cache(loader_name)
+        batches_are_wrapped = self.validation_cache_is_wrapped(loader_name)
+        if cached_batches is not None:
+            cached_batches = iter(cached_batches[:num_iterations])
+            num_iterations_in_generator = len(self.get_validation_cache(loader_name))
+        else:
+            if loader_name not in self._loader_iters:
+                self._loader_iters.update({loader_name: self._make_loader_iter(loader_name)})
 
-        # If we don't know num_iterations, we're validating the entire dataset - so we might as
-        # well restart the loader now
-        if num_iterations is None:
-            self.restart_generators(loader_name)
+            # If we don't know num_iterations, we're validating the entire dataset - so we
+            # might as well restart the loader now
+            if num_iterations is None:
+                self.restart_generators(loader_name)
+            num_iterations_in_generator = len(self._loader_iters[loader_name])
 
         # Record the epoch we're validating in
         self._last_validated_at_epoch = self._epoch_count
         self._last_validated_at_iteration = self._iteration_count
         self.callbacks.call(self.callbacks.BEGIN_OF_VALIDATION_RUN,
                             num_iterations=num_iterations,
-                            num_iterations_in_generator=len(self._loader_iters[loader_name]),
+                            num_iterations_in_generator=num_iterations_in_generator,
                             last_validated_at_epoch=self._last_validated_at_epoch)
 
         while True:
@@ -1513,10 +2086,13 @@ class Trainer(object):
                                 iteration_num=iteration_num)
 
             try:
-                batch = self.fetch_next_batch(loader_name,
-                                              restart_exhausted_generators=num_iterations is not None,
-                                              update_batch_count=False,
-                                              update_epoch_count_if_generator_exhausted=False)
+                if cached_batches is not None:
+                    batch = next(cached_batches)
+                else:
+                    batch = self.fetch_next_batch(
+                        loader_name, restart_exhausted_generators=num_iterations is not None,
+                        update_batch_count=False,
+                        update_epoch_count_if_generator_exhausted=False)
             except StopIteration:
                 self.console.info("{} generator exhausted, breaking.".format(loader_name))
                 break
@@ -1525,8 +2101,9 @@ class Trainer(object):
 
             # Delay SIGINTs till after computation
             with pyu.delayed_keyboard_interrupt(), torch.no_grad():
-                # Wrap
-                batch = self.wrap_batch(batch, from_loader=loader_name)
+                # Wrap (unless the cached batches already are)
+                if not batches_are_wrapped:
+                    batch = self.wrap_batch(batch, from_loader=loader_name)
                 # Separate
                 inputs, target = self.split_batch(batch, from_loader=loader_name)
                 # Apply model, compute loss
@@ -1564,6 +2141,9 @@ class Trainer(object):
 
         self.console.info("Done validating. Logging results...")
 
+        if self.is_distributed:
+            self._all_reduce_meters(validation_loss_meter, validation_error_meter)
+
         # Report
         validation_results = {
             'validation_loss': validation_loss_meter.avg,
@@ -1594,7 +2174,160 @@ class Trainer(object):
             self._is_iteration_with_best_validation_score = True
             self._best_validation_score = validation_score
 
-    def get_config(self, exclude_loader=True):
+    def start_asynchronous_validation(self, num_iterations=None, loader_name='validate'):
+        """
+        Starts validating a snapshot of the model in a background thread. See
+        `Trainer.validate_asynchronously`.
+
+        Returns
+        -------
+        Trainer
+            self.
+        """
+        if self.validation_is_pending:
+            self.console.warning("Previous validation is still running, skipping this one.")
+            return self
+        num_iterations = \
+            self._num_validation_iterations if num_iterations is None else num_iterations
+        device = (getattr(self, '_asynchronous_validation', None) or {}).get('device')
+        self._last_validated_at_epoch = self._epoch_count
+        self._last_validated_at_iteration = self._iteration_count
+        # Callbacks may change the weights to validate with (e.g. swap in averaged
+        # parameters), so they're called before the snapshot is taken
+        self.callbacks.call(self.callbacks.BEGIN_OF_VALIDATION_RUN,
+                            num_iterations=num_iterations,
+                            num_iterations_in_generator=None,
+                            last_validated_at_epoch=self._last_validated_at_epoch)
+        # Snapshot the weights, such that training can go on
+        model = copy.deepcopy(self.model).eval()
+        criterion = self.validation_criterion
+        if isinstance(criterion, torch.nn.Module):
+            criterion = copy.deepcopy(criterion)
+        if device is not None:
+            model.to(device)
+            if isinstance(criterion, torch.nn.Module):
+                criterion.to(device)
+        # The background thread gets its own copy of the settings (dtype, loader specs)
+        # and of the metric, which training may change meanwhile
+        snapshot = copy.copy(self)
+        snapshot._metric = copy.deepcopy(self._metric)
+        snapshot._loader_specs = {name: dict(loader_spec)
+                                  for name, loader_spec in self._loader_specs.items()}
+        batches = self.get_validation_cache(loader_name)
+        batches_are_wrapped = self.validation_cache_is_wrapped(loader_name)
+        if batches is None:
+            # The loader is only iterated over in the background thread
+            batches = self._loaders[loader_name]
+        batches = itertools.islice(batches, num_iterations)
+        if getattr(self, '_validation_executor', None) is None:
+            self._validation_executor = ThreadPoolExecutor(max_workers=1)
+        self._pending_validation = self._validation_executor.submit(
+            snapshot._validate_snapshot, model, criterion, batches, loader_name, device,
+            batches_are_wrapped)
+        # If the results turn out to be the best, these are the weights to save
+        self._pending_validation_state = model.state_dict()
+        return self
+
+    def _validate_snapshot(self, model, criterion, batches, loader_name, device,
+                           batches_are_wrapped=False):
+        # Runs in the background thread, on a copy of the trainer (see
+        # start_asynchronous_validation): no callbacks and no state updates here
+        validation_error_meter = tu.AverageMeter()
+        validation_loss_meter = tu.AverageMeter()
+        criterion_kwargs = {}
+        if (isinstance(criterion, torch.nn.Module) and
+                'trainer' in signature(criterion.forward).parameters):
+            criterion_kwargs['trainer'] = self
+
+        def to_device(objects):
+            if isinstance(objects, (list, tuple)):
+                return type(objects)([to_device(_object) for _object in objects])
+            return objects.to(device, non_blocking=True)
+
+        with torch.no_grad():
+            for batch in batches:
+                self.verify_batch(batch, loader_name)
+                # Like wrap_batch, but on the validation device
+                if not batches_are_wrapped:
+                    batch = self.apply_batch_transforms(batch, loader_name, on_device=False)
+                batch = self.to_device(batch) if device is None else to_device(batch)
+                if not batches_are_wrapped:
+                    batch = self.apply_batch_transforms(batch, loader_name, on_device=True)
+                batch = self.cast(batch)
+                inputs, target = self.split_batch(batch, from_loader=loader_name)
+                output = model(*inputs)
+                loss = criterion(output, target, **criterion_kwargs) if len(target) != 0 \
+                    else criterion(output, **criterion_kwargs)
+                if isinstance(target, (list, tuple)):
+                    batch_size = target[0].size(self._target_batch_dim)
+                else:
+                    batch_size = target.size(self._target_batch_dim)
+                validation_loss_meter.update(thu.unwrap(loss, extract_item=True), n=batch_size)
+                if self.metric_is_defined:
+                    validation_error = self.metric(output, target)
+                    if torch.is_tensor(validation_error):
+                        validation_error = thu.unwrap(validation_error, extract_item=True)
+                    validation_error_meter.update(validation_error, n=batch_size)
+        return validation_loss_meter, validation_error_meter
+
+    def poll_asynchronous_validation(self, wait=False):
+        """
+        Records the results of the pending asynchronous validation if it's done
+        (or when it's done, if `wait`). Returns whether results were recorded.
+        """
+        if not self.validation_is_pending:
+            return False
+        if not wait and not self._pending_validation.done():
+            return False
+        pending_validation, self._pending_validation = self._pending_validation, None
+        validated_state, self._pending_validation_state = \
+            getattr(self, '_pending_validation_state', None), None
+        # This re-raises exceptions from the background thread
+        validation_loss_meter, validation_error_meter = pending_validation.result()
+        validation_results = {
+            'validation_loss': validation_loss_meter.avg,
+            'validation_error': (validation_error_meter.avg if self.metric_is_defined else None)
+        }
+        self.record_validation_results(**validation_results)
+        # The best checkpoint gets the weights that were validated, not the current ones
+        self._best_validated_state = \
+            validated_state if self._is_iteration_with_best_validation_score else None
+        self.console.info("Validation loss: {validation_loss}; validation error: "
+                          "{validation_error}".format(**validation_results))
+        self.callbacks.call(self.callbacks.END_OF_VALIDATION_RUN,
+                            validation_loss_meter=validation_loss_meter,
+                            validation_error_meter=validation_error_meter if
+                            self.metric_is_defined else None)
+        return True
+
+    # States that hold (potentially large) tensors from the last iteration. These are
+    # never written to checkpoints.
+    TRANSIENT_STATES = {'training_inputs', 'training_target', 'training_prediction',
+                        'validation_inputs', 'validation_input', 'validation_target',
+                        'validation_prediction'}
+
+    @staticmethod
+    def _is_checkpointable_state(value):
+        # Only scalar states make it to the checkpoint
+        return value is None or \
+               isinstance(value, (bool, int, float, str)) or \
+               thu.is_scalar_tensor(value)
+
+    def get_checkpointable_state(self):
+        """Gets the trainer states that are small enough to be written to checkpoints."""
+        return {state_key: state for state_key, state in self._state.items()
+                if state_key not in self.TRANSIENT_STATES and
+                self._is_checkpointable_state(state)}
+
+    @property
+    def validation_score(self):
+        """The last averaged validation error if available, the validation loss otherwise."""
+        validation_score = self.get_state('validation_error_averaged')
+        if validation_score is None:
+            validation_score = self.get_state('validation_loss_averaged')
+        return None if validation_score is None else float(validation_score)
+
+    def get_config(self, exclude_loader=True, exclude_transient_states=True):
         # Returns a config dictionary, like __getstate__. Except optionally without the
         # data loaders (which might be yuuuuuge if it contains the data)
         config_dict = dict(self.__dict__)
@@ -1604,11 +2337,118 @@ class Trainer(object):
         if exclude_loader:
             if '_loaders' in config_dict:
                 config_dict.update({'_loaders': {}})
+        # Batch transforms are often lambdas or closures, which can't be pickled. They're
+        # bound again with the loaders.
+        if '_loader_specs' in config_dict:
+            config_dict.update({'_loader_specs': {
+                name: dict(loader_spec, batch_transforms=None)
+                for name, loader_spec in config_dict['_loader_specs'].items()}})
+        # Compiled models can't be pickled, they are recompiled when needed
+        if '_compiled_model' in config_dict:
+            config_dict.update({'_compiled_model': None})
+        # Neither can threads, and the cached validation batches can be huge
+        if '_validation_executor' in config_dict:
+            config_dict.update({'_validation_executor': None, '_pending_validation': None,
+                                '_validation_cache': {}, '_wrapped_validation_caches': set(),
+                                '_pending_validation_state': None,
+                                '_best_validated_state': None})
+        # Neither can the DDP wrapper. Distributed training needs to be set up again
+        # (with Trainer.distributed) when resuming, which set_config reminds of.
+        if '_distributed_model' in config_dict:
+            config_dict.update({'_distributed': False, '_distributed_model': None,
+                                '_saved_distributed': self.is_distributed})
+        # The schedule (of the trainer and the callbacks) is rebuilt when needed
+        if '_schedule' in config_dict:
+            config_dict.update({'_schedule': None})
+        # The cores belong to this process
+        if '_available_cores' in config_dict:
+            config_dict.update({'_available_cores': None})
+        # The last inputs, targets and predictions can be as large as the data itself.
+        if exclude_transient_states and '_state' in config_dict:
+            config_dict.update({'_state': self.get_checkpointable_state()})
         return config_dict
 
+    CHECKPOINT_FORMAT_VERSION = 1
+
+    def get_state_dict_checkpoint(self, exclude_loader=True):
+        """
+        Builds a checkpoint where the model and optimizer are represented by their
+        `state_dict`s (as opposed to pickled objects).
+
+        Parameters
+        ----------
+        exclude_loader : bool
+            Whether to exclude the data loaders from the checkpoint.
+
+        Returns
+        -------
+        dict
+            The checkpoint.
+        """
+        trainer_config = self.get_config(exclude_loader=exclude_loader)
+        model = trainer_config.pop('_model', None)
+        optimizer = trainer_config.pop('_optimizer', None)
+        checkpoint = {'inferno_checkpoint_version': self.CHECKPOINT_FORMAT_VERSION,
+                      'model_state_dict': (model.state_dict() if model is not None else None),
+                      'optimizer_state_dict': (optimizer.state_dict()
+                                               if optimizer is not None else None),
+                      'trainer_config': trainer_config}
+        return checkpoint
+
+    @classmethod
+    def is_state_dict_checkpoint(cls, checkpoint):
+        return isinstance(checkpoint, dict) and 'inferno_checkpoint_version' in checkpoint
+
+    def set_state_dict_checkpoint(self, checkpoint):
+        """
+        Restores the trainer from a checkpoint built by `get_state_dict_checkpoint`.
+        The model must already be bound to the trainer. The optimizer state is
+        restored only if an optimizer is bound.
+
+        Parameters
+        ----------
+        checkpoint : dict
+            The checkpoint.
+
+        Returns
+        -------
+        Trainer
+            self
+        """
+        version = checkpoint.get('inferno_checkpoint_version')
+        assert_(version <= self.CHECKPOINT_FORMAT_VERSION,
+                f"Checkpoint format version {version} is not supported by this version "
+                f"of inferno (supports up to {self.CHECKPOINT_FORMAT_VERSION}).",
+                ValueError)
+        model_state_dict = checkpoint.get('model_state_dict')
+        optimizer_state_dict = checkpoint.get('optimizer_state_dict')
+        if model_state_dict is not None:
+            assert_(self.model_is_defined,
+                    "The model must be bound to the trainer before loading "
+                    "a 'state_dict' checkpoint.", NotSetError)
+            self.model.load_state_dict(model_state_dict)
+        if optimizer_state_dict is not None:
+            if self.optimizer_is_defined:
+                self.optimizer.load_state_dict(optimizer_state_dict)
+            else:
+                self.console.warning("Optimizer is not set, ignoring the optimizer state "
+                                     "found in checkpoint.")
+        self.set_config(checkpoint.get('trainer_config', {}))
+        return self
+
     def set_config(self, config_dict):
         # TODO some sanity checks on config_dict (e.g. whether the model is actually a model, etc)
+        config_dict = dict(config_dict)
+        saved_distributed = config_dict.pop('_saved_distributed', False)
+        if self.is_distributed:
+            # Keep training distributed (checkpoints never are, see get_config)
+            for key in ['_distributed', '_distributed_options', '_distributed_model']:
+                config_dict.pop(key, None)
         self.__dict__.update(config_dict)
+        if saved_distributed and not self.is_distributed:
+            self.console.warning("The checkpoint was saved during distributed training. Call "
+                                 "`Trainer.distributed` to resume training distributed, "
+                                 "otherwise training continues in a single process.")
         # Rebind trainer to callback engine
         self.callbacks.bind_trainer(self)
         # Have callback engine rebind all callbacks to trainer
@@ -1619,6 +2459,11 @@ class Trainer(object):
         # Log the epoch for save_now
         self._last_saved_at_epoch = self._epoch_count
 
+        if not self.is_main_process:
+            # Only the main process writes checkpoints
+            self._is_iteration_with_best_validation_score = False
+            return self
+
         self.callbacks.call(self.callbacks.BEGIN_OF_SAVE,
                             save_to_directory=self._save_to_directory,
                             epoch_count=self._epoch_count,
@@ -1632,9 +2477,8 @@ class Trainer(object):
                                             self._best_checkpoint_filename)
 
         # Save the state dictionary
-        torch.save(self.get_config(exclude_loader=exclude_loader),
-                   checkpoint_path,
-                   pickle_module=self.pickle_module)
+        checkpoint_filename = self._checkpoint_filename
+        self._write_checkpoint(checkpoint_filename, exclude_loader=exclude_loader)
 
         self.callbacks.call(self.callbacks.END_OF_SAVE,
                             save_to_directory=self._save_to_directory,
@@ -1645,16 +2489,59 @@ class Trainer(object):
                             iteration_count=self._iteration_count,
                             is_iteration_with_best_validation_score=self._is_iteration_with_best_validation_score)
 
+        best_validated_state = getattr(self, '_best_validated_state', None)
+        self._best_validated_state = None
         if self._is_iteration_with_best_validation_score and stash_best_checkpoint:
             # Do the stashin'
-            shutil.copyfile(checkpoint_path, best_checkpoint_path)
+            if best_validated_state is not None:
+                # The best score is from an asynchronous validation, which validated other
+                # weights than the current ones
+                live_state = {name: tensor.detach().clone()
+                              for name, tensor in self.model.state_dict().items()}
+                self.model.load_state_dict(best_validated_state)
+                try:
+                    self._write_checkpoint(self._best_checkpoint_filename,
+                                           exclude_loader=exclude_loader)
+                finally:
+                    self.model.load_state_dict(live_state)
+            elif self.checkpoint_format == 'sharded':
+                # Only the manifest is copied, the tensors are shared
+                self.get_checkpoint_store().copy(checkpoint_filename,
+                                                 self._best_checkpoint_filename)
+            else:
+                shutil.copyfile(checkpoint_path, best_checkpoint_path)
+
+        if self.checkpoint_format == 'sharded':
+            # Get rid of the tensors that are no longer referenced by any checkpoint
+            self.get_checkpoint_store().collect_garbage()
 
         # This is required to prevent an infinite save loop?
         self._is_iteration_with_best_validation_score = False
         self.console.info("Saved to {}.".format(self._save_to_directory))
         return self
 
+    def _write_checkpoint(self, filename, exclude_loader=True):
+        if self.checkpoint_format == 'sharded':
+            self.get_checkpoint_store().save(
+                self.get_state_dict_checkpoint(exclude_loader=exclude_loader),
+                filename, score=self.validation_score)
+        else:
+            if self.checkpoint_format == 'state_dict':
+                checkpoint = self.get_state_dict_checkpoint(exclude_loader=exclude_loader)
+            else:
+                checkpoint = self.get_config(exclude_loader=exclude_loader)
+            torch.save(checkpoint, os.path.join(self._save_to_directory, filename),
+                       pickle_module=self.pickle_module)
+
+    def get_checkpoint_store(self, directory=None):
+        """Gets the store for 'sharded' checkpoints (in the save directory by default)."""
+        directory = self._save_to_directory if directory is None else directory
+        assert_(directory is not None, "No directory for the checkpoint store.", NotSetError)
+        return ShardedCheckpointStore(directory, pickle_module=self.pickle_module)
+
     def save_model(self, to_directory=None):
+        if not self.is_main_process:
+            return self
         to_directory = self._save_to_directory if to_directory is None else to_directory
         # Save the state dictionary
         torch.save(self.model,
@@ -1662,9 +2549,12 @@ class Trainer(object):
                    pickle_module=self.pickle_module)
         return self
 
-    def load(self, from_directory=None, best=False, filename=None, map_location=None):
+    def load(self, from_directory=None, best=False, filename=None, map_location=None,
+             mmap=None):
         """
-        Load the trainer from checkpoint.
+        Load the trainer from checkpoint. Both checkpoint formats ('pickle' and
+        'state_dict', see `Trainer.set_checkpoint_format`) are supported; the format
+        is inferred from the checkpoint.
 
         Parameters
         ----------
@@ -1676,8 +2566,11 @@ class Trainer(object):
             'best_checkpoint.pytorch'.
         filename : str
             Overrides the default filename.
-        device : function, torch.device, string or a dict
+        map_location : function, torch.device, string or a dict
             Specify how to remap storage locations.
+        mmap : bool
+            Whether to memory-map the checkpoint file instead of reading it to memory in
+            its entirety. Tensors are then only read from disk when they're accessed.
 
         Returns
         -------
@@ -1689,14 +2582,23 @@ class Trainer(object):
         # Get file name
         if filename is None:
             filename = self._best_checkpoint_filename if best else self._checkpoint_filename
+        load_kwargs = {} if mmap is None else {'mmap': mmap}
         # Load the dictionary
         config_dict = torch.load(os.path.join(from_directory, filename),
-                                 pickle_module=self.pickle_module, map_location=map_location)
+                                 pickle_module=self.pickle_module, map_location=map_location,
+                                 **load_kwargs)
+
+        if ShardedCheckpointStore.is_manifest(config_dict):
+            config_dict = self.get_checkpoint_store(from_directory)\
+                .load_manifest(config_dict, map_location=map_location, mmap=mmap)
 
         # This is required to prevent an infinite save loop?
         self._is_iteration_with_best_validation_score = False
         # Set config
-        self.set_config(config_dict)
+        if self.is_state_dict_checkpoint(config_dict):
+            self.set_state_dict_checkpoint(config_dict)
+        else:
+            self.set_config(config_dict)
         return self
 
     def load_model(self, from_directory=None, filename=None):
@@ -100,10 +100,19 @@ class CallbackEngine(object):
                 if bind_trainer_to_callback:
                     callback.bind_trainer(self._trainer)
 
+    @property
+    def is_main_process(self):
+        return not self.trainer_is_bound or getattr(self._trainer, 'is_main_process', True)
+
     def call(self, trigger, **kwargs):
         assert trigger in self.TRIGGERS
         kwargs.update({'trigger': trigger})
+        is_main_process = self.is_main_process
         for callback in self._callback_registry.get(trigger):
+            # In distributed training, some callbacks (e.g. loggers) only run in
+            # the main process
+            if getattr(callback, 'rank_zero_only', False) and not is_main_process:
+                continue
             callback(**kwargs)
 
     def get_config(self):
@@ -124,7 +133,14 @@ class CallbackEngine(object):
 
 
 class Callback(object):
-    """Recommended (but not required) base class for callbacks."""
+    """
+    Recommended (but not required) base class for callbacks.
+
+    Set `rank_zero_only` to True for callbacks that should only be called in the main
+    process of distributed training.
+    """
+    rank_zero_only = False
+
     def __init__(self):
         self._trainer = None
         self._debugging = False
@@ -177,6 +193,25 @@ class Callback(object):
     def __setstate__(self, state):
         self.set_config(state)
 
+    def frequency_matches(self, name, frequency, persistent=False, match_zero=True):
+        """
+        Matches `frequency` against the trainer's iteration and epoch counts, like
+        `Frequency.match` does, but through the trainer's schedule (where it's registered
+        under `name`, which must be unique for this callback).
+        """
+        trainer = self._trainer
+        # This is called in every iteration, so we skip the property if the schedule
+        # is already built
+        schedule = getattr(trainer, '_schedule', None) or getattr(trainer, 'schedule', None)
+        if schedule is None:
+            return frequency.match(iteration_count=trainer.iteration_count,
+                                   epoch_count=trainer.epoch_count,
+                                   persistent=persistent, match_zero=match_zero)
+        # (Positional arguments are a little faster)
+        return schedule.fires((type(self).__name__, id(self), name), frequency,
+                              trainer.iteration_count, trainer.epoch_count,
+                              persistent, match_zero)
+
     def toggle_debug(self):
         self._debugging = not self._debugging
         return self
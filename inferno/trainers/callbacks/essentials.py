@@ -1,8 +1,10 @@
+from contextlib import contextmanager
 import numpy as np
 import os
-import h5py as h5
+import torch
 from ...utils import torch_utils as tu
-from ...utils.train_utils import Frequency
+from ...utils.train_utils import Frequency, ScalarAccumulator
+from ...utils.checkpoint_utils import apply_retention_policy
 from ...utils.exceptions import assert_, FrequencyValueError, NotUnwrappableError
 from ...utils import python_utils as pyu
 from .base import Callback
@@ -10,19 +12,68 @@ import gc
 
 
 class NaNDetector(Callback):
+    """
+    Raises a RuntimeError if the training loss is not finite.
+
+    The losses are checked on the device, and the result is only fetched (which
+    synchronizes with the device) every `check_every` iterations and at the end of every
+    training run. The error is then raised at the first check after the fault.
+    """
+    def __init__(self, check_every=1):
+        super(NaNDetector, self).__init__()
+        assert_(isinstance(check_every, int) and check_every > 0,
+                "`check_every` must be a positive integer, got {}.".format(check_every),
+                ValueError)
+        self.check_every = check_every
+        self._accumulator = ScalarAccumulator()
+
+    def check(self):
+        accumulator = getattr(self, '_accumulator', None)
+        summary = accumulator.flush() if accumulator is not None else None
+        if summary is None or summary['all_finite']:
+            return
+        if summary['count'] == 1:
+            raise RuntimeError("Loss is not finite (loss={})!".format(summary['last']))
+        raise RuntimeError("Loss is not finite in (at least) one of the last {} iterations "
+                           "(last loss={}, mean loss={})!"
+                           .format(summary['count'], summary['last'], summary['mean']))
+
     def end_of_training_iteration(self, **_):
         training_loss = self.trainer.get_state('training_loss')
-        # Extract scalar
-        if tu.is_tensor(training_loss):
-            training_loss = tu.unwrap(training_loss, extract_item=True)
-        if not np.isfinite(training_loss):
-            raise RuntimeError("Loss is not finite (loss={})!".format(training_loss))
+        if not hasattr(self, '_accumulator'):
+            # Instances from old checkpoints
+            self._accumulator = ScalarAccumulator()
+        self._accumulator.update(training_loss)
+        if self._accumulator.count >= getattr(self, 'check_every', 1):
+            self.check()
+
+    def end_of_training_run(self, **_):
+        self.check()
 
 
 class PersistentSave(Callback):
-    def __init__(self, template='checkpoint.pytorch.epoch{epoch_count}.iteration{iteration_count}'):
+    """
+    Keeps every checkpoint (instead of overwriting the previous one) by saving to
+    a file name built from `template`. The trainer's checkpoint file name is symlinked
+    to the most recent checkpoint.
+
+    If `keep_last` and/or `keep_best` are given, only the `keep_last` most recent and
+    the `keep_best` best scoring (by validation score) checkpoints are retained. With the
+    'sharded' checkpoint format (see `Trainer.set_checkpoint_format`), tensors no longer
+    referenced by any retained checkpoint are deleted as well.
+    """
+    def __init__(self, template='checkpoint.pytorch.epoch{epoch_count}.iteration{iteration_count}',
+                 keep_last=None, keep_best=None):
         super(PersistentSave, self).__init__()
+        assert_(keep_last is None or keep_last >= 1,
+                "`keep_last` must be at least 1, got {}.".format(keep_last), ValueError)
+        assert_(keep_best is None or keep_best >= 0,
+                "`keep_best` must be non-negative, got {}.".format(keep_best), ValueError)
         self.template = template
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        # List of [checkpoint filename, validation score]
+        self._saved_checkpoints = []
 
     def begin_of_save(self, **kwargs):
         self._orig_checkpoint_filename = self.trainer._checkpoint_filename
@@ -35,14 +86,89 @@ class PersistentSave(Callback):
             os.remove(orig_checkpoint_path)
         os.symlink(self.trainer._checkpoint_filename, orig_checkpoint_path)
 
+        # Callbacks loaded from old checkpoints might not have '_saved_checkpoints'
+        saved_checkpoints = getattr(self, '_saved_checkpoints', [])
+        self._saved_checkpoints = [entry for entry in saved_checkpoints
+                                   if entry[0] != self.trainer._checkpoint_filename]
+        self._saved_checkpoints.append([self.trainer._checkpoint_filename,
+                                        self.trainer.validation_score])
+        self.apply_retention(save_to_directory)
+
         self.trainer._checkpoint_filename = self._orig_checkpoint_filename
 
+    def apply_retention(self, save_to_directory):
+        keep_last = getattr(self, 'keep_last', None)
+        keep_best = getattr(self, 'keep_best', None)
+        if keep_last is None and keep_best is None:
+            return
+        # The most recent checkpoint is always kept, because it's symlinked to
+        keep_last = max(keep_last or 1, 1)
+        if self.trainer.checkpoint_format == 'sharded':
+            # The store knows the scores and deletes the tensors no longer referenced
+            store = self.trainer.get_checkpoint_store(save_to_directory)
+            removed = store.apply_retention(keep_last=keep_last, keep_best=keep_best,
+                                            among=[filename for filename, _
+                                                   in self._saved_checkpoints])
+        else:
+            def remove(filename):
+                path = os.path.join(save_to_directory, filename)
+                if os.path.lexists(path):
+                    os.remove(path)
+            removed = apply_retention_policy(self._saved_checkpoints, remove,
+                                             keep_last=keep_last, keep_best=keep_best)
+        self._saved_checkpoints = [entry for entry in self._saved_checkpoints
+                                   if entry[0] not in removed]
+
 
 class DumpHDF5Every(Callback):
-    """Dumps intermediate training states to a HDF5 file."""
-    def __init__(self, frequency, to_directory,
-                 filename_template='dump.{mode}.epoch{epoch_count}.iteration{iteration_count}.h5',
-                 force_dump=False, dump_after_every_validation_run=False):
+    """
+    Dumps intermediate training states to HDF5 files.
+
+    By default, every dump is written to a new file. With `append=True`, all dumps (of a
+    mode, i.e. training or validation) go to one file instead, where every state is a
+    chunked dataset with one row per dump. The rows are indexed by the
+    datasets 'iterations' and 'epochs', and 'shapes/<state>' holds the shape of every row
+    (states that change shape are zero-padded). See `DumpHDF5Every.load_dump`.
+
+    With `asynchronous=True`, the states are copied off the device without blocking and
+    written from a background thread. The datasets can be compressed with `compression`
+    (e.g. 'gzip'), which is off by default.
+    """
+    DEFAULT_FILENAME_TEMPLATE = 'dump.{mode}.epoch{epoch_count}.iteration{iteration_count}.h5'
+    DEFAULT_APPEND_FILENAME_TEMPLATE = 'dump.{mode}.h5'
+
+    def __init__(self, frequency, to_directory, filename_template=None,
+                 force_dump=False, dump_after_every_validation_run=False,
+                 append=False, asynchronous=False, compression=None, compression_opts=None,
+                 max_queue_size=4):
+        """
+        Parameters
+        ----------
+        frequency : str or tuple or inferno.utils.train_utils.Frequency
+            How often to dump while training.
+        to_directory : str
+            Directory to dump to.
+        filename_template : str
+            Template for the file names, which may contain '{mode}', '{epoch_count}' and
+            '{iteration_count}'. Defaults to `DEFAULT_FILENAME_TEMPLATE`, or to
+            `DEFAULT_APPEND_FILENAME_TEMPLATE` if `append`.
+        force_dump : bool
+            Whether to raise if a state can't be dumped (instead of skipping it).
+        dump_after_every_validation_run : bool
+            Whether to dump the validation states after every validation run.
+        append : bool
+            Whether to append all dumps to one file (per mode).
+        asynchronous : bool
+            Whether to write from a background thread.
+        compression : str
+            HDF5 compression filter (e.g. 'gzip' or 'lzf'). Defaults to None, i.e. no
+            compression.
+        compression_opts : int
+            Options for the compression filter (e.g. the gzip level).
+        max_queue_size : int
+            Maximum number of pending dumps when `asynchronous`. Dumping blocks while the
+            queue is full.
+        """
         super(DumpHDF5Every, self).__init__()
         # Privates
         self._dump_every = None
@@ -53,12 +179,22 @@ class DumpHDF5Every(Callback):
                                                               'validation_target',
                                                               'validation_prediction'}
         self._dump_cache = {}
+        self._worker = None
+        self._h5_files = {}
         # Publics
         self.dump_every = frequency
         self.dump_directory = to_directory
+        if filename_template is None:
+            filename_template = self.DEFAULT_APPEND_FILENAME_TEMPLATE if append else \
+                self.DEFAULT_FILENAME_TEMPLATE
         self.dump_filename_template = filename_template
         self.force_dump = force_dump    # hihi
         self.dump_after_every_validation_run = dump_after_every_validation_run
+        self.append = append
+        self.asynchronous = asynchronous
+        self.compression = compression
+        self.compression_opts = compression_opts
+        self.max_queue_size = max_queue_size
 
     @property
     def dump_every(self):
@@ -73,9 +209,7 @@ class DumpHDF5Every(Callback):
 
     @property
     def dump_now(self):
-        return self.dump_every.match(iteration_count=self.trainer.iteration_count,
-                                     epoch_count=self.trainer.epoch_count,
-                                     persistent=True, match_zero=True)
+        return self.frequency_matches('dump', self.dump_every, persistent=True)
 
     def add_to_dump_cache(self, key, value):
         if pyu.is_listlike(value):
@@ -128,21 +262,135 @@ class DumpHDF5Every(Callback):
                                                       mode=mode)
         return os.path.join(self.dump_directory, filename)
 
+    @property
+    def worker(self):
+        if getattr(self, '_worker', None) is None:
+            self._worker = pyu.BackgroundWorker(max_queue_size=getattr(self, 'max_queue_size', 4),
+                                                name=type(self).__name__)
+        return self._worker
+
+    def _copy_to_host(self, to_dump):
+        # Returns the host copy and (for asynchronous copies from the GPU) the event to
+        # wait for before it can be read
+        if tu.is_tensor(to_dump):
+            to_dump = to_dump.detach()
+            if to_dump.is_cuda and getattr(self, 'asynchronous', False):
+                host_copy = torch.empty(to_dump.shape, dtype=to_dump.dtype, pin_memory=True)
+                host_copy.copy_(to_dump, non_blocking=True)
+                copied = torch.cuda.Event()
+                copied.record()
+                return host_copy, copied
+        return tu.unwrap(to_dump, as_numpy=True), None
+
     def dump(self, mode):
-        with h5.File(name=self.get_file_path(mode), mode='w') as h5_file:
-            for key, to_dump in self._dump_cache.items():
-                if to_dump is None:
+        to_write = {}
+        for key, to_dump in self._dump_cache.items():
+            if to_dump is None:
+                continue
+            try:
+                to_write[key] = self._copy_to_host(to_dump)
+            except NotUnwrappableError:
+                # Can't unwrap to_dump, but let's not throw a tantrum if we're not required to
+                if not self.force_dump:
                     continue
-                try:
-                    to_dump = tu.unwrap(to_dump, as_numpy=True)
-                except NotUnwrappableError:
-                    # Can't unwrap to_dump, but let's not throw a tantrum if we're not required to
-                    if not self.force_dump:
-                        continue
-                    else:
-                        raise
-                # Do the dumpin'
-                h5_file.create_dataset(name=key, data=to_dump)
+                else:
+                    raise
+        file_path = self.get_file_path(mode)
+        counts = {'iteration_count': self.trainer.iteration_count,
+                  'epoch_count': self.trainer.epoch_count}
+        if getattr(self, 'asynchronous', False):
+            self.worker.submit(self._write, file_path, to_write, **counts)
+        else:
+            self._write(file_path, to_write, **counts)
+
+    def _write(self, file_path, to_write, iteration_count, epoch_count):
+        arrays = {}
+        for key, (to_dump, copied) in to_write.items():
+            if copied is not None:
+                copied.synchronize()
+            arrays[key] = to_dump.numpy() if tu.is_tensor(to_dump) else np.asarray(to_dump)
+        if getattr(self, 'append', False):
+            h5_file = self._get_h5_file(file_path)
+            row = h5_file['iterations'].shape[0] if 'iterations' in h5_file else 0
+            self._write_row(h5_file, 'iterations', np.array(iteration_count, dtype='int64'), row)
+            self._write_row(h5_file, 'epochs', np.array(epoch_count, dtype='int64'), row)
+            for key, array in arrays.items():
+                self._write_row(h5_file, key, array, row)
+                self._write_row(h5_file, 'shapes/{}'.format(key),
+                                np.array(array.shape, dtype='int64'), row)
+            h5_file.flush()
+        else:
+            import h5py as h5
+            with h5.File(name=file_path, mode='w') as h5_file:
+                for key, array in arrays.items():
+                    # Do the dumpin'
+                    h5_file.create_dataset(name=key, data=array,
+                                           **self._get_compression_kwargs(array))
+
+    def _get_compression_kwargs(self, array):
+        compression = getattr(self, 'compression', None)
+        if compression is None or array.ndim == 0:
+            # Scalars can't be chunked (or compressed)
+            return {}
+        return {'compression': compression,
+                'compression_opts': getattr(self, 'compression_opts', None)}
+
+    def _get_h5_file(self, file_path):
+        import h5py as h5
+        if getattr(self, '_h5_files', None) is None:
+            self._h5_files = {}
+        if file_path not in self._h5_files:
+            self._h5_files[file_path] = h5.File(file_path, mode='a')
+        return self._h5_files[file_path]
+
+    def _write_row(self, h5_file, name, array, row):
+        if name not in h5_file:
+            # One chunk per row, such that rows are read (and decompressed) individually
+            h5_file.create_dataset(name, shape=(0,) + array.shape,
+                                   maxshape=(None,) * (array.ndim + 1), dtype=array.dtype,
+                                   chunks=(1,) + tuple(max(size, 1) for size in array.shape),
+                                   **self._get_compression_kwargs(np.empty((1,))))
+        dataset = h5_file[name]
+        assert_(dataset.ndim == array.ndim + 1,
+                "Can't append a {}D array to the dataset '{}' of {}D arrays."
+                .format(array.ndim, name, dataset.ndim - 1), ValueError)
+        dataset.resize((row + 1,) + tuple(max(dataset_size, size) for dataset_size, size in
+                                          zip(dataset.shape[1:], array.shape)))
+        dataset[(row,) + tuple(slice(0, size) for size in array.shape)] = array
+
+    @staticmethod
+    def load_dump(file_path, key, iteration_count):
+        """
+        Reads the state `key` dumped at `iteration_count` from a file written with
+        `append=True`.
+        """
+        import h5py as h5
+        with h5.File(file_path, mode='r') as h5_file:
+            rows = np.flatnonzero(h5_file['iterations'][:] == iteration_count)
+            assert_(rows.size > 0, "Nothing was dumped at iteration {}.".format(iteration_count),
+                    KeyError)
+            # The last dump at that iteration
+            row = rows[-1]
+            shape = h5_file['shapes/{}'.format(key)][row]
+            return h5_file[key][(row,) + tuple(slice(0, size) for size in shape)]
+
+    def flush(self):
+        """Blocks till all pending dumps are written, and closes the files."""
+        if getattr(self, '_worker', None) is not None:
+            self._worker.join()
+        for h5_file in getattr(self, '_h5_files', {}).values():
+            h5_file.close()
+        self._h5_files = {}
+        return self
+
+    def end_of_fit(self, **_):
+        self.flush()
+
+    def get_config(self):
+        config_dict = super(DumpHDF5Every, self).get_config()
+        # Neither threads nor open files can be pickled
+        config_dict.update({'_worker': None, '_h5_files': {}})
+        return config_dict
 
     def end_of_training_iteration(self, **_):
         dump_now = self.dump_now
@@ -221,40 +469,252 @@ class SaveAtBestValidationScore(Callback):
 
 
 class ParameterEMA(Callback):
-    """Maintain a moving average of network parameters."""
-    def __init__(self, momentum):
+    """
+    Maintain a moving average of network parameters.
+
+    The parameters are grouped by device and dtype, and each group is updated with a
+    single fused (`torch._foreach_*`) operation. The averages can be kept on the CPU
+    (`offload=True`) to save device memory; the parameters are then copied over
+    asynchronously and folded into the average at the next update (or when the
+    average is used).
+
+    Use `ParameterEMA.swapped` to temporarily load the averaged parameters into the
+    model, or set `validate_with_ema` to have every validation run use them. The
+    averages are saved with the trainer checkpoint (see `ParameterEMA.state_dict`).
+    """
+    def __init__(self, momentum, update_every=1, offload=False, validate_with_ema=False):
         """
         Parameters
         ----------
         momentum : float
             Momentum for the moving average. The following holds:
             `new_moving_average = momentum * old_moving_average + (1 - momentum) * value`
+        update_every : int
+            Update the moving average every `update_every` training iterations. Note that
+            the momentum applies per update.
+        offload : bool
+            Whether to keep the moving average on the CPU.
+        validate_with_ema : bool
+            Whether to validate with the averaged parameters (the live parameters are
+            restored after validation).
         """
         super(ParameterEMA, self).__init__()
+        assert_(0. <= momentum <= 1., "Momentum must be in [0, 1], got {}.".format(momentum),
+                ValueError)
+        assert_(isinstance(update_every, int) and update_every > 0,
+                "`update_every` must be a positive integer, got {}.".format(update_every),
+                ValueError)
         # Privates
         self._parameters = None
+        self._staged_parameters = None
+        self._pending_copy = None
+        self._live_parameters = None
+        self._num_updates = 0
         # Publics
         self.momentum = momentum
+        self.update_every = update_every
+        self.offload = offload
+        self.validate_with_ema = validate_with_ema
+
+    def _model_parameters(self):
+        return [p.data for p in self.trainer.model.parameters()]
+
+    @staticmethod
+    def _grouped(*tensor_lists):
+        # Group the indices by (device, dtype) of the first list, such that the foreach
+        # ops get tensors they can fuse
+        groups = {}
+        for index, tensor in enumerate(tensor_lists[0]):
+            groups.setdefault((tensor.device, tensor.dtype), []).append(index)
+        for indices in groups.values():
+            yield tuple([tensor_list[index] for index in indices]
+                        for tensor_list in tensor_lists)
+
+    def _storage_device(self, parameter):
+        return torch.device('cpu') if self.offload else parameter.device
+
+    def _initialize(self, parameters):
+        self._parameters = []
+        for parameter in parameters:
+            # Pinned memory makes the non-blocking copies from the device possible
+            ema = torch.empty(parameter.shape, dtype=parameter.dtype,
+                              device=self._storage_device(parameter),
+                              pin_memory=self.offload and parameter.is_cuda)
+            self._parameters.append(ema.copy_(parameter))
+        self._staged_parameters = None
+        self._pending_copy = None
+
+    def _lerp_(self, ema, values):
+        for ema_group, values_group in self._grouped(ema, values):
+            if hasattr(torch, '_foreach_lerp_'):
+                torch._foreach_lerp_(ema_group, values_group, 1. - self.momentum)
+            else:
+                torch._foreach_mul_(ema_group, self.momentum)
+                torch._foreach_add_(ema_group, values_group, alpha=1. - self.momentum)
+
+    def _finish_pending_update(self):
+        if self._pending_copy is None:
+            return
+        self._pending_copy.synchronize()
+        self._pending_copy = None
+        self._lerp_(self._parameters, self._staged_parameters)
+
+    def _check_devices(self, parameters):
+        # Checkpoints might have been loaded to another device
+        for index, (ema, parameter) in enumerate(zip(self._parameters, parameters)):
+            if ema.device != self._storage_device(parameter):
+                self._parameters[index] = ema.to(self._storage_device(parameter))
 
     def maintain(self):
+        """Updates the moving average with the current model parameters."""
+        parameters = self._model_parameters()
         if self._parameters is None:
-            self._parameters = [p.data.new().zero_() for p in self.trainer.model.parameters()]
-        for p_model, p_ema in zip(self.trainer.model.parameters(), self._parameters):
-            p_ema.mul_(self.momentum).add_(p_model.data.mul(1. - self.momentum))
+            self._initialize(parameters)
+            self._num_updates = 1
+            return
+        assert_(len(parameters) == len(self._parameters),
+                "Model has {} parameters, but the moving average has {}."
+                .format(len(parameters), len(self._parameters)), RuntimeError)
+        self._check_devices(parameters)
+        self._finish_pending_update()
+        if self.offload and any(p.is_cuda for p in parameters):
+            # Copy to the pinned staging buffers without blocking, and fold them into the
+            # average when the copy is done (empty_like wouldn't pin them)
+            if self._staged_parameters is None:
+                self._staged_parameters = [torch.empty(ema.shape, dtype=ema.dtype,
+                                                       pin_memory=True)
+                                           for ema in self._parameters]
+            for staged, parameter in zip(self._staged_parameters, parameters):
+                staged.copy_(parameter, non_blocking=True)
+            self._pending_copy = torch.cuda.Event()
+            self._pending_copy.record()
+        else:
+            self._lerp_(self._parameters, parameters)
+        self._num_updates += 1
+
+    @property
+    def num_updates(self):
+        return getattr(self, '_num_updates', 0)
+
+    @property
+    def parameters(self):
+        """The averaged parameters (a list of tensors, in the order of `model.parameters()`)."""
+        assert_(self._parameters is not None,
+                "Can't get parameter EMA's: not available.",
+                ValueError)
+        self._finish_pending_update()
+        return self._parameters
 
     def apply(self):
+        """Overwrites the model parameters with the averaged parameters."""
         assert_(self._parameters is not None,
                 "Can't apply parameter EMA's: not available.",
                 ValueError)
-        for p_model, p_ema in zip(self.trainer.model.parameters(), self._parameters):
-            p_model.data.copy_(p_ema)
+        for parameter, ema in zip(self._model_parameters(), self.parameters):
+            parameter.copy_(ema, non_blocking=True)
+        return self
+
+    def swap_in(self):
+        """Loads the averaged parameters into the model, keeping the live ones aside."""
+        assert_(self._live_parameters is None, "Parameter EMA's are already swapped in.",
+                RuntimeError)
+        self._live_parameters = [p.clone() for p in self._model_parameters()]
+        return self.apply()
+
+    def swap_out(self):
+        """Restores the live parameters swapped out by `swap_in`."""
+        if self._live_parameters is None:
+            return self
+        for parameter, live_parameter in zip(self._model_parameters(), self._live_parameters):
+            parameter.copy_(live_parameter)
+        self._live_parameters = None
+        return self
+
+    @property
+    def is_swapped_in(self):
+        return getattr(self, '_live_parameters', None) is not None
+
+    @contextmanager
+    def swapped(self):
+        """
+        Context manager to use the averaged parameters in the model, e.g.
+
+        >>> with ema.swapped():
+        ...     trainer.validate_for()
+        """
+        self.swap_in()
+        try:
+            yield self
+        finally:
+            self.swap_out()
+
+    def state_dict(self):
+        return {'momentum': self.momentum,
+                'num_updates': self.num_updates,
+                'parameters': (None if self._parameters is None else
+                               [ema.cpu() for ema in self.parameters])}
+
+    def load_state_dict(self, state_dict):
+        self.momentum = state_dict['momentum']
+        self._num_updates = state_dict['num_updates']
+        self._parameters = state_dict['parameters']
+        self._staged_parameters = None
+        self._pending_copy = None
+        if self._parameters is not None and self.trainer is not None:
+            self._check_devices(self._model_parameters())
+        return self
+
+    def get_config(self):
+        config_dict = super(ParameterEMA, self).get_config()
+        # CUDA events and staging buffers are not checkpointed, and the live parameters
+        # are the ones the model is saved with
+        config_dict.update({'_staged_parameters': None, '_pending_copy': None,
+                            '_live_parameters': None, '_parameters': None,
+                            '_ema_state': self.state_dict()})
+        return config_dict
+
+    def set_config(self, config_dict):
+        config_dict = dict(config_dict)
+        ema_state = config_dict.pop('_ema_state', None)
+        super(ParameterEMA, self).set_config(config_dict)
+        if ema_state is not None:
+            self.load_state_dict(ema_state)
+        return self
 
     def end_of_training_iteration(self, **_):
-        self.maintain()
+        if self.trainer.iteration_count % self.update_every == 0:
+            self.maintain()
+
+    def begin_of_validation_run(self, **_):
+        if self.validate_with_ema and self._parameters is not None:
+            self.swap_in()
+
+    def end_of_validation_run(self, **_):
+        self.swap_out()
+
+    def begin_of_training_iteration(self, **_):
+        # Asynchronous validation runs snapshot the model (with the averaged parameters
+        # swapped in) right after `BEGIN_OF_VALIDATION_RUN`, and the live parameters are
+        # restored before training goes on
+        self.swap_out()
+
+    def begin_of_save(self, **_):
+        # The live parameters are checkpointed with the model
+        self.swap_out()
 
 
 class GradientClip(Callback):
-    def __init__(self, clip_value=None, clip_norm=None):
+    """
+    Clips the gradients after the backward pass, either by their total norm or elementwise,
+    and records the total norm before clipping as the trainer state 'gradient_norm' (a
+    tensor on the device, such that nothing is synchronized with the device).
+
+    The thresholds can either be a number (for all parameters of the model), or a list or a
+    dict with one threshold per parameter group of the optimizer (groups without a
+    threshold aren't clipped). If the trainer scales the gradients (see
+    `Trainer.set_grad_scaler`), they're unscaled before they're clipped.
+    """
+    def __init__(self, clip_value=None, clip_norm=None, norm_type=2.):
         super(GradientClip, self).__init__()
         assert_(not (clip_value is None and clip_norm is None),
                 "Must provide either clip_value or clip_norm.",
@@ -265,6 +725,7 @@ class GradientClip(Callback):
                 RuntimeError)
         self._clip_value = clip_value
         self._clip_norm = clip_norm
+        self._norm_type = norm_type
 
     @property
     def mode(self):
@@ -274,8 +735,41 @@ class GradientClip(Callback):
     def norm_or_value(self):
         return self._clip_value if self._clip_value is not None else self._clip_norm
 
+    @property
+    def clips_per_parameter_group(self):
+        return isinstance(self.norm_or_value, (list, tuple, dict))
+
+    def clip(self):
+        """Clips the gradients and returns their total norm before clipping."""
+        norm_type = getattr(self, '_norm_type', 2.)
+        self.trainer.unscale_gradients()
+        if not self.clips_per_parameter_group:
+            return tu.clip_gradients_(self.trainer.model.parameters(), self.mode,
+                                      self.norm_or_value, norm_type=norm_type)
+        thresholds = self.norm_or_value
+        if not isinstance(thresholds, dict):
+            thresholds = dict(enumerate(thresholds))
+        group_norms = []
+        for group_index, group in enumerate(self.trainer.optimizer.param_groups):
+            threshold = thresholds.get(group_index)
+            if threshold is None:
+                group_norm = tu.gradient_norm(group['params'], norm_type=norm_type)
+            else:
+                group_norm = tu.clip_gradients_(group['params'], self.mode, threshold,
+                                                norm_type=norm_type)
+            if group_norm is not None:
+                group_norms.append(group_norm)
+        if len(group_norms) == 0:
+            return None
+        return torch.linalg.vector_norm(
+            torch.stack([group_norm.to(group_norms[0].device) for group_norm in group_norms]),
+            norm_type)
+
     def after_model_and_loss_is_applied(self, **_):
-        tu.clip_gradients_(self.trainer.model.parameters(), self.mode, self.norm_or_value)
+        total_norm = self.clip()
+        if total_norm is not None:
+            self.trainer.update_state('gradient_norm', total_norm)
+
 
 class GarbageCollection(Callback):
     """
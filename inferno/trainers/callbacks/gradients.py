@@ -1,4 +1,4 @@
-from ...utils.train_utils import Frequency
+from ...utils.train_utils import Frequency, LayerStatistics
 from ...utils.exceptions import assert_, FrequencyValueError
 from .base import Callback
 
@@ -30,9 +30,7 @@ class LogOutputGradients(Callback):
             self.hook_handle.remove()
             return
 
-        if self.log_every.match(iteration_count=self.trainer.iteration_count,
-                                epoch_count=self.trainer.epoch_count,
-                                persistent=True, match_zero=True):
+        if self.frequency_matches('log', self.log_every, persistent=True):
             self.trainer.update_state('output_gradient', grad_output[0].detach().float().clone().cpu())
 
     def add_hook(self):
@@ -53,3 +51,81 @@ class LogOutputGradients(Callback):
         # add hook after model save
         self.add_hook()
 
+
+class LogLayerStatistics(Callback):
+    """
+    Logs the norm, mean, variance and sparsity of the outputs of the model's layers and of
+    the gradients w.r.t. them (see `inferno.utils.train_utils.LayerStatistics`).
+
+    The statistics are only collected at the sampled iterations (and, optionally, for a
+    random subset of the layers), and stay on the device till the buffer is full or the
+    training run ends. They're then sent to the logger as scalars tagged
+    'layer_statistics/<kind>/<layer name>/<statistic>'.
+    """
+
+    def __init__(self, sample_every, num_sampled_layers=None, layer_types=None,
+                 buffer_size=32, activations=True, gradients=True, seed=None):
+        super(LogLayerStatistics, self).__init__()
+        self._sample_every = None
+        self._statistics = None
+        self.sample_every = sample_every
+        self.num_sampled_layers = num_sampled_layers
+        self.layer_types = layer_types
+        self.buffer_size = buffer_size
+        self.activations = activations
+        self.gradients = gradients
+        self.seed = seed
+
+    @property
+    def sample_every(self):
+        return self._sample_every
+
+    @sample_every.setter
+    def sample_every(self, value):
+        self._sample_every = Frequency.build_from(value, priority='iterations')
+        assert_(self._sample_every.is_consistent,
+                "Sampling frequency is not consistent.",
+                FrequencyValueError)
+
+    @property
+    def statistics(self):
+        if self._statistics is None:
+            self._statistics = LayerStatistics(self.trainer.model,
+                                               layer_types=self.layer_types,
+                                               num_sampled_layers=self.num_sampled_layers,
+                                               buffer_size=self.buffer_size,
+                                               activations=self.activations,
+                                               gradients=self.gradients,
+                                               seed=self.seed)
+        return self._statistics
+
+    def log(self):
+        logger = getattr(self.trainer, 'logger', None)
+        for step, statistics in self.statistics.flush():
+            if not hasattr(logger, 'log_scalar'):
+                continue
+            for tag, value in statistics.items():
+                logger.log_scalar('layer_statistics/{}'.format(tag), value, step=step)
+        return self
+
+    def begin_of_training_iteration(self, **_):
+        if self.frequency_matches('sample', self.sample_every):
+            self.statistics.start_sample(self.trainer.iteration_count)
+
+    def end_of_training_iteration(self, **_):
+        if self._statistics is None or not self._statistics.is_sampling:
+            return
+        self._statistics.end_sample()
+        if self._statistics.num_pending == self._statistics.buffer_size:
+            self.log()
+
+    def end_of_training_run(self, **_):
+        if self._statistics is not None:
+            self._statistics.end_sample()
+            self.log()
+
+    def get_config(self):
+        config_dict = super(LogLayerStatistics, self).get_config()
+        # The hooks hold on to the model
+        config_dict.update({'_statistics': None})
+        return config_dict
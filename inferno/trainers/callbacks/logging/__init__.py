@@ -1,14 +1,19 @@
+from importlib.util import find_spec
+from ....utils.python_utils import lazy_module_attributes
+
 __all__ = ['get_logger']
-try:
-    INFERNO_WITH_TENSORBOARD_LOGGER = True
-    from .tensorboard import TensorboardLogger
+# tensorboardX is only imported when the logger is first used
+INFERNO_WITH_TENSORBOARD_LOGGER = find_spec('tensorboardX') is not None
+if INFERNO_WITH_TENSORBOARD_LOGGER:
     __all__.append('TensorboardLogger')
-except ImportError:
-    INFERNO_WITH_TENSORBOARD_LOGGER = False
+
+__getattr__, __dir__ = lazy_module_attributes(
+    __name__, submodules=['base', 'tensorboard'],
+    attributes={'TensorboardLogger': 'tensorboard'} if INFERNO_WITH_TENSORBOARD_LOGGER else {})
 
 
 def get_logger(name):
-    if name in globals():
-        return globals().get(name)
+    if name in __all__:
+        return globals().get(name) or __getattr__(name)
     else:
         raise NotImplementedError("Logger not found.")
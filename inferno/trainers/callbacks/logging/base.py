@@ -8,8 +8,10 @@ class Logger(Callback):
 
     Loggers are special because they're required to be serializable, whereas other
     callbacks have no such guarantees. In this regard, they jointly handled by
-    trainers and the callback engine.
+    trainers and the callback engine. In distributed training, only the main process logs.
     """
+    rank_zero_only = True
+
     def __init__(self, log_directory=None):
         super(Logger, self).__init__()
         self._log_directory = None
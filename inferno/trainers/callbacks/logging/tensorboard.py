@@ -1,5 +1,6 @@
 import tensorboardX as tX
 import numpy as np
+import torch
 import warnings
 from .base import Logger
 from ....utils import torch_utils as tu
@@ -17,7 +18,8 @@ class TaggedImage(object):
 class TensorboardLogger(Logger):
     """Class to enable logging of training progress to Tensorboard.
 
-    Currently supports logging scalars and images.
+    Currently supports logging scalars, images and histograms. By default, the (expensive) encoding and
+    writing of the logs happens on a background thread, so as to not stall the training loop.
     """
     # This is hard coded because tensorboardX doesn't have a __version__
     _TENSORBOARDX_IMAGE_FORMAT = 'CHW'
@@ -26,7 +28,10 @@ class TensorboardLogger(Logger):
     def __init__(self, log_directory=None,
                  log_scalars_every=None, log_images_every=None, log_histograms_every=None,
                  send_image_at_batch_indices='all', send_image_at_channel_indices='all',
-                 send_volume_at_z_indices='mid'):
+                 send_volume_at_z_indices='mid', asynchronous=True, max_queue_size=64,
+                 histogram_parameters=True, histogram_gradients=True,
+                 histogram_bins=100, histogram_max_samples=2 ** 14,
+                 accumulate_histograms=False):
         """
         Parameters
         ----------
@@ -37,7 +42,9 @@ class TensorboardLogger(Logger):
         log_images_every : str or tuple or inferno.utils.train_utils.Frequency
             How often images should be logged to Tensorboard. By default, once every epoch.
         log_histograms_every : str or tuple or inferno.utils.train_utils.Frequency
-            How often histograms should be logged to Tensorboard. By default, never.
+            How often histograms should be logged to Tensorboard. By default, never. The
+            logged histograms are of the values at the logging iteration, unless
+            `accumulate_histograms` is True.
         send_image_at_batch_indices : list or str
             The indices of the batches to be logged. An `image_batch` usually has the shape
             (num_samples, num_channels, num_rows, num_cols). By setting this argument to say
@@ -49,6 +56,25 @@ class TensorboardLogger(Logger):
             For 3D batches of shape (num_samples, num_channels, num_z_slices, num_rows, num_cols),
             select the indices of the z slices to be logged. When a str, it could be 'all' or
             'mid' (to log the central z slice).
+        asynchronous : bool
+            Whether to write to the log files from a background thread.
+        max_queue_size : int
+            Maximum number of pending write jobs when `asynchronous` is True. If the
+            background thread falls behind (i.e. the queue is full), images are dropped
+            (while scalars are always written).
+        histogram_parameters : bool
+            Whether to log histograms of the model parameters.
+        histogram_gradients : bool
+            Whether to log histograms of the gradients of the model parameters.
+        histogram_bins : int
+            Number of histogram bins.
+        histogram_max_samples : int
+            Maximum number of values (per histogram) the bucket counts are estimated from.
+            Histograms are computed on the device from a random subsample of this size.
+        accumulate_histograms : bool
+            Whether to accumulate the histograms over all training iterations since they
+            were last logged. This costs a few reductions per parameter (and gradient) in
+            every training iteration.
 
         Warnings
         --------
@@ -60,9 +86,19 @@ class TensorboardLogger(Logger):
         self._log_images_every = None
         self._log_histograms_every = None
         self._writer = None
+        self._worker = None
+        self._asynchronous = asynchronous
+        self._max_queue_size = max_queue_size
         self._config = {'image_batch_indices': send_image_at_batch_indices,
                         'image_channel_indices': send_image_at_channel_indices,
-                        'volume_z_indices': send_volume_at_z_indices}
+                        'volume_z_indices': send_volume_at_z_indices,
+                        'histogram_parameters': histogram_parameters,
+                        'histogram_gradients': histogram_gradients,
+                        'histogram_bins': histogram_bins,
+                        'histogram_max_samples': histogram_max_samples,
+                        'accumulate_histograms': accumulate_histograms}
+        # Histograms being accumulated, keyed by tag
+        self._histograms = {}
         # We ought to know the trainer states we're observing (and plotting to tensorboard).
         # These are the defaults.
         self._trainer_states_being_observed_while_training = {'training_loss',
@@ -86,6 +122,40 @@ class TensorboardLogger(Logger):
             self._writer = tX.SummaryWriter(self.log_directory)
         return self._writer
 
+    @property
+    def asynchronous(self):
+        # Loggers loaded from old checkpoints might not have '_asynchronous'
+        return getattr(self, '_asynchronous', False)
+
+    @property
+    def worker(self):
+        if getattr(self, '_worker', None) is None:
+            self._worker = pyu.BackgroundWorker(max_queue_size=getattr(self, '_max_queue_size', 64),
+                                                name=type(self).__name__)
+        return self._worker
+
+    @property
+    def num_dropped_writes(self):
+        """Number of write jobs dropped because the background thread fell behind."""
+        worker = getattr(self, '_worker', None)
+        return 0 if worker is None else worker.num_dropped
+
+    def _submit(self, function, *args, droppable=False, **kwargs):
+        # Run `function` on the background thread if asynchronous, right away otherwise.
+        if self.asynchronous:
+            return self.worker.submit(function, *args, droppable=droppable, **kwargs)
+        else:
+            function(*args, **kwargs)
+            return True
+
+    def flush(self):
+        """Blocks till all pending logs are written to disk."""
+        if getattr(self, '_worker', None) is not None:
+            self._worker.join()
+        if self._writer is not None:
+            self._writer.flush()
+        return self
+
     @property
     def log_scalars_every(self):
         if self._log_scalars_every is None:
@@ -100,9 +170,7 @@ class TensorboardLogger(Logger):
     def log_scalars_now(self):
         # Using persistent=True in a property getter is probably not a very good idea...
         # We need to make sure that this getter is called only once per callback-call.
-        return self.log_scalars_every.match(iteration_count=self.trainer.iteration_count,
-                                            epoch_count=self.trainer.epoch_count,
-                                            persistent=True)
+        return self.frequency_matches('log_scalars', self.log_scalars_every, persistent=True)
 
     @property
     def log_images_every(self):
@@ -118,9 +186,7 @@ class TensorboardLogger(Logger):
     def log_images_now(self):
         # Using persistent=True in a property getter is probably not a very good idea...
         # We need to make sure that this getter is called only once per callback-call.
-        return self.log_images_every.match(iteration_count=self.trainer.iteration_count,
-                                           epoch_count=self.trainer.epoch_count,
-                                           persistent=True)
+        return self.frequency_matches('log_images', self.log_images_every, persistent=True)
 
     @property
     def log_histograms_every(self):
@@ -136,9 +202,8 @@ class TensorboardLogger(Logger):
     def log_histograms_now(self):
         # Using persistent=True in a property getter is probably not a very good idea...
         # We need to make sure that this getter is called only once per callback-call.
-        return self.log_histograms_every.match(iteration_count=self.trainer.iteration_count,
-                                               epoch_count=self.trainer.epoch_count,
-                                               persistent=True)
+        return self.frequency_matches('log_histograms', self.log_histograms_every,
+                                      persistent=True)
 
     def observe_state(self, key, observe_while='training'):
         # Validate arguments
@@ -223,18 +288,63 @@ class TensorboardLogger(Logger):
                 self.log_image_or_volume_batch(tag, object_, self.trainer.iteration_count)
         elif tu.is_vector_tensor(object_) and allow_histogram_logging:
             # Log histograms
-            values = tu.unwrap(object_, as_numpy=True)
-            self.log_histogram(tag, values, self.trainer.iteration_count)
+            self.log_histogram(tag, object_, self.trainer.iteration_count)
         else:
             # Object is neither a scalar nor an image nor a vector, there's nothing we can do
             if tu.is_tensor(object_) and self._DEBUG:
                 # Throw a warning when in debug mode.
                 warnings.warn("Unsupported attempt to log tensor `{}` of shape `{}`".format(tag, object_.size()))
 
+    @property
+    def histograms_enabled(self):
+        return self.log_histograms_every.value != np.inf
+
+    def _get_histogram(self, tag):
+        # Loggers loaded from old checkpoints might not have '_histograms'
+        if getattr(self, '_histograms', None) is None:
+            self._histograms = {}
+        if tag not in self._histograms:
+            self._histograms[tag] = tru.StreamingHistogram(
+                bins=self._config.get('histogram_bins', 100),
+                max_samples=self._config.get('histogram_max_samples', 2 ** 14))
+        return self._histograms[tag]
+
+    def accumulate_histograms(self):
+        """Accumulates histograms of the parameters, gradients and observed vector states."""
+        if self._config.get('histogram_parameters', False) or \
+                self._config.get('histogram_gradients', False):
+            for name, parameter in self.trainer.model.named_parameters():
+                if self._config.get('histogram_parameters', False):
+                    self._get_histogram('parameters/{}'.format(name)).update(parameter)
+                if self._config.get('histogram_gradients', False) and \
+                        parameter.grad is not None:
+                    self._get_histogram('gradients/{}'.format(name)).update(parameter.grad)
+        for state_key in self._trainer_states_being_observed_while_training:
+            state = self.trainer.get_state(state_key, default=None)
+            if tu.is_vector_tensor(state):
+                self._get_histogram(state_key).update(state)
+
+    def write_histograms(self, step=None):
+        """Writes out (and resets) the accumulated histograms."""
+        step = self.trainer.iteration_count if step is None else step
+        for tag, histogram in getattr(self, '_histograms', {}).items():
+            summary = histogram.summarize()
+            histogram.reset()
+            if summary is not None:
+                self._submit(self._add_histogram, tag, summary, step)
+
+    def _add_histogram(self, tag, summary, step):
+        self.writer.add_histogram_raw(tag, global_step=step, **summary)
+
     def end_of_training_iteration(self, **_):
         log_scalars_now = self.log_scalars_now
         log_images_now = self.log_images_now
         log_histograms_now = self.log_histograms_now
+        if log_histograms_now or \
+                (self.histograms_enabled and self._config.get('accumulate_histograms', False)):
+            self.accumulate_histograms()
+        if log_histograms_now:
+            self.write_histograms()
         if not log_scalars_now and not log_images_now:
             # Nothing to log, so we won't bother
             return
@@ -244,10 +354,14 @@ class TensorboardLogger(Logger):
             if state is None:
                 # State not found in trainer but don't throw a hissy fit
                 continue
+            # Histograms of states are accumulated above
             self.log_object(state_key, state,
                             allow_scalar_logging=log_scalars_now,
                             allow_image_logging=log_images_now,
-                            allow_histogram_logging=log_histograms_now)
+                            allow_histogram_logging=False)
+
+    def end_of_fit(self, **_):
+        self.flush()
 
     def end_of_validation_run(self, **_):
         # Log everything
@@ -275,7 +389,27 @@ class TensorboardLogger(Logger):
             tag = '{}/slice_{}'.format(tag, slice_num)
         return TaggedImage(image, tag)
 
-    def extract_images_from_batch(self, batch, base_tag=None, prefix=None):
+    @staticmethod
+    def _parse_indices(indices, size, name):
+        # Parse the index specification to a sorted array of valid indices
+        if indices == 'all':
+            return np.arange(size)
+        elif isinstance(indices, int):
+            indices = [indices]
+        elif not isinstance(indices, (list, tuple)):
+            raise NotImplementedError("Can't parse {} indices {}.".format(name, indices))
+        return np.array(sorted({index for index in indices if 0 <= index < size}),
+                        dtype='int64')
+
+    @staticmethod
+    def _normalize_images(images):
+        # Normalizes every image in the array `images` of shape (..., H, W) to [0, 1]
+        images = images - images.min(axis=(-2, -1), keepdims=True)
+        maxvals = images.max(axis=(-2, -1), keepdims=True)
+        np.divide(images, maxvals, out=images, where=maxvals > 0)
+        return images
+
+    def extract_images_from_batch(self, batch, base_tag=None, prefix=None, normalize=False):
         if base_tag is None:
             assert_(prefix is None,
                     "`base_tag` is not provided - `prefix` must be None in this case.",
@@ -283,83 +417,53 @@ class TensorboardLogger(Logger):
         # Special case when batch is a list or tuple of batches
         if isinstance(batch, (list, tuple)):
             image_list = []
-            for batch_num, _batch in batch:
+            for batch_num, _batch in enumerate(batch):
                 image_list.extend(
                     self.extract_images_from_batch(_batch, base_tag=base_tag,
-                                                   prefix='batch_{}'.format(batch_num)))
+                                                   prefix='batch_{}'.format(batch_num),
+                                                   normalize=normalize))
             return image_list
         # `batch` really is a tensor from now on.
         batch_is_image_tensor = tu.is_image_tensor(batch)
         batch_is_volume_tensor = tu.is_volume_tensor(batch)
         assert batch_is_volume_tensor != batch_is_image_tensor, \
             "Batch must either be a image or a volume tensor."
-        # Convert to numpy
-        batch = batch.float().numpy()
-        # Get the indices of the batches we want to send to tensorboard
-        batch_indices = self._config.get('image_batch_indices', 'all')
-        if batch_indices == 'all':
-            batch_indices = list(range(batch.shape[0]))
-        elif isinstance(batch_indices, (list, tuple)):
-            pass
-        elif isinstance(batch_indices, int):
-            batch_indices = [batch_indices]
-        else:
-            raise NotImplementedError
-        # Get the indices of the channels we want to send to tensorboard
-        channel_indices = self._config.get('image_channel_indices', 'all')
-        if channel_indices == 'all':
-            channel_indices = list(range(batch.shape[1]))
-        elif isinstance(channel_indices, (list, tuple)):
-            pass
-        elif isinstance(channel_indices, int):
-            channel_indices = [channel_indices]
-        else:
-            raise NotImplementedError
-        # Extract images from batch
-        if batch_is_image_tensor:
-            image_list = [(self._tag_image(image,
-                                           base_tag=base_tag, prefix=prefix,
-                                           instance_num=instance_num,
-                                           channel_num=channel_num)
-                           if base_tag is not None else image)
-                          for instance_num, instance in enumerate(batch)
-                          for channel_num, image in enumerate(instance)
-                          if instance_num in batch_indices and channel_num in channel_indices]
-        else:
-            assert batch_is_volume_tensor
+        # Get the indices of the batches and channels we want to send to tensorboard
+        indices = [self._parse_indices(self._config.get('image_batch_indices', 'all'),
+                                       batch.shape[0], 'batch'),
+                   self._parse_indices(self._config.get('image_channel_indices', 'all'),
+                                       batch.shape[1], 'channel')]
+        if batch_is_volume_tensor:
             # Trim away along the z axis
             z_indices = self._config.get('volume_z_indices', 'mid')
-            if z_indices == 'all':
-                z_indices = list(range(batch.shape[2]))
-            elif z_indices == 'mid':
+            if z_indices == 'mid':
                 z_indices = [batch.shape[2] // 2]
-            elif isinstance(z_indices, (list, tuple)):
-                pass
-            elif isinstance(z_indices, int):
-                z_indices = [z_indices]
-            else:
-                raise NotImplementedError
-            # I'm going to hell for this.
-            image_list = [(self._tag_image(image,
-                                           base_tag=base_tag, prefix=prefix,
-                                           instance_num=instance_num,
-                                           channel_num=channel_num,
-                                           slice_num=slice_num)
-                           if base_tag is not None else image)
-                          for instance_num, instance in enumerate(batch)
-                          for channel_num, volume in enumerate(instance)
-                          for slice_num, image in enumerate(volume)
-                          if instance_num in batch_indices and
-                          channel_num in channel_indices and
-                          slice_num in z_indices]
+            indices.append(self._parse_indices(z_indices, batch.shape[2], 'z'))
+        # Select the images before converting to numpy, such that only what's logged is copied
+        selection = tuple(torch.from_numpy(index) for index in np.ix_(*indices))
+        images = batch.detach()[selection].float().cpu().numpy()
+        if normalize:
+            images = self._normalize_images(images)
+        if base_tag is None:
+            return list(images.reshape((-1,) + images.shape[-2:]))
+        # Tag the images
+        image_list = []
+        for position in np.ndindex(*images.shape[:-2]):
+            index_kwargs = {'instance_num': int(indices[0][position[0]]),
+                            'channel_num': int(indices[1][position[1]])}
+            if batch_is_volume_tensor:
+                index_kwargs.update({'slice_num': int(indices[2][position[2]])})
+            image_list.append(self._tag_image(images[position], base_tag=base_tag,
+                                              prefix=prefix, **index_kwargs))
         # Done.
         return image_list
 
     def log_image_or_volume_batch(self, tag, batch, step=None):
         assert pyu.is_maybe_list_of(tu.is_image_or_volume_tensor)(batch)
         step = step or self.trainer.iteration_count
-        image_list = self.extract_images_from_batch(batch, base_tag=tag)
-        self.log_images(tag, image_list, step)
+        # Images are normalized in one go here
+        image_list = self.extract_images_from_batch(batch, base_tag=tag, normalize=True)
+        self.log_images(tag, image_list, step, normalize=False)
 
     def log_scalar(self, tag, value, step):
         """
@@ -371,13 +475,17 @@ class TensorboardLogger(Logger):
         step : int
             training iteration
         """
+        self._submit(self._add_scalar, tag, value, step)
+
+    def _add_scalar(self, tag, value, step):
         self.writer.add_scalar(tag=tag, scalar_value=value, global_step=step)
 
-    def log_images(self, tag, images, step, image_format='CHW'):
+    def log_images(self, tag, images, step, image_format='CHW', normalize=True):
         """Logs a list of images."""
         assert_(image_format.upper() in ['CHW', 'HWC'],
                 "Image format must be either 'CHW' or 'HWC'. Got {} instead.".format(image_format),
                 ValueError)
+        tagged_images = []
         for image_num, image in enumerate(images):
             if isinstance(image, TaggedImage):
                 tag = image.tag
@@ -392,8 +500,14 @@ class TensorboardLogger(Logger):
             # tensorboardX borks if the number of image channels is not 3
             # if image.shape[-1] == 1:
             #     image = image[..., [0, 0, 0]]
-            image = self._normalize_image(image)
-            # print(image.dtype, image.shape)
+            if normalize:
+                image = self._normalize_image(image)
+            tagged_images.append((tag, image))
+        # Encoding images is expensive - these may be dropped if the writer falls behind.
+        self._submit(self._add_images, tagged_images, step, droppable=True)
+
+    def _add_images(self, tagged_images, step):
+        for tag, image in tagged_images:
             self.writer.add_image(tag, img_tensor=image, global_step=step)
 
     @staticmethod
@@ -441,12 +555,17 @@ class TensorboardLogger(Logger):
 
     def log_histogram(self, tag, values, step, bins=1000):
         """Logs the histogram of a list/vector of values."""
-        # TODO
-        raise NotImplementedError
+        if not tu.is_tensor(values):
+            values = torch.as_tensor(np.asarray(values))
+        summary = tru.StreamingHistogram(
+            bins=bins, max_samples=self._config.get('histogram_max_samples', 2 ** 14))\
+            .update(values).summarize()
+        if summary is not None:
+            self._submit(self._add_histogram, tag, summary, step)
 
     def get_config(self):
         # Apparently, some SwigPyObject objects cannot be pickled - so we need to build the
         # writer on the fly.
         config = super(TensorboardLogger, self).get_config()
-        config.update({'_writer': None})
+        config.update({'_writer': None, '_worker': None, '_histograms': {}})
         return config
@@ -1,5 +1,6 @@
-from ...utils.train_utils import Frequency, Duration, MovingAverage
+from ...utils.train_utils import Frequency, Duration, MovingAverage, ScalarAccumulator
 from ...utils import python_utils as pyu
+from ...utils import torch_utils as tu
 from ...utils.exceptions import assert_, NotSetError
 from .base import Callback
 from functools import reduce
@@ -85,8 +86,10 @@ class _Scheduler(Callback):
                     ValueError)
             return monitor_value, self._monitor
 
-    def maintain_monitor_moving_average(self):
-        monitor_value = self.monitor_value
+    def maintain_monitor_moving_average(self, monitor_value=None):
+        monitor_value = self.monitor_value if monitor_value is None else monitor_value
+        if tu.is_tensor(monitor_value):
+            monitor_value = tu.unwrap(monitor_value, extract_item=True)
         self._monitor_value_moving_average.update(monitor_value)
         return monitor_value
 
@@ -101,7 +104,8 @@ class AutoLR(_Scheduler):
     def __init__(self, factor, patience, required_minimum_relative_improvement=0,
                  consider_improvement_with_respect_to='best',
                  cooldown_duration=None, monitor='auto', monitor_momentum=0,
-                 monitor_while='auto', exclude_param_groups=None, verbose=False):
+                 monitor_while='auto', exclude_param_groups=None, verbose=False,
+                 monitor_every=1):
         """
         Parameters
         ----------
@@ -135,6 +139,10 @@ class AutoLR(_Scheduler):
             Parameter groups to __not__ apply the LR decay on.
         verbose : bool
             Specifies if a message be printed before decaying.
+        monitor_every : int
+            When monitoring while training, the monitor is accumulated on the device and
+            its mean is only fetched (and checked for improvement) every `monitor_every`
+            iterations. Fetching it synchronizes with the device.
         """
         super(AutoLR, self).__init__(monitor=monitor, monitor_momentum=monitor_momentum,
                                      monitor_while=monitor_while)
@@ -149,6 +157,7 @@ class AutoLR(_Scheduler):
         self._last_decayed_at = {'iteration_count': None, 'epoch_count': None}
         self._last_improved_at = {'iteration_count': None, 'epoch_count': None}
         self._best_monitor_value = None
+        self._monitor_accumulator = ScalarAccumulator()
         # Publics
         self.patience = patience
         self.cooldown_duration = cooldown_duration
@@ -158,6 +167,10 @@ class AutoLR(_Scheduler):
         self.exclude_param_groups = pyu.to_iterable(exclude_param_groups) \
             if exclude_param_groups is not None else None
         self.verbose = verbose
+        assert_(isinstance(monitor_every, int) and monitor_every > 0,
+                "`monitor_every` must be a positive integer, got {}.".format(monitor_every),
+                ValueError)
+        self.monitor_every = monitor_every
 
     @property
     def patience(self):
@@ -241,8 +254,8 @@ class AutoLR(_Scheduler):
         self._last_decayed_at.update({'iteration_count': self.trainer.iteration_count,
                                       'epoch_count': self.trainer.epoch_count})
 
-    def maintain_monitor_moving_average(self):
-        monitor_value = super(AutoLR, self).maintain_monitor_moving_average()
+    def maintain_monitor_moving_average(self, monitor_value=None):
+        monitor_value = super(AutoLR, self).maintain_monitor_moving_average(monitor_value)
         if self._best_monitor_value is None:
             self._best_monitor_value = monitor_value
 
@@ -278,7 +291,14 @@ class AutoLR(_Scheduler):
     def end_of_training_iteration(self, **_):
         # Decay if we're not in cooldown (and monitoring while training)
         if self.monitor_while == 'training':
-            self.maintain_monitor_moving_average()
+            monitor_every = getattr(self, 'monitor_every', 1)
+            if monitor_every == 1:
+                self.maintain_monitor_moving_average()
+            else:
+                self._monitor_accumulator.update(self.monitor_value)
+                if self._monitor_accumulator.count < monitor_every:
+                    return
+                self.maintain_monitor_moving_average(self._monitor_accumulator.flush()['mean'])
             if not self.monitor_value_has_significantly_improved and \
                     self.out_of_patience and not self.in_cooldown:
                 if self.verbose:
@@ -402,9 +422,7 @@ class SaveModelRegularly(Callback):
 
     @property
     def save_now(self):
-        return self._save_every.match(iteration_count=self.trainer.iteration_count,
-                                      epoch_count=self.trainer.epoch_count,
-                                      persistent=True, match_zero=True)
+        return self.frequency_matches('save', self._save_every, persistent=True)
 
     def end_of_training_iteration(self, **_):
         if self.save_now:
@@ -0,0 +1,323 @@
+"""Utilities for sharded, deduplicated checkpoints."""
+import hashlib
+import json
+import os
+
+import torch
+
+from .exceptions import assert_
+
+
+def _atomic_torch_save(object_, path, **save_kwargs):
+    # Write to a temporary file first, such that a crash never leaves a half-written file
+    temporary_path = path + '.tmp'
+    torch.save(object_, temporary_path, **save_kwargs)
+    os.replace(temporary_path, path)
+
+
+def tensor_digest(tensor):
+    """Computes a content hash of a tensor (including its dtype and shape)."""
+    tensor = tensor.detach().cpu().contiguous()
+    hasher = hashlib.blake2b(digest_size=20)
+    hasher.update("{}{}".format(tensor.dtype, tuple(tensor.shape)).encode())
+    if tensor.numel() > 0:
+        hasher.update(tensor.reshape(-1).view(torch.uint8).numpy().data)
+    return hasher.hexdigest()
+
+
+def select_checkpoints_to_keep(entries, keep_last=None, keep_best=None):
+    """
+    Applies a retention policy to a list of checkpoints.
+
+    Parameters
+    ----------
+    entries : list of tuple
+        List of (name, score) tuples, ordered from the oldest to the newest checkpoint.
+        A lower score is better; the score can be None if not known.
+    keep_last : int
+        Number of most recent checkpoints to keep.
+    keep_best : int
+        Number of best scoring checkpoints to keep.
+
+    Returns
+    -------
+    set
+        Names of the checkpoints to keep. All checkpoints are kept if neither
+        `keep_last` nor `keep_best` is given.
+    """
+    names = [name for name, _ in entries]
+    if keep_last is None and keep_best is None:
+        return set(names)
+    keep = set()
+    if keep_last is not None and keep_last > 0:
+        keep.update(names[-keep_last:])
+    if keep_best is not None and keep_best > 0:
+        scored = [(score, name) for name, score in entries if score is not None]
+        keep.update(name for _, name in sorted(scored, key=lambda x: x[0])[:keep_best])
+    return keep
+
+
+def apply_retention_policy(entries, remove, keep_last=None, keep_best=None):
+    """
+    Removes the checkpoints that a retention policy doesn't keep.
+
+    Parameters
+    ----------
+    entries : list of tuple
+        List of (name, score) tuples, as for `select_checkpoints_to_keep`.
+    remove : callable
+        Called with the name of every checkpoint to remove.
+    keep_last : int
+        Number of most recent checkpoints to keep.
+    keep_best : int
+        Number of best scoring checkpoints to keep.
+
+    Returns
+    -------
+    list
+        Names of the removed checkpoints.
+    """
+    keep = select_checkpoints_to_keep(entries, keep_last=keep_last, keep_best=keep_best)
+    removed = [name for name, _ in entries if name not in keep]
+    for name in removed:
+        remove(name)
+    return removed
+
+
+class ShardedCheckpointStore(object):
+    """
+    A directory of checkpoints where every (sufficiently large) tensor is stored exactly once.
+
+    Each checkpoint is represented by a small manifest file (named after the checkpoint)
+    in the store directory. The manifest mirrors the nested checkpoint dictionary, but with
+    the tensors replaced by references to content-addressed shards in the `tensors`
+    subdirectory. Tensors that do not change between checkpoints (e.g. frozen weights) are
+    therefore written to disk only once, and shared between all checkpoints that
+    contain them.
+    """
+    SHARD_DIRECTORY = 'tensors'
+    INDEX_FILENAME = 'checkpoint_store.json'
+    _MANIFEST_KEY = 'inferno_sharded_checkpoint'
+    _REFERENCE_KEY = '__inferno_tensor__'
+
+    def __init__(self, directory, min_shard_bytes=4096, pickle_module=None):
+        """
+        Parameters
+        ----------
+        directory : str
+            Path to the store directory.
+        min_shard_bytes : int
+            Tensors smaller than this (in bytes) are stored inline in the manifest.
+        pickle_module : module
+            Pickle module for writing and reading manifests.
+        """
+        self.directory = directory
+        self.min_shard_bytes = min_shard_bytes
+        self.pickle_module = pickle_module
+        # Digests of the shards known to exist on disk
+        self._known_shards = set()
+
+    @property
+    def shard_directory(self):
+        return os.path.join(self.directory, self.SHARD_DIRECTORY)
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, self.INDEX_FILENAME)
+
+    def _pickle_kwargs(self):
+        return {} if self.pickle_module is None else {'pickle_module': self.pickle_module}
+
+    def get_shard_path(self, digest):
+        return os.path.join(self.shard_directory, digest + '.pt')
+
+    def read_index(self):
+        if not os.path.exists(self.index_path):
+            return {'checkpoints': []}
+        with open(self.index_path, 'r') as f:
+            return json.load(f)
+
+    def write_index(self, index):
+        temporary_path = self.index_path + '.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump(index, f, indent=2)
+        os.replace(temporary_path, self.index_path)
+
+    @property
+    def names(self):
+        """Names of the checkpoints in the store, ordered from the oldest to the newest."""
+        return [entry['name'] for entry in self.read_index()['checkpoints']]
+
+    def _shard_exists(self, digest):
+        if digest in self._known_shards:
+            return True
+        if os.path.exists(self.get_shard_path(digest)):
+            self._known_shards.add(digest)
+            return True
+        return False
+
+    def _deflate(self, object_, digests, stats):
+        # Replaces tensors in nested dicts, lists and tuples by references to shards
+        if isinstance(object_, dict):
+            return type(object_)((key, self._deflate(value, digests, stats))
+                                 for key, value in object_.items())
+        elif isinstance(object_, (list, tuple)) and not hasattr(object_, '_fields'):
+            return type(object_)(self._deflate(value, digests, stats) for value in object_)
+        elif torch.is_tensor(object_) and \
+                object_.numel() * object_.element_size() >= self.min_shard_bytes:
+            digest = tensor_digest(object_)
+            if not self._shard_exists(digest):
+                # Clone to make sure that we don't write out the entire storage of a view
+                _atomic_torch_save(object_.detach().cpu().clone(), self.get_shard_path(digest))
+                self._known_shards.add(digest)
+                stats['written'] += 1
+            else:
+                stats['reused'] += 1
+            digests.add(digest)
+            return {self._REFERENCE_KEY: digest}
+        else:
+            return object_
+
+    def _inflate(self, object_, map_location=None, mmap=None):
+        if isinstance(object_, dict):
+            if self._REFERENCE_KEY in object_ and len(object_) == 1:
+                load_kwargs = {} if mmap is None else {'mmap': mmap}
+                return torch.load(self.get_shard_path(object_[self._REFERENCE_KEY]),
+                                  map_location=map_location, weights_only=True,
+                                  **load_kwargs)
+            return type(object_)((key, self._inflate(value, map_location, mmap))
+                                 for key, value in object_.items())
+        elif isinstance(object_, (list, tuple)) and not hasattr(object_, '_fields'):
+            return type(object_)(self._inflate(value, map_location, mmap)
+                                 for value in object_)
+        else:
+            return object_
+
+    @classmethod
+    def is_manifest(cls, object_):
+        return isinstance(object_, dict) and cls._MANIFEST_KEY in object_
+
+    def save(self, checkpoint, name, score=None):
+        """
+        Saves a checkpoint to the store.
+
+        Parameters
+        ----------
+        checkpoint : dict
+            The (possibly nested) checkpoint dictionary.
+        name : str
+            Name of the checkpoint. This is also the filename of its manifest.
+        score : float
+            Score of the checkpoint (lower is better), used by the keep-best retention policy.
+
+        Returns
+        -------
+        dict
+            Number of tensor shards 'written' and 'reused'.
+        """
+        os.makedirs(self.shard_directory, exist_ok=True)
+        digests = set()
+        stats = {'written': 0, 'reused': 0}
+        manifest = {self._MANIFEST_KEY: 1,
+                    'checkpoint': self._deflate(checkpoint, digests, stats)}
+        manifest_path = os.path.join(self.directory, name)
+        if os.path.islink(manifest_path):
+            os.remove(manifest_path)
+        _atomic_torch_save(manifest, manifest_path, **self._pickle_kwargs())
+        self._register(name, sorted(digests), score)
+        return stats
+
+    def _register(self, name, digests, score):
+        index = self.read_index()
+        checkpoints = [entry for entry in index['checkpoints'] if entry['name'] != name]
+        checkpoints.append({'name': name, 'digests': digests,
+                            'score': None if score is None else float(score)})
+        index['checkpoints'] = checkpoints
+        self.write_index(index)
+
+    def load_manifest(self, manifest, map_location=None, mmap=None):
+        """Resolves the shards referenced by an already loaded manifest."""
+        assert_(self.is_manifest(manifest), "Object is not a checkpoint manifest.", ValueError)
+        return self._inflate(manifest['checkpoint'], map_location=map_location, mmap=mmap)
+
+    def load(self, name, map_location=None, mmap=None):
+        """Loads the checkpoint with the given name."""
+        manifest = torch.load(os.path.join(self.directory, name), map_location=map_location,
+                              **self._pickle_kwargs())
+        return self.load_manifest(manifest, map_location=map_location, mmap=mmap)
+
+    def copy(self, name, to_name):
+        """Copies a checkpoint. Only the manifest is copied, the shards are shared."""
+        index = self.read_index()
+        entry = [_entry for _entry in index['checkpoints'] if _entry['name'] == name]
+        assert_(len(entry) == 1, "Checkpoint '{}' not found in store.".format(name), KeyError)
+        source_path = os.path.realpath(os.path.join(self.directory, name))
+        target_path = os.path.join(self.directory, to_name)
+        if os.path.lexists(target_path):
+            os.remove(target_path)
+        with open(source_path, 'rb') as source, open(target_path + '.tmp', 'wb') as target:
+            target.write(source.read())
+        os.replace(target_path + '.tmp', target_path)
+        self._register(to_name, entry[0]['digests'], entry[0]['score'])
+        return self
+
+    def remove(self, name, collect_garbage=True):
+        """Removes a checkpoint and (optionally) the shards no longer referenced."""
+        index = self.read_index()
+        index['checkpoints'] = [entry for entry in index['checkpoints']
+                                if entry['name'] != name]
+        self.write_index(index)
+        manifest_path = os.path.join(self.directory, name)
+        if os.path.lexists(manifest_path):
+            os.remove(manifest_path)
+        if collect_garbage:
+            self.collect_garbage()
+        return self
+
+    def collect_garbage(self):
+        """Deletes shards that are not referenced by any checkpoint in the store."""
+        index = self.read_index()
+        # Forget about checkpoints whose manifests were removed or replaced by symlinks
+        index['checkpoints'] = [
+            entry for entry in index['checkpoints']
+            if os.path.isfile(os.path.join(self.directory, entry['name'])) and
+            not os.path.islink(os.path.join(self.directory, entry['name']))]
+        self.write_index(index)
+        referenced = {digest for entry in index['checkpoints'] for digest in entry['digests']}
+        if not os.path.isdir(self.shard_directory):
+            return self
+        for filename in os.listdir(self.shard_directory):
+            digest, extension = os.path.splitext(filename)
+            if extension == '.pt' and digest not in referenced:
+                os.remove(os.path.join(self.shard_directory, filename))
+                self._known_shards.discard(digest)
+        return self
+
+    def apply_retention(self, keep_last=None, keep_best=None, among=None):
+        """
+        Removes checkpoints according to a retention policy.
+
+        Parameters
+        ----------
+        keep_last : int
+            Number of most recent checkpoints to keep.
+        keep_best : int
+            Number of best scoring checkpoints to keep.
+        among : list of str
+            Names of the checkpoints the policy applies to. Other checkpoints are left
+            alone. Defaults to all checkpoints in the store.
+
+        Returns
+        -------
+        list
+            Names of the removed checkpoints.
+        """
+        entries = [(entry['name'], entry['score'])
+                   for entry in self.read_index()['checkpoints']
+                   if among is None or entry['name'] in among]
+        removed = apply_retention_policy(entries,
+                                         lambda name: self.remove(name, collect_garbage=False),
+                                         keep_last=keep_last, keep_best=keep_best)
+        if removed:
+            self.collect_garbage()
+        return removed
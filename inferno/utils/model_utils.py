@@ -1,4 +1,9 @@
+import copy
+import warnings
+from collections import OrderedDict
 import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_weights
 from .exceptions import assert_, NotTorchModuleError, ShapeError
 
 
@@ -10,6 +15,274 @@ def is_model_cuda(model):
         return False
 
 
+def export_model(model, example_input, path=None, format='torchscript',
+                 check=True, atol=1e-5, **export_kwargs):
+    """
+    Exports a model for deployment, e.g. to CPU-only inference servers.
+
+    The model is traced (in eval mode) with `example_input`, which freezes the Python-level
+    control flow (e.g. the shape checks of the UNets) for inputs of the same rank.
+
+    Parameters
+    ----------
+    model : torch.nn.Module
+        The model to export.
+    example_input : torch.Tensor or tuple
+        Example input(s) to trace the model with.
+    path : str
+        Where to save the exported model. Required for ONNX.
+    format : {'torchscript', 'onnx'}
+        The export format. Exporting to ONNX requires the `onnx` package.
+    check : bool
+        Whether to check that the exported TorchScript module reproduces the output of
+        the model for `example_input`.
+    atol : float
+        Absolute tolerance for the check.
+    export_kwargs : dict
+        Keyword arguments passed on to `torch.onnx.export`.
+
+    Returns
+    -------
+    torch.jit.ScriptModule or str
+        The traced module for TorchScript, and `path` for ONNX.
+    """
+    assert_(isinstance(model, torch.nn.Module), "Model is not a torch module.",
+            NotTorchModuleError)
+    assert_(format in ['torchscript', 'onnx'],
+            "`format` must be one of ['torchscript', 'onnx'], got {}.".format(format),
+            ValueError)
+    example_inputs = example_input if isinstance(example_input, tuple) else (example_input,)
+    was_training = model.training
+    model.eval()
+    try:
+        with torch.no_grad(), warnings.catch_warnings():
+            # The shape checks in forward are expected to be frozen
+            warnings.simplefilter('ignore', torch.jit.TracerWarning)
+            if format == 'onnx':
+                assert_(path is not None, "A path is required to export to ONNX.", ValueError)
+                torch.onnx.export(model, example_inputs, path, **export_kwargs)
+                return path
+            traced = torch.jit.trace(model, example_inputs, check_trace=False)
+            if check:
+                expected, exported = model(*example_inputs), traced(*example_inputs)
+                expected = expected if isinstance(expected, tuple) else (expected,)
+                exported = exported if isinstance(exported, tuple) else (exported,)
+                assert_(all(torch.allclose(_expected, _exported, atol=atol)
+                            for _expected, _exported in zip(expected, exported)),
+                        "The exported model does not reproduce the output of the model.",
+                        RuntimeError)
+    finally:
+        model.train(was_training)
+    if path is not None:
+        traced.save(path)
+    return traced
+
+
+_CONV_TYPES = (nn.Conv1d, nn.Conv2d, nn.Conv3d,
+               nn.ConvTranspose1d, nn.ConvTranspose2d, nn.ConvTranspose3d)
+_BATCHNORM_TYPES = (nn.BatchNorm1d, nn.BatchNorm2d, nn.BatchNorm3d)
+
+
+def _get_trailing_conv(module):
+    # Returns the convolution that computes the output of `module` (if any)
+    from ..extensions.layers.convolutional import ConvActivation, BNReLUConvBaseND
+    if isinstance(module, _CONV_TYPES):
+        return module
+    elif isinstance(module, BNReLUConvBaseND):
+        # Batchnorm and activation come *before* the convolution
+        return module.conv
+    elif isinstance(module, ConvActivation) and module.activation is None:
+        return module.conv
+    return None
+
+
+def _get_leading_batchnorm(module):
+    # Returns the batchnorm that is applied first to the input of `module` (if any)
+    from ..extensions.layers.convolutional import BNReLUConvBaseND
+    from ..extensions.layers.normalization import BatchNormND
+    if isinstance(module, BNReLUConvBaseND):
+        module = module.batchnorm
+    if isinstance(module, BatchNormND):
+        module = module.bn
+    if isinstance(module, _BATCHNORM_TYPES) and module.running_mean is not None:
+        return module
+    return None
+
+
+def _fold_batchnorm_(conv, batchnorm):
+    transpose = isinstance(conv, (nn.ConvTranspose1d, nn.ConvTranspose2d, nn.ConvTranspose3d))
+    if transpose and conv.groups != 1:
+        return False
+    conv.weight, conv.bias = fuse_conv_bn_weights(conv.weight, conv.bias,
+                                                  batchnorm.running_mean, batchnorm.running_var,
+                                                  batchnorm.eps, batchnorm.weight, batchnorm.bias,
+                                                  transpose=transpose)
+    return True
+
+
+def _get_native_reshape(input_shape, output_shape):
+    # Returns a torch.nn module that reshapes `input_shape` to `output_shape` by merging or
+    # splitting a range of (non-batch) axes, or None if there's no such module
+    input_shape, output_shape = tuple(input_shape), tuple(output_shape)
+    if input_shape == output_shape:
+        return nn.Identity()
+    if not input_shape or not output_shape or input_shape[0] != output_shape[0]:
+        return None
+    # Strip the axes that are left alone
+    start = 0
+    while start < min(len(input_shape), len(output_shape)) and \
+            input_shape[start] == output_shape[start]:
+        start += 1
+    stop = 0
+    while stop < min(len(input_shape), len(output_shape)) - start and \
+            input_shape[-1 - stop] == output_shape[-1 - stop]:
+        stop += 1
+    input_axes = input_shape[start:len(input_shape) - stop]
+    output_axes = output_shape[start:len(output_shape) - stop]
+    if not input_axes or not output_axes:
+        # Only singleton axes are added or removed, so we merge or split the preceding axis
+        if start < 2:
+            return None
+        start -= 1
+        input_axes = input_shape[start:len(input_shape) - stop]
+        output_axes = output_shape[start:len(output_shape) - stop]
+    if len(output_axes) == 1:
+        return nn.Flatten(start, len(input_shape) - stop - 1)
+    if len(input_axes) == 1:
+        return nn.Unflatten(start, output_axes)
+    return None
+
+
+def _fuse_sequential_(sequential, reshape_shapes):
+    from ..extensions.layers.convolutional import BNReLUConvBaseND
+    from ..extensions.layers.identity import Identity
+    fused = OrderedDict()
+    trailing_conv = None
+    for name, module in sequential.named_children():
+        batchnorm = _get_leading_batchnorm(module)
+        next_trailing_conv = _get_trailing_conv(module)
+        if trailing_conv is not None and batchnorm is not None and \
+                _fold_batchnorm_(trailing_conv, batchnorm):
+            if isinstance(module, BNReLUConvBaseND):
+                module = nn.Sequential(module.activation, module.conv)
+            else:
+                # A bare batchnorm, which is now part of the preceding convolution
+                continue
+        if len(reshape_shapes.get(id(module), ())) == 1:
+            # Reshape layers that were applied to one shape only
+            native_reshape = _get_native_reshape(*next(iter(reshape_shapes[id(module)])))
+            if native_reshape is not None:
+                module = native_reshape
+        if isinstance(module, (Identity, nn.Identity)):
+            continue
+        fused[name] = module
+        trailing_conv = next_trailing_conv
+    sequential._modules = fused
+
+
+def _make_example_input(model, spatial_size=32):
+    # A small random input for the first layer of `model` (which is assumed to be the
+    # first convolutional or linear layer that was registered)
+    for module in model.modules():
+        if isinstance(module, _CONV_TYPES):
+            shape = (2, module.in_channels) + (spatial_size,) * len(module.kernel_size)
+        elif isinstance(module, nn.Linear):
+            shape = (2, module.in_features)
+        else:
+            continue
+        return torch.rand(shape, dtype=module.weight.dtype, device=module.weight.device)
+    return None
+
+
+def _as_tuple(outputs):
+    return outputs if isinstance(outputs, tuple) else (outputs,)
+
+
+def fuse_for_inference(model, example_input=None, atol=1e-5, inplace=False):
+    """
+    Fuses the layers of a model for faster inference.
+
+    This folds batchnorms into the preceding convolutions where the order of the layers
+    allows (e.g. `Conv2D` followed by `BatchNorm2d`, or a `BNReLUConv2D` following
+    another one), drops `Identity` layers and replaces the reshape layers (`View`,
+    `Flatten`, `AsMatrix`, `As2D` and `As3D`) by `torch.nn.Flatten` or `torch.nn.Unflatten`,
+    or drops them if they don't change the shape of their input. Only layers within
+    `torch.nn.Sequential` containers are fused.
+
+    The fused model is always checked to reproduce the output of `model`.
+
+    Parameters
+    ----------
+    model : torch.nn.Module
+        The model to fuse.
+    example_input : torch.Tensor or tuple
+        Input to check the fused model with, which also determines the shapes the
+        reshape layers are fused for. By default, a small random input is built from the
+        first convolutional or linear layer of `model`.
+    atol : float
+        Absolute tolerance for the check.
+    inplace : bool
+        Whether to fuse `model` itself instead of a copy.
+
+    Returns
+    -------
+    torch.nn.Module
+        The fused model (in eval mode).
+
+    Raises
+    ------
+    ValueError
+        If `example_input` is not given and no input can be built for `model`.
+    RuntimeError
+        If the fused model does not reproduce the output of `model`.
+    """
+    from ..extensions.layers.reshape import View, As2D, As3D
+    assert_(isinstance(model, torch.nn.Module), "Model is not a torch module.",
+            NotTorchModuleError)
+    input_is_built = example_input is None
+    if input_is_built:
+        example_input = _make_example_input(model)
+        assert_(example_input is not None,
+                "Can't build an input to check the fused model with, "
+                "please pass `example_input`.",
+                ValueError)
+    example_inputs = _as_tuple(example_input)
+    fused_model = model if inplace else copy.deepcopy(model)
+    fused_model.eval()
+    # Compute the expected output, and record the shapes the reshape layers are applied to
+    reshape_shapes = {}
+
+    def record_shapes(module, inputs, output):
+        reshape_shapes.setdefault(id(module), set()).add((tuple(inputs[0].shape),
+                                                          tuple(output.shape)))
+
+    hooks = [module.register_forward_hook(record_shapes)
+             for module in fused_model.modules() if isinstance(module, (View, As2D, As3D))]
+    try:
+        with torch.no_grad():
+            expected = _as_tuple(fused_model(*example_inputs))
+    except Exception as exception:
+        if not input_is_built:
+            raise
+        raise ValueError("Can't check the fused model with an input of shape {} (built "
+                         "from the first layer of the model), please pass `example_input`."
+                         .format(tuple(example_input.shape))) from exception
+    finally:
+        for hook in hooks:
+            hook.remove()
+    with torch.no_grad():
+        for module in list(fused_model.modules()):
+            if isinstance(module, nn.Sequential):
+                _fuse_sequential_(module, reshape_shapes)
+        output = _as_tuple(fused_model(*example_inputs))
+    assert_(len(expected) == len(output) and
+            all(torch.allclose(_expected, _output, atol=atol)
+                for _expected, _output in zip(expected, output)),
+            "The fused model does not reproduce the output of the model.",
+            RuntimeError)
+    return fused_model
+
+
 class ModelTester(object):
     def __init__(self, input_shape, expected_output_shape):
         self._is_cuda = False
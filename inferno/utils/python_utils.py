@@ -2,10 +2,13 @@
 import signal
 import warnings
 import functools
+import importlib
 import inspect
 import os
+import queue
+import sys
 
-from threading import current_thread, main_thread
+from threading import current_thread, main_thread, Thread
 
 
 def ensure_dir(directory):
@@ -113,6 +116,70 @@ class delayed_keyboard_interrupt(object):
                 self.old_handler(*self.signal_received)
 
 
+class BackgroundWorker(object):
+    """
+    Runs jobs on a background (daemon) thread, in the order they are submitted.
+
+    Jobs are queued in a bounded queue. When the queue is full, droppable jobs are dropped
+    (and counted), whereas the submission of other jobs blocks till there's room in the
+    queue. Exceptions raised by a job are re-raised by the next call to `submit` or `join`.
+    """
+    def __init__(self, max_queue_size=64, name=None):
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._exception = None
+        self.num_dropped = 0
+        self._thread = Thread(target=self._work, name=name, daemon=True)
+        self._thread.start()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                function, args, kwargs = job
+                function(*args, **kwargs)
+            except Exception as exception:
+                self._exception = exception
+            finally:
+                self._queue.task_done()
+
+    def _raise_if_failed(self):
+        if self._exception is not None:
+            exception, self._exception = self._exception, None
+            raise exception
+
+    @property
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def submit(self, function, *args, droppable=False, **kwargs):
+        """Submits a job. Returns False if the job was dropped, True otherwise."""
+        self._raise_if_failed()
+        if droppable:
+            try:
+                self._queue.put_nowait((function, args, kwargs))
+            except queue.Full:
+                self.num_dropped += 1
+                return False
+        else:
+            self._queue.put((function, args, kwargs))
+        return True
+
+    def join(self):
+        """Blocks till all submitted jobs are done."""
+        self._queue.join()
+        self._raise_if_failed()
+        return self
+
+    def close(self):
+        """Finishes the submitted jobs and stops the thread."""
+        if self.is_alive:
+            self._queue.put(None)
+            self._thread.join()
+        self._raise_if_failed()
+
+
 def get_config_for_name(config, name):
     config_for_name = {}
     for key, val in config.items():
@@ -123,6 +190,46 @@ def get_config_for_name(config, name):
             config_for_name.update({key: val})
     return config_for_name
 
+
+def lazy_module_attributes(module_name, submodules=(), attributes=None):
+    """
+    Builds the module level `__getattr__` and `__dir__` (PEP 562) for a package whose
+    submodules (and attributes defined in them) are imported only on first access.
+
+    Parameters
+    ----------
+    module_name : str
+        Name of the package (i.e. its `__name__`).
+    submodules : list of str
+        Names of the submodules to import lazily.
+    attributes : dict
+        Maps attribute names to the names of the submodules they're defined in.
+
+    Returns
+    -------
+    tuple
+        `__getattr__` and `__dir__` for the package.
+    """
+    submodules = set(submodules)
+    attributes = dict(attributes or {})
+
+    def __getattr__(name):
+        if name in submodules:
+            value = importlib.import_module('.' + name, module_name)
+        elif name in attributes:
+            value = getattr(importlib.import_module('.' + attributes[name], module_name), name)
+        else:
+            raise AttributeError("module '{}' has no attribute '{}'".format(module_name, name))
+        # Cache the attribute, such that __getattr__ isn't called for it again
+        setattr(sys.modules[module_name], name, value)
+        return value
+
+    def __dir__():
+        return sorted(set(vars(sys.modules[module_name])) | submodules | set(attributes))
+
+    return __getattr__, __dir__
+
+
 string_types = (type(b''), type(u''))
 
 
@@ -1,3 +1,4 @@
+import os
 import numpy as np
 import torch
 
@@ -140,13 +141,136 @@ def flatten_samples(input_):
     return flattened
 
 
-def clip_gradients_(parameters, mode, norm_or_value):
+def label_to_one_hot(labels, num_classes, dtype=torch.float32, dim=1):
+    """
+    Expands integer `labels` to one-hot vectors along the (new) axis `dim`, on the device
+    the labels are on. Labels outside of [0, num_classes) (e.g. ignore labels) give
+    all-zero vectors.
+    """
+    labels = labels.long().unsqueeze(dim)
+    shape = list(labels.shape)
+    shape[dim] = num_classes
+    # Out-of-range indices would make the scatter fail (or assert on the device)
+    valid = (labels >= 0) & (labels < num_classes)
+    return torch.zeros(shape, dtype=dtype, device=labels.device)\
+        .scatter_(dim, labels.masked_fill(~valid, 0), valid.to(dtype))
+
+
+def _group_gradients(parameters):
+    # The multi-tensor (foreach) kernels need tensors on the same device and of the same dtype
+    groups = {}
+    for parameter in parameters:
+        if parameter.grad is not None:
+            groups.setdefault((parameter.grad.device, parameter.grad.dtype), []) \
+                .append(parameter.grad)
+    return list(groups.values())
+
+
+def gradient_norm(parameters, norm_type=2.):
+    """
+    Computes the norm of the gradients of `parameters` (as if they were concatenated) with
+    multi-tensor kernels. Returns a scalar tensor on the device of the first gradient, i.e.
+    without synchronizing with the device, or None if no parameter has a gradient.
+    """
+    if torch.is_tensor(parameters):
+        parameters = [parameters]
+    groups = _group_gradients(parameters)
+    if len(groups) == 0:
+        return None
+    device = groups[0][0].device
+    norms = [norm.float().to(device)
+             for gradients in groups for norm in torch._foreach_norm(gradients, norm_type)]
+    return torch.linalg.vector_norm(torch.stack(norms), norm_type)
+
+
+def clip_gradients_(parameters, mode, norm_or_value, norm_type=2.):
+    """
+    Clips the gradients of `parameters` in place, either by their total norm (mode 'norm')
+    or elementwise (mode 'value'), with multi-tensor kernels and without synchronizing with
+    the device. Returns the total norm of the gradients before clipping (see
+    `gradient_norm`).
+    """
     assert_(mode in ['norm', 'value'],
             f"Mode must be 'norm' or 'value', got '{mode}' instead.",
             ValueError)
-    if mode == 'norm':
-        torch.nn.utils.clip_grad_norm_(parameters, norm_or_value)
-    elif mode == 'value':
-        torch.nn.utils.clip_grad_value_(parameters, norm_or_value)
-    else:
-        raise NotImplementedError
+    if torch.is_tensor(parameters):
+        parameters = [parameters]
+    parameters = list(parameters)
+    total_norm = gradient_norm(parameters, norm_type)
+    if total_norm is None:
+        return None
+    for gradients in _group_gradients(parameters):
+        if mode == 'norm':
+            clip_coefficient = torch.clamp(norm_or_value / (total_norm + 1e-6), max=1.)
+            torch._foreach_mul_(gradients, clip_coefficient.to(gradients[0].device,
+                                                               gradients[0].dtype))
+        elif mode == 'value':
+            torch._foreach_clamp_min_(gradients, -norm_or_value)
+            torch._foreach_clamp_max_(gradients, norm_or_value)
+        else:
+            raise NotImplementedError
+    return total_norm
+
+
+# Environment variables read by the common OpenMP / BLAS implementations
+THREAD_LIMIT_VARIABLES = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                          'NUMEXPR_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS')
+
+
+def get_available_cores():
+    """Returns the (sorted) CPU cores this process may run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def set_cpu_affinity(cores):
+    """Restricts this process to the given CPU cores (where supported). Returns success."""
+    if not cores or not hasattr(os, 'sched_setaffinity'):
+        return False
+    os.sched_setaffinity(0, set(cores))
+    return True
+
+
+def limit_threads(num_threads):
+    """Limits the threads used by torch, OpenMP and BLAS in this process."""
+    for variable in THREAD_LIMIT_VARIABLES:
+        os.environ[variable] = str(num_threads)
+    torch.set_num_threads(num_threads)
+    try:
+        # Also limits thread pools that were already started (if threadpoolctl is available)
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(num_threads)
+    except ImportError:
+        pass
+
+
+class WorkerThreadLimiter(object):
+    """
+    A `worker_init_fn` for data loaders which limits the threads of each worker (and pins
+    the workers to the given cores), such that the workers don't oversubscribe the CPU.
+    """
+    def __init__(self, num_threads=1, cores=None, worker_init_fn=None):
+        """
+        Parameters
+        ----------
+        num_threads : int
+            Number of threads per worker.
+        cores : list
+            CPU cores to distribute the workers over (round-robin). Not pinned if None.
+        worker_init_fn : callable
+            The `worker_init_fn` to call after limiting the threads.
+        """
+        # Don't wrap a limiter in a limiter
+        if isinstance(worker_init_fn, WorkerThreadLimiter):
+            worker_init_fn = worker_init_fn.worker_init_fn
+        self.num_threads = num_threads
+        self.cores = None if not cores else list(cores)
+        self.worker_init_fn = worker_init_fn
+
+    def __call__(self, worker_id):
+        limit_threads(self.num_threads)
+        if self.cores is not None:
+            set_cpu_affinity([self.cores[worker_id % len(self.cores)]])
+        if self.worker_init_fn is not None:
+            self.worker_init_fn(worker_id)
@@ -1,5 +1,8 @@
 """Utilities for training."""
+from contextlib import contextmanager
+import random
 import numpy as np
+import torch
 from .exceptions import assert_, FrequencyTypeError, FrequencyValueError
 
 
@@ -54,6 +57,302 @@ class MovingAverage(object):
             return None
 
 
+class ScalarAccumulator(object):
+    """
+    Accumulates scalars (e.g. losses) on the device they're on, i.e. without synchronizing
+    with the device on every update. The last value, the mean and whether all values were
+    finite are only copied to the host by `flush`.
+    """
+    def __init__(self):
+        self._last = None
+        self._sum = None
+        self._all_finite = None
+        self.count = 0
+
+    def reset(self):
+        self._last = None
+        self._sum = None
+        self._all_finite = None
+        self.count = 0
+
+    def update(self, value):
+        if torch.is_tensor(value):
+            value = value.detach().float()
+            if value.dim() > 0:
+                value = value.mean()
+        else:
+            value = torch.tensor(float(value))
+        is_finite = torch.isfinite(value)
+        if self.count == 0:
+            self._sum = value.clone()
+            self._all_finite = is_finite
+        else:
+            self._sum.add_(value.to(self._sum.device))
+            self._all_finite = self._all_finite & is_finite.to(self._all_finite.device)
+        self._last = value
+        self.count += 1
+        return self
+
+    def flush(self):
+        """
+        Copies the accumulated values to the host (in one go) and resets.
+
+        Returns
+        -------
+        dict or None
+            With keys 'last', 'mean', 'all_finite' and 'count', or None if nothing
+            was accumulated since the last flush.
+        """
+        if self.count == 0:
+            return None
+        last, mean, all_finite = torch.stack([self._last.to(self._sum.device),
+                                              self._sum / self.count,
+                                              self._all_finite.float()]).tolist()
+        summary = {'last': last, 'mean': mean, 'all_finite': bool(all_finite),
+                   'count': self.count}
+        self.reset()
+        return summary
+
+
+class StreamingHistogram(object):
+    """
+    Accumulates a histogram of tensor values over several updates, without leaving the device.
+
+    The exact minimum, maximum, sum, sum of squares and number of values are accumulated over
+    all values. The bucket counts are estimated from a bounded random subsample: a reservoir
+    of at most `max_samples` values, in which every update is (in expectation) equally
+    represented. Nothing is transferred to the host before `summarize` is called.
+    """
+    def __init__(self, bins=100, max_samples=2 ** 14):
+        self.bins = bins
+        self.max_samples = max_samples
+        self.reset()
+
+    def reset(self):
+        self._reservoir = None
+        self._num_updates = 0
+        self._min = None
+        self._max = None
+        self._sum = None
+        self._sum_squares = None
+        self._num = 0
+
+    @property
+    def is_empty(self):
+        return self._reservoir is None
+
+    def update(self, tensor):
+        values = tensor.detach().reshape(-1)
+        if values.numel() == 0:
+            return self
+        values = values.float()
+        # Exact statistics (these are reductions on the device, i.e. no host sync)
+        # The sum of squares is a dot product, which needs no temporary of the values' size
+        min_, max_ = torch.aminmax(values)
+        sum_, sum_squares = values.sum(), torch.dot(values, values)
+        if self.is_empty:
+            self._min, self._max = min_, max_
+            self._sum, self._sum_squares = sum_, sum_squares
+        else:
+            self._min = torch.min(self._min, min_)
+            self._max = torch.max(self._max, max_)
+            self._sum = self._sum + sum_
+            self._sum_squares = self._sum_squares + sum_squares
+        self._num += values.numel()
+        self._num_updates += 1
+        # Subsample
+        if self.is_empty:
+            reservoir_size = min(values.numel(), self.max_samples)
+        else:
+            reservoir_size = self._reservoir.numel()
+        if values.numel() != reservoir_size:
+            values = values[torch.randint(values.numel(), (reservoir_size,),
+                                          device=values.device)]
+        if self.is_empty:
+            self._reservoir = values.clone()
+        else:
+            # Replace a random fraction 1 / num_updates of the reservoir with the new values,
+            # such that all updates are equally represented.
+            replace = torch.rand(reservoir_size, device=values.device) < \
+                (1. / self._num_updates)
+            self._reservoir = torch.where(replace, values, self._reservoir)
+        return self
+
+    def summarize(self):
+        """
+        Returns the histogram as a dictionary with the keys 'min', 'max', 'num', 'sum',
+        'sum_squares', 'bucket_limits' and 'bucket_counts', or None if nothing was accumulated.
+        """
+        if self.is_empty:
+            return None
+        min_, max_ = self._min.item(), self._max.item()
+        if not (np.isfinite(min_) and np.isfinite(max_)):
+            return None
+        low, high = (min_, max_) if max_ > min_ else (min_ - 0.5, max_ + 0.5)
+        counts = torch.histc(self._reservoir, bins=self.bins, min=low, max=high)
+        # Scale the counts from the subsample to all values
+        counts = counts * (self._num / self._reservoir.numel())
+        return {'min': min_, 'max': max_, 'num': self._num,
+                'sum': self._sum.item(), 'sum_squares': self._sum_squares.item(),
+                'bucket_limits': np.linspace(low, high, self.bins + 1)[1:].tolist(),
+                'bucket_counts': counts.cpu().tolist()}
+
+
+class LayerStatistics(object):
+    """
+    Collects the norm, mean, variance and sparsity (fraction of zeros) of the outputs of
+    the layers of a module, and of the gradients w.r.t. these outputs, on the device.
+
+    The hooks are only registered while sampling (between `start_sample` and `end_sample`),
+    so they cost nothing in between. Every sample is written to a row of a fixed-size ring
+    buffer on the device, and nothing is copied to the host before `flush` is called.
+    """
+    STATISTICS = ('norm', 'mean', 'variance', 'sparsity')
+    KINDS = ('activations', 'gradients')
+
+    def __init__(self, module, layer_types=None, num_sampled_layers=None, buffer_size=32,
+                 activations=True, gradients=True, seed=None):
+        """
+        Parameters
+        ----------
+        module : torch.nn.Module
+            Module whose layers to collect statistics of.
+        layer_types : type or tuple
+            Types of the layers to consider. By default, all modules that have parameters
+            of their own (i.e. not only in their children).
+        num_sampled_layers : int
+            Number of (randomly chosen) layers to collect statistics of per sample. By
+            default, all layers.
+        buffer_size : int
+            Number of samples the ring buffer holds. Samples that aren't flushed in time
+            are overwritten.
+        activations : bool
+            Whether to collect statistics of the layer outputs.
+        gradients : bool
+            Whether to collect statistics of the gradients w.r.t. the layer outputs.
+        seed : int
+            Seed for choosing the sampled layers.
+        """
+        if layer_types is None:
+            self.layers = [(name, layer) for name, layer in module.named_modules()
+                           if next(layer.parameters(recurse=False), None) is not None]
+        else:
+            self.layers = [(name, layer) for name, layer in module.named_modules()
+                           if isinstance(layer, layer_types)]
+        assert_(len(self.layers) > 0, "Found no layers to collect statistics of.", ValueError)
+        self.num_sampled_layers = num_sampled_layers
+        self.buffer_size = buffer_size
+        self.activations = activations
+        self.gradients = gradients
+        self._random = random.Random(seed)
+        self._buffer = None
+        self._steps = [None] * buffer_size
+        self._next_row = 0
+        self._num_pending = 0
+        self._row = None
+        self._handles = []
+
+    @property
+    def num_pending(self):
+        """Number of samples in the buffer that weren't flushed yet."""
+        return self._num_pending
+
+    @property
+    def is_sampling(self):
+        return self._row is not None
+
+    def start_sample(self, step):
+        """Registers the hooks to collect a sample, which is recorded as `step`."""
+        if self.is_sampling:
+            self.end_sample()
+        self._row = self._next_row
+        self._next_row = (self._next_row + 1) % self.buffer_size
+        self._num_pending = min(self._num_pending + 1, self.buffer_size)
+        self._steps[self._row] = step
+        if self._buffer is not None:
+            # Layers that aren't sampled stay NaN
+            self._buffer[self._row].fill_(float('nan'))
+        layer_indices = range(len(self.layers))
+        if self.num_sampled_layers is not None and self.num_sampled_layers < len(self.layers):
+            layer_indices = self._random.sample(layer_indices, self.num_sampled_layers)
+        for layer_index in layer_indices:
+            self._handles.append(self.layers[layer_index][1].register_forward_hook(
+                self._make_forward_hook(self._row, layer_index)))
+        return self
+
+    def end_sample(self):
+        """Removes the hooks."""
+        for handle in self._handles:
+            handle.remove()
+        self._handles = []
+        self._row = None
+        return self
+
+    @contextmanager
+    def sample(self, step):
+        self.start_sample(step)
+        try:
+            yield self
+        finally:
+            self.end_sample()
+
+    def _make_forward_hook(self, row, layer_index):
+        def hook(module, inputs, output):
+            if isinstance(output, (list, tuple)):
+                output = output[0] if len(output) > 0 else None
+            if not torch.is_tensor(output) or not output.is_floating_point():
+                return
+            if self.activations:
+                self._record(row, 0, layer_index, output)
+            if self.gradients and output.requires_grad:
+                output.register_hook(
+                    lambda gradient: self._record(row, 1, layer_index, gradient))
+        return hook
+
+    def _record(self, row, kind, layer_index, tensor):
+        tensor = tensor.detach()
+        if self._buffer is None:
+            self._buffer = torch.full((self.buffer_size, len(self.KINDS), len(self.layers),
+                                       len(self.STATISTICS)), float('nan'),
+                                      device=tensor.device)
+        variance, mean = torch.var_mean(tensor.float(), unbiased=False)
+        norm = torch.linalg.vector_norm(tensor).float()
+        sparsity = 1. - torch.count_nonzero(tensor).float() / max(tensor.numel(), 1)
+        self._buffer[row, kind, layer_index] = \
+            torch.stack([norm, mean, variance, sparsity]).to(self._buffer.device)
+
+    def flush(self):
+        """
+        Copies the pending samples to the host (in one go).
+
+        Returns
+        -------
+        list
+            Of (step, statistics) tuples, oldest first, where statistics is a dictionary
+            mapping tags like 'activations/<layer name>/norm' to floats.
+        """
+        if self._num_pending == 0 or self._buffer is None:
+            self._num_pending = 0
+            return []
+        rows = [(self._next_row - self._num_pending + num) % self.buffer_size
+                for num in range(self._num_pending)]
+        if self.is_sampling:
+            # The current sample isn't complete yet
+            rows = rows[:-1]
+        buffer = self._buffer[rows].cpu().numpy()
+        samples = []
+        for row, values in zip(rows, buffer):
+            statistics = {}
+            for (kind_index, layer_index, statistic_index), value in np.ndenumerate(values):
+                if not np.isnan(value):
+                    statistics['{}/{}/{}'.format(self.KINDS[kind_index],
+                                                 self.layers[layer_index][0],
+                                                 self.STATISTICS[statistic_index])] = float(value)
+            samples.append((self._steps[row], statistics))
+        self._num_pending = 1 if self.is_sampling else 0
+        return samples
+
+
 class CLUI(object):
     """Command Line User Interface"""
 
@@ -92,6 +391,9 @@ class CLUI(object):
 
 
 class Frequency(object):
+    # Incremented whenever the value or units change (a class attribute, such that
+    # frequencies from old checkpoints have it too)
+    _version = 0
 
     def __init__(self, value=None, units=None):
         # Private
@@ -113,6 +415,7 @@ class Frequency(object):
             value = np.inf
         self.assert_value_consistent(value)
         self._value = value
+        self._version += 1
 
     UNIT_PRIORITY = 'iterations'
     VALID_UNIT_NAME_MAPPING = {'iterations': 'iterations',
@@ -130,6 +433,7 @@ class Frequency(object):
             value = self.UNIT_PRIORITY
         self.assert_units_consistent(value)
         self._units = self.VALID_UNIT_NAME_MAPPING.get(value)
+        self._version += 1
 
     def assert_value_consistent(self, value=None):
         value = value or self.value
@@ -196,6 +500,17 @@ class Frequency(object):
             self._last_match_value = match_value
         return match
 
+    def next_match(self, count, match_zero=True):
+        """
+        Returns the smallest count (in `self.units`) not smaller than `count` at which
+        this frequency matches, or `np.inf` if it never does.
+        """
+        if self.value == np.inf:
+            return np.inf
+        if count == 0 and not match_zero:
+            return self.value
+        return -(-count // self.value) * self.value
+
     def __str__(self):
         return "{} {}".format(self.value, self.units)
 
@@ -262,6 +577,139 @@ class Duration(Frequency):
         return Duration(value=(self.value - other.value), units=self.units)
 
 
+class _ScheduleEntry(object):
+    __slots__ = ['frequency', 'match_zero', 'version', 'by_iteration', 'valid_from',
+                 'next_match']
+
+    def __init__(self, frequency, match_zero):
+        self.frequency = frequency
+        self.match_zero = match_zero
+        self.version = frequency._version
+        self.by_iteration = frequency.units == 'iterations'
+        # The frequency doesn't match for any count in [valid_from, next_match), and
+        # matches at `next_match`. The range is empty until the first `advance`.
+        self.valid_from = 1
+        self.next_match = 0
+
+    @property
+    def units(self):
+        return 'iterations' if self.by_iteration else 'epochs'
+
+    @property
+    def is_stale(self):
+        return self.version != self.frequency._version
+
+    def advance(self, count):
+        """Returns the next match (not before `count`), computing it if `count` is past it."""
+        if not self.valid_from <= count <= self.next_match:
+            self.valid_from = count
+            self.next_match = self.frequency.next_match(count, match_zero=self.match_zero)
+        return self.next_match
+
+
+class Schedule(object):
+    """
+    Matches a set of named `Frequency`s against the iteration and epoch counts.
+
+    For every frequency, the count at which it next matches is computed once (and again
+    only when that count is passed, or the frequency is changed), such that checking
+    whether it matches before then is a single range comparison. Since the next matches
+    are known in advance, the schedule can also tell what fires now (`firing`) and what
+    fires next (`upcoming`, `iterations_until`).
+    """
+    def __init__(self):
+        self._entries = {}
+
+    def register(self, name, frequency, match_zero=True):
+        """Registers (or replaces) the frequency `name`."""
+        frequency = Frequency.build_from(frequency)
+        self._entries[name] = _ScheduleEntry(frequency, match_zero)
+        return self
+
+    def unregister(self, name):
+        self._entries.pop(name, None)
+        return self
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    @property
+    def names(self):
+        return list(self._entries.keys())
+
+    def _get_entry(self, name, frequency=None, match_zero=True):
+        entry = self._entries.get(name)
+        if frequency is not None and (entry is None or entry.frequency is not frequency or
+                                      entry.match_zero != match_zero):
+            self.register(name, frequency, match_zero=match_zero)
+            entry = self._entries[name]
+        assert_(entry is not None, "No frequency named '{}' is registered.".format(name),
+                KeyError)
+        if entry.is_stale:
+            # The frequency was modified since it was registered
+            self.register(name, entry.frequency, match_zero=entry.match_zero)
+            entry = self._entries[name]
+        return entry
+
+    def fires(self, name, frequency=None, iteration_count=None, epoch_count=None,
+              persistent=False, match_zero=True):
+        """
+        Whether the frequency `name` matches the given counts; this is equivalent to
+        `Frequency.match`. If `frequency` is given, it's registered as `name` if it's not
+        already.
+        """
+        entry = self._entries.get(name)
+        if entry is None or (frequency is not None and frequency is not entry.frequency) or \
+                entry.match_zero != match_zero or entry.version != entry.frequency._version:
+            entry = self._get_entry(name, frequency, match_zero)
+        count = iteration_count if entry.by_iteration else epoch_count
+        if count is None:
+            return False
+        if entry.valid_from <= count < entry.next_match:
+            # Nothing fires before the precomputed next match
+            return False
+        if count != entry.advance(count):
+            return False
+        if persistent:
+            # Persistency is kept track of by the frequency, like in `Frequency.match`
+            if entry.frequency._last_match_value == count:
+                return False
+            entry.frequency._last_match_value = count
+        return True
+
+    def firing(self, iteration_count=None, epoch_count=None):
+        """Returns the names of the frequencies that match the given counts."""
+        return [name for name in self._entries
+                if self.fires(name, iteration_count=iteration_count, epoch_count=epoch_count)]
+
+    def upcoming(self, iteration_count=None, epoch_count=None):
+        """
+        Returns a list of `(count, units, name)` for the next match of every frequency,
+        sorted by count (separately for iterations and epochs, in that order). Frequencies
+        that never match are left out.
+        """
+        events = []
+        for name, entry in self._entries.items():
+            entry = self._get_entry(name)
+            count = iteration_count if entry.units == 'iterations' else epoch_count
+            if count is None:
+                continue
+            next_match = entry.advance(count)
+            if next_match != np.inf:
+                events.append((next_match, entry.units, name))
+        return sorted(events, key=lambda event: (event[1] != 'iterations', event[0]))
+
+    def iterations_until(self, name, iteration_count):
+        """
+        Returns the number of iterations until the frequency `name` next matches, or None
+        if it's measured in epochs (or `np.inf` if it never matches).
+        """
+        entry = self._get_entry(name)
+        if entry.units != 'iterations':
+            return None
+        return entry.advance(iteration_count) - iteration_count
+
+
 class NoLogger(object):
     def __init__(self, logdir=None):
         self.logdir = logdir
@@ -98,6 +98,30 @@ class TestGraph(unittest.TestCase):
         model.add_output_node('output_0', previous='conv1')
         ModelTester((1, 1, 100, 100), (1, 1, 100, 100))(model)
 
+    def test_execution_plan_caching(self):
+        from inferno.extensions.containers.graph import Graph
+
+        DummyNamedModule = self.DummyNamedModule
+        history = []
+        model = Graph()
+        model.add_input_node('input_0')
+        model.add_node('conv0', DummyNamedModule('conv0', history), 'input_0')
+        model.add_output_node('output_0', 'conv0')
+        x = torch.rand(10, 10)
+        self.assertTrue(torch.equal(model(x), x))
+        plan = model.execution_plan
+        model(x)
+        # The plan is built once ...
+        self.assertIs(model.execution_plan, plan)
+        # ... and rebuilt when the graph changes
+        model.add_node('conv1', DummyNamedModule('conv1', history), 'conv0')
+        model.add_output_node('output_1', 'conv1')
+        self.assertIsNone(model._execution_plan)
+        output_0, output_1 = model(x)
+        self.assertTrue(torch.equal(output_0, x))
+        self.assertTrue(torch.equal(output_1, x))
+        self.assertEqual(history, ['conv0', 'conv0', 'conv0', 'conv1'])
+
     @unittest.skipUnless(torch.cuda.is_available(), "No cuda.")
     def test_graph_device_transfers(self):
         from inferno.extensions.containers.graph import Graph
@@ -0,0 +1,59 @@
+import unittest
+import torch
+import torch.nn as nn
+from inferno.extensions.containers import PipelineParallel
+from inferno.extensions.layers.device import OnDevice
+
+
+class _Fail(nn.Module):
+    def forward(self, input_):
+        raise ValueError("Stage failed.")
+
+
+class PipelineParallelTest(unittest.TestCase):
+    def _make_stages(self):
+        torch.manual_seed(42)
+        return [OnDevice(nn.Sequential(nn.Linear(8, 16), nn.ReLU()), 'cpu'),
+                nn.Linear(16, 16),
+                OnDevice(nn.Linear(16, 4), 'cpu')]
+
+    def test_matches_sequential(self):
+        pipeline = PipelineParallel(*self._make_stages(), num_micro_batches=3)
+        sequential = nn.Sequential(*self._make_stages())
+        input_ = torch.rand(10, 8)
+        output = pipeline(input_)
+        expected = sequential(input_)
+        self.assertEqual(output.shape, (10, 4))
+        self.assertTrue(torch.allclose(output, expected, atol=1e-6))
+        # Gradients flow through all stages (and threads)
+        output.sum().backward()
+        expected.sum().backward()
+        for p_pipeline, p_sequential in zip(pipeline.parameters(), sequential.parameters()):
+            self.assertTrue(torch.allclose(p_pipeline.grad, p_sequential.grad, atol=1e-5))
+        # Grad mode is respected by the stage threads
+        with torch.no_grad():
+            self.assertFalse(pipeline(input_).requires_grad)
+
+    def test_failure(self):
+        pipeline = PipelineParallel(nn.Linear(8, 8), _Fail(), nn.Linear(8, 8),
+                                    num_micro_batches=2)
+        with self.assertRaises(ValueError):
+            pipeline(torch.rand(4, 8))
+
+    @unittest.skipIf(torch.cuda.device_count() < 2, "Need at least two GPUs.")
+    def test_streamed(self):
+        stages = self._make_stages()
+        pipeline = PipelineParallel(OnDevice(stages[0], 'cuda', device_ordinal=0),
+                                    OnDevice(stages[1], 'cuda', device_ordinal=1),
+                                    OnDevice(stages[2], 'cuda', device_ordinal=1),
+                                    num_micro_batches=4)
+        input_ = torch.rand(16, 8)
+        output = pipeline(input_.cuda(0))
+        expected = nn.Sequential(*self._make_stages())(input_)
+        self.assertEqual(output.device, torch.device('cuda', 1))
+        self.assertTrue(torch.allclose(output.cpu(), expected, atol=1e-5))
+        output.sum().backward()
+
+
+if __name__ == '__main__':
+    unittest.main()
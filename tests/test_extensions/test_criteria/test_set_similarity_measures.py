@@ -1,4 +1,5 @@
 import unittest
+import numpy as np
 import torch
 
 
@@ -31,6 +32,47 @@ class TestSorensenDice(SetSimilarityTest):
         # Compare
         self.assertAlmostEqual(expected_channelwise_loss.item(), channelwise_loss.item())
 
+    def test_gradients(self):
+        from inferno.extensions.criteria.set_similarity_measures import SorensenDiceLoss
+        x = torch.rand(2, 3, 4, 5, dtype=torch.float64, requires_grad=True)
+        y = torch.rand(2, 3, 4, 5, dtype=torch.float64, requires_grad=True)
+        weight = torch.rand(3, dtype=torch.float64)
+        self.assertTrue(torch.autograd.gradcheck(SorensenDiceLoss(weight=weight), (x, y)))
+        self.assertTrue(torch.autograd.gradcheck(SorensenDiceLoss(channelwise=False), (x, y)))
+        # Compare with the explicit formula
+        loss = SorensenDiceLoss()(x, y)
+        expected_loss = -2 * ((x * y).sum((0, 2, 3)) /
+                              ((x * x).sum((0, 2, 3)) + (y * y).sum((0, 2, 3)))).sum()
+        self.assertAlmostEqual(expected_loss.item(), loss.item())
+
+    def test_label_targets(self):
+        from inferno.extensions.criteria.set_similarity_measures import SorensenDiceLoss
+        from inferno.io.transform.generic import Label2OneHot
+        x = torch.rand(2, 4, 5, 6, dtype=torch.float64, requires_grad=True)
+        labels = torch.randint(0, 4, (2, 5, 6))
+        # The one-hot targets, expanded on the device from the collated labels
+        one_hot = Label2OneHot(4, dtype='double').apply_to_collated_batch(labels)
+        self.assertTrue(torch.equal(one_hot.argmax(1), labels))
+        self.assertTrue(torch.equal(
+            one_hot[0], torch.from_numpy(Label2OneHot(4, dtype='double')(labels[0].numpy()))))
+        for channelwise in [True, False]:
+            loss = SorensenDiceLoss(channelwise=channelwise)
+            self.assertAlmostEqual(loss(x, labels).item(), loss(x, one_hot).item())
+        self.assertTrue(torch.autograd.gradcheck(lambda x: SorensenDiceLoss()(x, labels), (x,)))
+        # Labels out of range (e.g. ignore labels) give all-zero vectors, like per sample
+        one_hot = Label2OneHot(3).apply_to_collated_batch(torch.tensor([[0, 1, -1]]))
+        self.assertTrue(torch.equal(one_hot, torch.tensor([[[1., 0., 0.],
+                                                            [0., 1., 0.],
+                                                            [0., 0., 0.]]])))
+        self.assertTrue(torch.equal(
+            one_hot[0], torch.from_numpy(Label2OneHot(3)(np.array([0, 1, -1])))))
+        labels[0, 0, :3] = torch.tensor([-1, 4, 255])
+        one_hot = Label2OneHot(4, dtype='double').apply_to_collated_batch(labels)
+        self.assertTrue(torch.equal(one_hot[0, :, 0, :3], torch.zeros(4, 3, dtype=torch.float64)))
+        for channelwise in [True, False]:
+            loss = SorensenDiceLoss(channelwise=channelwise)
+            self.assertAlmostEqual(loss(x, labels).item(), loss(x, one_hot).item())
+
 
 class TestGeneralizedSorensenDice(SetSimilarityTest):
     def test_channelwise(self):
@@ -46,6 +88,27 @@ class TestGeneralizedSorensenDice(SetSimilarityTest):
         # Compare
         self.assertAlmostEqual(expected_channelwise_loss.item(), channelwise_loss.item())
 
+    def test_label_targets(self):
+        from inferno.extensions.criteria.set_similarity_measures import GeneralizedDiceLoss
+        from inferno.utils.torch_utils import label_to_one_hot
+        x, _ = self.get_dummy_variables_with_channels_and_classes()
+        labels = torch.randint(0, 5, (3, 2, 100, 100))
+        # With some ignore labels
+        labels[0, :, 0, :2] = torch.tensor([-1, 255])
+        self.assertAlmostEqual(GeneralizedDiceLoss(channelwise=True)(x, labels).item(),
+                               GeneralizedDiceLoss(channelwise=True)(
+                                   x, label_to_one_hot(labels, 5, dim=2)).item(), places=5)
+        self.assertAlmostEqual(GeneralizedDiceLoss()(x[:, 0], labels[:, 0]).item(),
+                               GeneralizedDiceLoss()(
+                                   x[:, 0], label_to_one_hot(labels[:, 0], 5)).item(), places=5)
+
+    def test_gradients(self):
+        from inferno.extensions.criteria.set_similarity_measures import GeneralizedDiceLoss
+        x = torch.rand(2, 3, 4, 5, dtype=torch.float64, requires_grad=True)
+        y = torch.rand(2, 3, 4, 5, dtype=torch.float64, requires_grad=True)
+        self.assertTrue(torch.autograd.gradcheck(GeneralizedDiceLoss(), (x, y)))
+        self.assertTrue(torch.autograd.gradcheck(GeneralizedDiceLoss(channelwise=True), (x, y)))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,4 +1,6 @@
 import unittest
+import numpy as np
+import torch
 import torch.cuda as cuda
 from inferno.utils.model_utils import ModelTester, MultiscaleModelTester
 from inferno.extensions.models import UNet
@@ -14,6 +16,13 @@ class _MultiscaleUNet(UNet):
         return tuple(x)
 
 
+class _BatchNormUNet(UNet):
+    def conv_op_factory(self, in_channels, out_channels, part, index):
+        return torch.nn.Sequential(torch.nn.Conv2d(in_channels, out_channels, 3, padding=1),
+                                   torch.nn.BatchNorm2d(out_channels),
+                                   torch.nn.ELU()), False
+
+
 class UNetTest(unittest.TestCase):
     def test_unet_2d(self):
         tester = ModelTester((1, 1, 256, 256), (1, 1, 256, 256))
@@ -53,6 +62,73 @@ class UNetTest(unittest.TestCase):
             tester.cuda()
         tester(_UNetInversePyramid(1, 1, dim=2, depth=3, initial_features=8))
 
+    def test_memory_efficient_unet(self):
+        torch.manual_seed(0)
+        model = UNet(1, 2, dim=2, depth=3, initial_features=4)
+        efficient_model = UNet(1, 2, dim=2, depth=3, initial_features=4,
+                               memory_efficient=True)
+        efficient_model.load_state_dict(model.state_dict())
+        self.assertSetEqual(efficient_model.checkpoint_levels, {0, 1, 2, 3})
+        input_ = torch.rand(2, 1, 32, 32)
+        # Outputs and gradients must match with activation checkpointing
+        output = model(input_)
+        output.sum().backward()
+        efficient_output = efficient_model(input_)
+        efficient_output.sum().backward()
+        self.assertTrue(torch.allclose(output, efficient_output, atol=1e-6))
+        for parameter, efficient_parameter in zip(model.parameters(),
+                                                  efficient_model.parameters()):
+            self.assertTrue(torch.allclose(parameter.grad, efficient_parameter.grad,
+                                           atol=1e-5))
+        # Without autograd, nothing is recomputed
+        with torch.no_grad():
+            self.assertTrue(torch.allclose(model(input_), efficient_model(input_), atol=1e-6))
+        with self.assertRaises(RuntimeError):
+            UNet(1, 2, dim=2, depth=3, checkpoint_levels=[4])
+
+    def test_memory_efficient_unet_batchnorm(self):
+        torch.manual_seed(0)
+        model = _BatchNormUNet(1, 2, dim=2, depth=2, initial_features=4)
+        efficient_model = _BatchNormUNet(1, 2, dim=2, depth=2, initial_features=4,
+                                         memory_efficient=True)
+        efficient_model.load_state_dict(model.state_dict())
+        input_ = torch.rand(2, 1, 16, 16)
+        model(input_).sum().backward()
+        efficient_model(input_).sum().backward()
+        # The running statistics are updated once, not again when recomputed
+        for name, buffer in model.state_dict().items():
+            self.assertTrue(torch.allclose(buffer, efficient_model.state_dict()[name],
+                                           atol=1e-6), name)
+        model.eval()
+        efficient_model.eval()
+        with torch.no_grad():
+            self.assertTrue(torch.allclose(model(input_), efficient_model(input_), atol=1e-6))
+
+    def test_unet_compile(self):
+        # The UNet must be captured without graph breaks
+        model = torch.compile(UNet(1, 2, dim=2, depth=2, initial_features=4),
+                              fullgraph=True, backend='eager')
+        self.assertEqual(model(torch.rand(1, 1, 32, 32)).shape, (1, 2, 32, 32))
+
+    def test_predict_tiled(self):
+        torch.manual_seed(0)
+        model = UNet(1, 2, dim=2, depth=2, initial_features=4).eval()
+        input_ = torch.rand(1, 1, 128, 128)
+        with torch.no_grad():
+            expected = model(input_)
+        # With a halo covering the receptive field, the tiles match the full prediction
+        prediction = model.predict_tiled(input_, tile_shape=32, halo=32, batch_size=3)
+        self.assertEqual(prediction.shape, expected.shape)
+        self.assertTrue(torch.allclose(prediction[:, :, 32:-32, 32:-32],
+                                       expected[:, :, 32:-32, 32:-32], atol=1e-5))
+        # Tiles are grown to a valid shape and can be read from / written to arrays
+        input_ = np.random.rand(2, 1, 50, 70).astype('float32')
+        out = np.zeros((2, 2, 50, 70), dtype='float32')
+        model.predict_tiled(input_, tile_shape=(15, 20), halo=(4, 2), out=out)
+        prediction = model.predict_tiled(torch.from_numpy(input_), tile_shape=(15, 20),
+                                         halo=(4, 2), batch_size=4)
+        self.assertTrue(np.allclose(out, prediction.numpy(), atol=1e-5))
+
 
 if __name__ == '__main__':
     unittest.main()
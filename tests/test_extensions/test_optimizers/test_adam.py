@@ -0,0 +1,78 @@
+import math
+import unittest
+import torch
+import torch.nn as nn
+from inferno.extensions.optimizers import Adam, AnnealedAdam
+
+
+def reference_step(parameters, states, lr=1e-3, betas=(0.9, 0.999), eps=1e-8,
+                   lambda_l1=0, weight_decay=0):
+    beta1, beta2 = betas
+    for p, state in zip(parameters, states):
+        grad = p.grad + lambda_l1 * p.sign() + weight_decay * p
+        state['step'] += 1
+        state['exp_avg'].mul_(beta1).add_(grad, alpha=1 - beta1)
+        state['exp_avg_sq'].mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
+        denom = state['exp_avg_sq'].sqrt().add_(eps)
+        bias_correction1 = 1 - beta1 ** state['step']
+        bias_correction2 = 1 - beta2 ** state['step']
+        step_size = lr * math.sqrt(bias_correction2) / bias_correction1
+        p.data.addcdiv_(state['exp_avg'], denom, value=-step_size)
+
+
+class TestAdam(unittest.TestCase):
+    def _make_parameters(self):
+        torch.manual_seed(0)
+        # Mixed dtypes end up in different multi-tensor groups
+        return [nn.Parameter(torch.randn(4, 3)), nn.Parameter(torch.randn(5)),
+                nn.Parameter(torch.randn(2, 2, dtype=torch.float64))]
+
+    def _set_gradients(self, parameters, seed):
+        generator = torch.Generator().manual_seed(seed)
+        for p in parameters:
+            p.grad = torch.randn(p.shape, generator=generator).to(p.dtype)
+
+    def test_matches_reference(self):
+        kwargs = dict(lr=1e-2, lambda_l1=1e-2, weight_decay=1e-3)
+        parameters = self._make_parameters()
+        reference_parameters = [p.detach().clone() for p in parameters]
+        states = [{'step': 0, 'exp_avg': torch.zeros_like(p), 'exp_avg_sq': torch.zeros_like(p)}
+                  for p in parameters]
+        optimizer = Adam(parameters, **kwargs)
+        for step in range(5):
+            self._set_gradients(parameters, step)
+            self._set_gradients(reference_parameters, step)
+            gradients = [p.grad.clone() for p in parameters]
+            optimizer.step()
+            reference_step(reference_parameters, states, **kwargs)
+            # The gradients are left alone
+            for p, gradient in zip(parameters, gradients):
+                self.assertTrue(torch.equal(p.grad, gradient))
+        for p, p_reference in zip(parameters, reference_parameters):
+            self.assertTrue(torch.allclose(p, p_reference, atol=1e-6))
+
+    def test_matches_torch_adam(self):
+        parameters = self._make_parameters()
+        torch_parameters = [nn.Parameter(p.detach().clone()) for p in parameters]
+        optimizer = Adam(parameters, lr=1e-2, weight_decay=1e-3)
+        torch_optimizer = torch.optim.Adam(torch_parameters, lr=1e-2, weight_decay=1e-3)
+        for step in range(5):
+            self._set_gradients(parameters, step)
+            self._set_gradients(torch_parameters, step)
+            optimizer.step()
+            torch_optimizer.step()
+        for p, p_torch in zip(parameters, torch_parameters):
+            self.assertTrue(torch.allclose(p, p_torch, atol=1e-6))
+
+    def test_annealed_adam(self):
+        parameters = self._make_parameters()
+        optimizer = AnnealedAdam(parameters, lr=1e-2, lr_decay=0.5)
+        for step in range(3):
+            self._set_gradients(parameters, step)
+            optimizer.step()
+        self.assertAlmostEqual(optimizer.param_groups[0]['lr'], 1e-2 * 0.5 ** 3)
+        self.assertEqual(optimizer.state[parameters[0]]['step'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
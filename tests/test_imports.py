@@ -0,0 +1,52 @@
+"""Guards against regressions in the import time of `inferno`."""
+
+import json
+import subprocess
+import sys
+import unittest
+
+# Optional dependencies that must not be imported before they're needed
+HEAVY_MODULES = ['tensorboardX', 'h5py', 'skimage', 'scipy', 'networkx', 'PIL', 'yaml',
+                 'torchvision']
+
+
+def run_import(statement):
+    """Runs `statement` in a fresh interpreter, returning the import time and the modules."""
+    script = ("import json, sys, time\n"
+              "start = time.perf_counter()\n"
+              "{}\n"
+              "elapsed = time.perf_counter() - start\n"
+              "print(json.dumps({{'time': elapsed, 'modules': list(sys.modules)}}))"
+              .format(statement))
+    output = subprocess.check_output([sys.executable, '-c', script])
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+class TestImports(unittest.TestCase):
+    def test_import_inferno(self):
+        result = run_import('import inferno')
+        # Not even torch is needed to import the top-level package
+        self.assertNotIn('torch', result['modules'])
+        self.assertLess(result['time'], 1.)
+
+    def test_import_trainer(self):
+        result = run_import('from inferno.trainers.basic import Trainer')
+        torch_time = run_import('import torch')['time']
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, result['modules'])
+        # Generous bound, this is to catch things like importing torchvision again
+        self.assertLess(result['time'], torch_time + 1.)
+
+    def test_lazy_attributes(self):
+        result = run_import('import inferno\n'
+                            'inferno.extensions.layers.Conv2D\n'
+                            'inferno.io.box.get_cifar10_loaders\n'
+                            'from inferno.extensions import model\n'
+                            'assert model is inferno.extensions.models\n'
+                            'assert "CamVid" in dir(inferno.io.box)')
+        self.assertIn('torchvision', result['modules'])
+        self.assertIn('inferno.io.box.cifar', result['modules'])
+
+
+if __name__ == '__main__':
+    unittest.main()
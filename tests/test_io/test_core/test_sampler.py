@@ -0,0 +1,26 @@
+import unittest
+
+
+class UnpaddedDistributedSamplerTest(unittest.TestCase):
+    def test_shards(self):
+        from inferno.io.core import UnpaddedDistributedSampler
+        dataset = list(range(11))
+        for shuffle in [False, True]:
+            samplers = [UnpaddedDistributedSampler(dataset, num_replicas=3, rank=rank,
+                                                   shuffle=shuffle)
+                        for rank in range(3)]
+            shards = [list(sampler) for sampler in samplers]
+            self.assertEqual([len(sampler) for sampler in samplers], [4, 4, 3])
+            self.assertEqual([len(shard) for shard in shards], [4, 4, 3])
+            # Every sample is loaded exactly once
+            self.assertEqual(sorted(sum(shards, [])), dataset)
+        # The shuffled shards change with the epoch
+        sampler = UnpaddedDistributedSampler(dataset, num_replicas=3, rank=0, shuffle=True)
+        sampler.set_epoch(0)
+        first_epoch = list(sampler)
+        sampler.set_epoch(1)
+        self.assertNotEqual(list(sampler), first_epoch)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import os
+from os.path import dirname, join
+from shutil import rmtree
+
+import numpy as np
+
+
+class TestBalancedWindowSampler(unittest.TestCase):
+    shape = (30, 40, 50)
+    CACHE_DIRECTORY = join(dirname(__file__), 'tmp_window_statistics')
+
+    def setUp(self):
+        # Sparse foreground in one corner
+        self.labels = np.zeros(self.shape, dtype='uint8')
+        self.labels[2:8, 3:9, 4:10] = 1
+        self.labels[20:22, 30:33, 40:41] = 2
+
+    def tearDown(self):
+        rmtree(self.CACHE_DIRECTORY, ignore_errors=True)
+
+    def _brute_force_counts(self, labels, statistics):
+        return np.array([np.bincount(labels[tuple(slice(start, stop) for start, stop
+                                                  in zip(starts, stops))].ravel(),
+                                     minlength=statistics.num_classes)
+                         for starts, stops in zip(statistics.starts, statistics.stops)])
+
+    def test_window_statistics(self):
+        from inferno.io.volumetric import VolumeLoader, WindowStatistics
+        loader = VolumeLoader(self.labels, window_size=(10, 12, 16), stride=(6, 8, 10))
+        statistics = WindowStatistics.compute(loader, max_slab_size=1000)
+        self.assertEqual(statistics.num_windows, len(loader))
+        self.assertEqual(statistics.num_classes, 3)
+        self.assertTrue(np.array_equal(statistics.counts,
+                                       self._brute_force_counts(self.labels, statistics)))
+        # Lazy loaders with padding and a data slice count only the data
+        from inferno.io.volumetric.lazy_volume_loader import LazyVolumeLoaderBase
+        lazy_loader = LazyVolumeLoaderBase(self.labels, window_size=(10, 12, 16),
+                                           stride=(6, 8, 10), padding=[(2, 2)] * 3,
+                                           data_slice=(slice(1, 29),))
+        lazy_statistics = WindowStatistics.compute(lazy_loader)
+        self.assertTrue(np.array_equal(lazy_statistics.counts,
+                                       self._brute_force_counts(self.labels, lazy_statistics)))
+        # Persist and reload
+        os.makedirs(self.CACHE_DIRECTORY, exist_ok=True)
+        path = join(self.CACHE_DIRECTORY, 'labels.window_statistics.npz')
+        WindowStatistics.for_loader(loader, path=path)
+        self.assertTrue(os.path.exists(path))
+        loaded = WindowStatistics.for_loader(loader, path=path)
+        self.assertTrue(np.array_equal(loaded.counts, statistics.counts))
+
+    def test_ignore_label(self):
+        from inferno.io.volumetric import VolumeLoader, WindowStatistics
+        from inferno.io.volumetric import sampler
+        labels = self.labels.copy()
+        labels[10:15] = 255
+        loader = VolumeLoader(labels, window_size=(10, 12, 16), stride=(6, 8, 10))
+        statistics = WindowStatistics.compute(loader, num_classes=3, max_slab_size=1000)
+        self.assertEqual(statistics.num_classes, 3)
+        expected_counts = [[(labels[tuple(slice(start, stop) for start, stop
+                                          in zip(starts, stops))] == label).sum()
+                            for label in range(3)]
+                           for starts, stops in zip(statistics.starts, statistics.stops)]
+        self.assertTrue(np.array_equal(statistics.counts, expected_counts))
+        # The ignore label is masked out before the labels are counted
+        histogram = sampler._block_histograms(labels, np.array([2, 2, 2]), num_classes=3)
+        self.assertEqual(histogram.shape, (3, 15, 20, 25))
+        self.assertEqual(histogram.sum(), (labels < 3).sum())
+
+    def test_sampler(self):
+        from inferno.io.volumetric import VolumeLoader, WindowStatistics, BalancedWindowSampler
+        loader = VolumeLoader(self.labels, window_size=(10, 10, 10), stride=(10, 10, 10))
+        statistics = WindowStatistics.compute(loader)
+        sampler = BalancedWindowSampler(statistics, num_samples=30000, seed=0)
+        self.assertEqual(len(sampler), 30000)
+        indices = np.array(list(sampler))
+        frequencies = np.bincount(indices, minlength=statistics.num_windows) / len(indices)
+        self.assertTrue(np.allclose(frequencies, sampler.probabilities, atol=0.01))
+        # Every class gets a third of the probability
+        for class_num in range(3):
+            has_class = statistics.counts[:, class_num] > 0
+            expected = (statistics.counts[:, class_num] / statistics.counts[:, class_num].sum())
+            self.assertGreater(sampler.probabilities[has_class].sum(), 1 / 3 - 1e-9)
+            self.assertTrue(np.all(sampler.probabilities >= expected / 3 - 1e-12))
+        # Importance sampling with smoothing reaches every window
+        sampler = BalancedWindowSampler(statistics, mode='importance', smoothing=0.1)
+        self.assertTrue(np.all(sampler.probabilities > 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,19 @@
 from unittest import TestCase, skipUnless
 import torch
 from unittest import main
+import os
 import time
 from os.path import join, dirname
+from inferno.extensions.metrics import CategoricalError
+
+
+class _RecordingMetric(CategoricalError):
+    # Remembers the metric objects that were called
+    called_metrics = []
+
+    def forward(self, prediction, target):
+        self.called_metrics.append(self)
+        return super(_RecordingMetric, self).forward(prediction, target)
 
 
 class TestTrainer(TestCase):
@@ -165,6 +176,276 @@ class TestTrainer(TestCase):
         # Instantiate new trainer and load
         trainer = Trainer().load(from_directory=self.ROOT_DIR, filename='dummy.pytorch')
 
+    def test_state_dict_checkpoint(self):
+        from inferno.trainers.basic import Trainer
+        import os
+        save_directory = os.path.join(self.ROOT_DIR, 'saves')
+        # Make model and trainer
+        net = self._make_test_model()
+        trainer = Trainer(model=net) \
+            .build_optimizer('Adam') \
+            .build_criterion('CrossEntropyLoss') \
+            .save_to_directory(save_directory) \
+            .set_checkpoint_format('state_dict')
+        trainer._iteration_count = 42
+        trainer.update_state('training_loss', torch.tensor(1.5))
+        trainer.update_state('training_prediction', torch.rand(4, 10))
+        trainer.save()
+        # Checkpoint must not contain the model object or transient states
+        checkpoint = torch.load(os.path.join(save_directory, 'checkpoint.pytorch'),
+                                weights_only=False)
+        self.assertTrue(Trainer.is_state_dict_checkpoint(checkpoint))
+        self.assertNotIn('_model', checkpoint['trainer_config'])
+        self.assertNotIn('training_prediction', checkpoint['trainer_config']['_state'])
+        # Load to a new trainer
+        new_net = self._make_test_model()
+        new_trainer = Trainer(new_net).build_optimizer('Adam')\
+            .load(from_directory=save_directory, map_location='cpu', mmap=True)
+        self.assertEqual(new_trainer.iteration_count, 42)
+        self.assertEqual(new_trainer.get_state('training_loss').item(), 1.5)
+        self.assertIsNone(new_trainer.get_state('training_prediction'))
+        for p_old, p_new in zip(net.parameters(), new_net.parameters()):
+            self.assertTrue(torch.equal(p_old, p_new))
+
+    def test_compile(self):
+        from inferno.trainers.basic import Trainer
+        from torch.utils.data import TensorDataset, DataLoader
+        import os
+        loader = DataLoader(TensorDataset(torch.rand(16, 3, 8, 8),
+                                          torch.randint(0, 10, (16,))), batch_size=4)
+        net = self._make_test_model()
+        trainer = Trainer(net) \
+            .build_optimizer('Adam') \
+            .build_criterion('CrossEntropyLoss') \
+            .bind_loader('train', loader) \
+            .bind_loader('validate', loader) \
+            .validate_every((1, 'epochs')) \
+            .save_to_directory(os.path.join(self.ROOT_DIR, 'saves')) \
+            .set_max_num_epochs(1) \
+            .compile(backend='eager')
+        trainer.fit()
+        # The model is compiled once and reused for training and validation
+        compiled_model = trainer.compiled_model
+        self.assertIsNot(compiled_model, trainer.model)
+        trainer.validate_for()
+        self.assertIs(trainer.compiled_model, compiled_model)
+        # The compiled model is not part of the checkpoint
+        trainer.save()
+        trainer = Trainer(net).save_to_directory(os.path.join(self.ROOT_DIR, 'saves'))\
+            .load(map_location='cpu')
+        self.assertIsNone(trainer._compiled_model)
+        # Disable compilation
+        self.assertIs(trainer.compile(False).compiled_model, trainer.model)
+
+    def test_cpu_threads(self):
+        from inferno.trainers.basic import Trainer
+        from inferno.utils.torch_utils import WorkerThreadLimiter
+        from torch.utils.data import TensorDataset, DataLoader
+        num_threads = torch.get_num_threads()
+        loader = DataLoader(TensorDataset(torch.rand(16, 3, 8, 8),
+                                          torch.randint(0, 10, (16,))),
+                            batch_size=4, num_workers=2)
+        trainer = Trainer(self._make_test_model()) \
+            .build_optimizer('Adam') \
+            .build_criterion('CrossEntropyLoss') \
+            .bind_loader('train', loader) \
+            .set_max_num_epochs(1)
+        cores = os.sched_getaffinity(0) if hasattr(os, 'sched_getaffinity') else None
+        try:
+            trainer.cpu(num_threads=1)
+            self.assertEqual(torch.get_num_threads(), 1)
+            # The workers of bound loaders are limited to one thread
+            self.assertIsInstance(trainer.train_loader.worker_init_fn, WorkerThreadLimiter)
+            trainer.fit()
+            # Rebinding doesn't wrap the limiter twice
+            trainer.bind_loader('train', trainer.train_loader)
+            self.assertIsNone(trainer.train_loader.worker_init_fn.worker_init_fn)
+            # Calling cpu again splits the same cores
+            worker_cores = trainer._cpu_threads.get('worker_cores')
+            trainer.cpu(num_threads=1)
+            self.assertEqual(trainer._cpu_threads.get('worker_cores'), worker_cores)
+        finally:
+            torch.set_num_threads(num_threads)
+            if cores is not None:
+                os.sched_setaffinity(0, cores)
+
+    def test_cached_and_asynchronous_validation(self):
+        from inferno.trainers.basic import Trainer
+        from torch.utils.data import TensorDataset, DataLoader
+        dataset = TensorDataset(torch.rand(16, 3, 8, 8), torch.randint(0, 10, (16,)))
+        trainer = Trainer(self._make_test_model()) \
+            .build_optimizer('Adam') \
+            .build_criterion('CrossEntropyLoss') \
+            .build_metric('CategoricalError') \
+            .bind_loader('train', DataLoader(dataset, batch_size=4)) \
+            .bind_loader('validate', DataLoader(dataset, batch_size=4, shuffle=True)) \
+            .validate_every((2, 'iterations')) \
+            .cache_validation_set(num_iterations=2) \
+            .set_max_num_iterations(6)
+        self.assertEqual(len(trainer.get_validation_cache()), 2)
+        # Validating on the cached set gives the same result every time
+        trainer.validate_for()
+        validation_loss = trainer.get_state('validation_loss_averaged')
+        trainer.validate_for()
+        self.assertEqual(trainer.get_state('validation_loss_averaged'), validation_loss)
+        # Validate in the background
+        validation_runs = []
+        trainer.register_callback(lambda **_: validation_runs.append(trainer.iteration_count),
+                                  trigger='end_of_validation_run')
+        trainer.validate_asynchronously()
+        trainer.fit()
+        self.assertFalse(trainer.validation_is_pending)
+        self.assertGreater(len(validation_runs), 0)
+        self.assertIsNotNone(trainer.get_state('validation_error_averaged'))
+        # Threads and cached batches aren't serialized
+        config = trainer.get_config()
+        self.assertIsNone(config['_validation_executor'])
+        self.assertDictEqual(config['_validation_cache'], {})
+
+    def test_asynchronous_best_checkpoint(self):
+        import tempfile
+        from inferno.trainers.basic import Trainer
+        from torch.utils.data import TensorDataset, DataLoader
+        called_metrics = _RecordingMetric.called_metrics
+        del called_metrics[:]
+        dataset = TensorDataset(torch.rand(8, 3, 8, 8), torch.randint(0, 10, (8,)))
+        with tempfile.TemporaryDirectory() as directory:
+            trainer = Trainer(self._make_test_model()) \
+                .build_criterion('CrossEntropyLoss') \
+                .build_metric(_RecordingMetric) \
+                .bind_loader('validate', DataLoader(dataset, batch_size=4)) \
+                .save_to_directory(directory) \
+                .save_at_best_validation_score() \
+                .validate_asynchronously()
+            validated_state = {name: tensor.clone()
+                               for name, tensor in trainer.model.state_dict().items()}
+            trainer.start_asynchronous_validation()
+            # Training goes on while validating
+            with torch.no_grad():
+                for parameter in trainer.model.parameters():
+                    parameter.add_(1.)
+            live_state = {name: tensor.clone()
+                          for name, tensor in trainer.model.state_dict().items()}
+            self.assertTrue(trainer.poll_asynchronous_validation(wait=True))
+            # The background thread used its own copy of the metric
+            self.assertGreater(len(called_metrics), 0)
+            self.assertTrue(all(metric is not trainer.metric for metric in called_metrics))
+            self.assertTrue(trainer.save_now)
+            trainer.save()
+            # The best checkpoint has the weights that were validated ...
+            best = Trainer().load(from_directory=directory, best=True)
+            for name, tensor in best.model.state_dict().items():
+                self.assertTrue(torch.equal(tensor, validated_state[name]), name)
+            # ... while the trainer (and the latest checkpoint) keep the current weights
+            latest = Trainer().load(from_directory=directory)
+            for name, tensor in trainer.model.state_dict().items():
+                self.assertTrue(torch.equal(tensor, live_state[name]), name)
+                self.assertTrue(torch.equal(latest.model.state_dict()[name], live_state[name]))
+
+    def test_batch_transforms(self):
+        from inferno.trainers.basic import Trainer
+        from inferno.io.transform import Compose
+        from inferno.io.transform.generic import Cast, Normalize, Project
+        from torch.utils.data import TensorDataset, DataLoader
+        dataset = TensorDataset(torch.randint(0, 256, (8, 3, 8, 8), dtype=torch.uint8),
+                                torch.randint(0, 10, (8,)))
+        # Normalize runs vectorized, Project (applied to the targets) per sample
+        batch_transforms = Compose(Cast('float', apply_to=[0]),
+                                   Normalize(apply_to=[0]),
+                                   Project({label: 9 - label for label in range(10)},
+                                           apply_to=[1]))
+        trainer = Trainer(self._make_test_model()) \
+            .build_optimizer('Adam') \
+            .build_criterion('CrossEntropyLoss') \
+            .bind_loader('train', DataLoader(dataset, batch_size=4),
+                         batch_transforms=batch_transforms) \
+            .set_max_num_iterations(2)
+        trainer.fit()
+        inputs, = trainer.get_state('training_inputs')
+        self.assertEqual(inputs.dtype, torch.float32)
+        self.assertTrue(torch.allclose(inputs.mean(dim=(1, 2, 3)), torch.zeros(4), atol=1e-5))
+        self.assertTrue(torch.equal(trainer.get_state('training_target'),
+                                    9 - dataset.tensors[1][4:]))
+        # On the CPU, before the transfer
+        trainer.bind_loader('train', DataLoader(dataset, batch_size=4),
+                            batch_transforms=batch_transforms, batch_transforms_on_device=False)
+        inputs, target = trainer.wrap_batch(trainer.fetch_next_batch('train'), from_loader='train')
+        self.assertEqual(inputs.dtype, torch.float32)
+        self.assertEqual(target.dtype, torch.int64)
+
+    def test_batch_transforms_checkpoint(self):
+        import tempfile
+        from inferno.trainers.basic import Trainer
+        from torch.utils.data import TensorDataset, DataLoader
+        dataset = TensorDataset(torch.rand(8, 3, 8, 8), torch.randint(0, 10, (8,)))
+        for checkpoint_format in ['pickle', 'state_dict']:
+            with tempfile.TemporaryDirectory() as directory:
+                # Lambdas can't be pickled, but they aren't saved
+                trainer = Trainer(self._make_test_model()) \
+                    .build_criterion('CrossEntropyLoss') \
+                    .bind_loader('validate', DataLoader(dataset, batch_size=4),
+                                 batch_transforms=lambda inputs, target: (inputs, 9 - target)) \
+                    .save_to_directory(directory) \
+                    .set_checkpoint_format(checkpoint_format)
+                trainer.validate_for()
+                validation_loss = trainer.get_state('validation_loss_averaged')
+                trainer.save()
+                loaded = Trainer(self._make_test_model()).load(from_directory=directory)
+                self.assertIsNone(loaded._loader_specs['validate']['batch_transforms'])
+                # The transforms are bound again with the loader
+                loaded.bind_loader('validate', DataLoader(dataset, batch_size=4),
+                                   batch_transforms=lambda inputs, target: (inputs, 9 - target))
+                loaded.validate_for()
+                self.assertAlmostEqual(loaded.get_state('validation_loss_averaged'),
+                                       validation_loss, places=5)
+                # The trainer that saved keeps its transforms
+                self.assertIsNotNone(trainer._loader_specs['validate']['batch_transforms'])
+
+    def test_validation_batch_transforms(self):
+        from inferno.trainers.basic import Trainer
+        from torch.utils.data import TensorDataset, DataLoader
+        dataset = TensorDataset(torch.rand(8, 3, 8, 8), torch.randint(0, 10, (8,)))
+        num_calls = []
+
+        def batch_transforms(inputs, target):
+            num_calls.append(1)
+            return inputs, 9 - target
+
+        trainer = Trainer(self._make_test_model()) \
+            .build_criterion('CrossEntropyLoss') \
+            .bind_loader('validate', DataLoader(dataset, batch_size=4),
+                         batch_transforms=batch_transforms)
+        trainer.validate_for()
+        self.assertEqual(len(num_calls), 2)
+        validation_loss = trainer.get_state('validation_loss_averaged')
+        # Asynchronous validation applies the transforms as well
+        trainer.validate_asynchronously()
+        trainer.start_asynchronous_validation()
+        self.assertTrue(trainer.poll_asynchronous_validation(wait=True))
+        self.assertEqual(len(num_calls), 4)
+        self.assertAlmostEqual(trainer.get_state('validation_loss_averaged'), validation_loss,
+                               places=5)
+        # Batches cached on the device are transformed once, when they're cached
+        trainer.cache_validation_set(on_device=True)
+        self.assertTrue(trainer.validation_cache_is_wrapped())
+        self.assertEqual(len(num_calls), 6)
+        trainer.validate_asynchronously(False)
+        trainer.validate_for()
+        trainer.validate_asynchronously()
+        trainer.start_asynchronous_validation()
+        trainer.poll_asynchronous_validation(wait=True)
+        self.assertEqual(len(num_calls), 6)
+        self.assertAlmostEqual(trainer.get_state('validation_loss_averaged'), validation_loss,
+                               places=5)
+        # Batches cached on the CPU are transformed on every run
+        trainer.cache_validation_set()
+        self.assertFalse(trainer.validation_cache_is_wrapped())
+        trainer.start_asynchronous_validation()
+        trainer.poll_asynchronous_validation(wait=True)
+        self.assertEqual(len(num_calls), 8)
+        self.assertAlmostEqual(trainer.get_state('validation_loss_averaged'), validation_loss,
+                               places=5)
+
     @skipUnless(torch.cuda.device_count() >= 2, "Not enough cuda devices for test_multi_gpu_setup.")
     def test_multi_gpu_setup(self):
         from torch.nn import CrossEntropyLoss
@@ -1,10 +1,14 @@
 import unittest
+from unittest import mock
+import pickle
 import shutil
 import h5py as h5
+import torch
 from os.path import dirname, join
 from os import listdir
 from inferno.trainers.basic import Trainer
-from inferno.trainers.callbacks.essentials import DumpHDF5Every
+from inferno.trainers.callbacks.essentials import DumpHDF5Every, PersistentSave, ParameterEMA
+from inferno.trainers.callbacks.essentials import NaNDetector, GradientClip
 from inferno.utils.test_utils import generate_random_dataloader
 from inferno.extensions.layers import Conv2D, AsMatrix
 from torch.nn import Sequential, MaxPool2d, AdaptiveAvgPool2d, Linear, Softmax
@@ -67,6 +71,8 @@ class TestEssentials(unittest.TestCase):
                                 'dump.training.epoch0.iteration0.h5')
         with h5.File(sample_file_path, 'r') as sample_file:
             all_dataset_names = list(sample_file.keys())
+            # Not compressed unless asked for
+            self.assertIsNone(sample_file['training_inputs_0'].compression)
         self.assertSequenceEqual(all_dataset_names,
                                  ['training_inputs_0', 'training_prediction', 'training_target'])
         # Check if the keys are right in a validation dump
@@ -78,6 +84,218 @@ class TestEssentials(unittest.TestCase):
                                  ['validation_inputs_0', 'validation_prediction',
                                   'validation_target'])
 
+    def test_dump_hdf5_every_append(self):
+        dumper = DumpHDF5Every((8, 'iterations'),
+                               to_directory=join(self.WORKING_DIRECTORY, 'Weights'),
+                               append=True, asynchronous=True, compression='gzip')
+        self.trainer\
+            .set_max_num_iterations(32)\
+            .register_callback(dumper)
+        self.trainer.fit()
+        # One file for all dumps
+        self.assertSequenceEqual(listdir(join(self.WORKING_DIRECTORY, 'Weights')),
+                                 ['dump.training.h5'])
+        file_path = join(self.WORKING_DIRECTORY, 'Weights', 'dump.training.h5')
+        with h5.File(file_path, 'r') as dump_file:
+            self.assertEqual(list(dump_file['iterations'][:]), [0, 8, 16, 24])
+            self.assertEqual(dump_file['training_inputs_0'].shape[0], 4)
+            self.assertIsNotNone(dump_file['training_inputs_0'].compression)
+        self.assertEqual(DumpHDF5Every.load_dump(file_path, 'training_target', 8).shape,
+                         self.trainer.get_state('training_target').shape)
+        # The dumper can be pickled after the fit
+        pickle.loads(pickle.dumps(dumper))
+
+    def test_persistent_save_sharded(self):
+        save_directory = join(self.WORKING_DIRECTORY, 'Weights')
+        self.trainer\
+            .set_checkpoint_format('sharded')\
+            .save_every((8, 'iterations'))\
+            .set_max_num_iterations(32)\
+            .register_callback(PersistentSave(keep_last=2))
+        self.trainer.fit()
+        all_files = listdir(save_directory)
+        snapshots = sorted(f for f in all_files if f.startswith('checkpoint.pytorch.'))
+        self.assertSequenceEqual(snapshots, ['checkpoint.pytorch.epoch0.iteration24',
+                                             'checkpoint.pytorch.epoch0.iteration32'])
+        self.assertIn('checkpoint.pytorch', all_files)
+        # Load from the symlinked latest checkpoint
+        trainer = Trainer(self.trainer.model).build_optimizer('RMSprop')\
+            .load(from_directory=save_directory)
+        self.assertEqual(trainer.iteration_count, 32)
+
+    def test_persistent_save_retention(self):
+        save_directory = join(self.WORKING_DIRECTORY, 'Weights')
+        self.trainer\
+            .save_every((8, 'iterations'))\
+            .set_max_num_iterations(24)\
+            .register_callback(PersistentSave(keep_last=1))
+        self.trainer.fit()
+        snapshots = [f for f in listdir(save_directory) if f.startswith('checkpoint.pytorch.')]
+        self.assertSequenceEqual(snapshots, ['checkpoint.pytorch.epoch0.iteration24'])
+
+    def test_parameter_ema(self):
+        momentum = 0.9
+        ema = ParameterEMA(momentum, update_every=2, validate_with_ema=True)
+        self.trainer\
+            .set_max_num_iterations(8)\
+            .register_callback(ema)
+        # Compute the reference with a plain python loop
+        reference = []
+
+        def maintain_reference(**_):
+            if self.trainer.iteration_count % 2 != 0:
+                return
+            parameters = [p.detach().clone() for p in self.trainer.model.parameters()]
+            if not reference:
+                reference.extend(parameters)
+            else:
+                for p_ema, p_model in zip(reference, parameters):
+                    p_ema.mul_(momentum).add_(p_model, alpha=1. - momentum)
+
+        self.trainer.register_callback(maintain_reference, trigger='end_of_training_iteration')
+        self.trainer.fit()
+        self.assertEqual(ema.num_updates, 4)
+        for p_ema, p_reference in zip(ema.parameters, reference):
+            self.assertTrue(torch.allclose(p_ema, p_reference, atol=1e-6))
+        # Swap the averages in and out
+        live = [p.detach().clone() for p in self.trainer.model.parameters()]
+        with ema.swapped():
+            for p_model, p_ema in zip(self.trainer.model.parameters(), ema.parameters):
+                self.assertTrue(torch.equal(p_model, p_ema))
+        for p_model, p_live in zip(self.trainer.model.parameters(), live):
+            self.assertTrue(torch.equal(p_model, p_live))
+        # Validation runs use the averages, and restore the live parameters afterwards
+        swapped_in_during_validation = []
+        self.trainer.register_callback(
+            lambda **_: swapped_in_during_validation.append(ema.is_swapped_in),
+            trigger='end_of_validation_iteration')
+        self.trainer.validate_for(num_iterations=1)
+        self.assertSequenceEqual(swapped_in_during_validation, [True])
+        self.assertFalse(ema.is_swapped_in)
+        # The averages are pickled with the trainer checkpoint
+        loaded_ema = pickle.loads(pickle.dumps(ema))
+        self.assertEqual(loaded_ema.num_updates, 4)
+        for p_loaded, p_ema in zip(loaded_ema.parameters, ema.parameters):
+            self.assertTrue(torch.equal(p_loaded, p_ema))
+
+    def test_parameter_ema_asynchronous_validation(self):
+        ema = ParameterEMA(0.5, validate_with_ema=True)
+        self.trainer\
+            .set_max_num_iterations(4)\
+            .register_callback(ema)\
+            .validate_asynchronously()
+        self.trainer.fit()
+        live = [p.detach().clone() for p in self.trainer.model.parameters()]
+        self.assertFalse(all(torch.equal(p_live, p_ema)
+                             for p_live, p_ema in zip(live, ema.parameters)))
+        # The snapshot that is validated in the background has the averaged parameters
+        snapshots = []
+        validate_snapshot = Trainer._validate_snapshot
+
+        def record_snapshot(trainer, model, *args):
+            snapshots.append([p.detach().clone() for p in model.parameters()])
+            return validate_snapshot(trainer, model, *args)
+
+        with mock.patch.object(Trainer, '_validate_snapshot', autospec=True,
+                               side_effect=record_snapshot):
+            self.trainer.start_asynchronous_validation(num_iterations=1)
+            self.trainer.poll_asynchronous_validation(wait=True)
+        self.assertEqual(len(snapshots), 1)
+        for p_snapshot, p_ema in zip(snapshots[0], ema.parameters):
+            self.assertTrue(torch.equal(p_snapshot, p_ema))
+        # The live parameters are back in the model
+        self.assertFalse(ema.is_swapped_in)
+        for p_model, p_live in zip(self.trainer.model.parameters(), live):
+            self.assertTrue(torch.equal(p_model, p_live))
+
+    @unittest.skipUnless(torch.cuda.is_available(), "Offloading needs a GPU.")
+    def test_parameter_ema_offload(self):
+        ema = ParameterEMA(0.5, offload=True)
+        self.trainer\
+            .set_max_num_iterations(3)\
+            .register_callback(ema)\
+            .cuda()
+        self.trainer.fit()
+        # The parameters are copied to pinned buffers, i.e. without blocking
+        self.assertTrue(all(staged.is_pinned() for staged in ema._staged_parameters))
+        self.assertTrue(all(p_ema.is_pinned() for p_ema in ema.parameters))
+
+    def test_nan_detector(self):
+        detector = NaNDetector(check_every=3)
+        self.trainer.register_callback(detector)
+        losses = [1., float('nan'), 2.]
+        for loss in losses[:-1]:
+            self.trainer.update_state('training_loss', torch.tensor(loss))
+            detector.end_of_training_iteration()
+        # Raised at the first check after the fault
+        self.trainer.update_state('training_loss', torch.tensor(losses[-1]))
+        with self.assertRaises(RuntimeError):
+            detector.end_of_training_iteration()
+        # Finite losses (kept on the device) are fine
+        self.trainer\
+            .keep_states_on_device()\
+            .set_max_num_iterations(4)\
+            .fit()
+        self.assertTrue(torch.is_tensor(self.trainer.get_state('training_loss')))
+        self.assertFalse(self.trainer.get_state('training_loss').requires_grad)
+
+    def test_gradient_clip(self):
+        model = self.trainer.model
+        gradients = [torch.randn_like(p) for p in model.parameters()]
+
+        def set_gradients():
+            for p, gradient in zip(model.parameters(), gradients):
+                p.grad = gradient.clone()
+
+        # Same as torch's clip_grad_norm_
+        set_gradients()
+        expected_norm = torch.nn.utils.clip_grad_norm_(model.parameters(), 1.)
+        expected = [p.grad.clone() for p in model.parameters()]
+        set_gradients()
+        clip = GradientClip(clip_norm=1.)
+        self.trainer.register_callback(clip)
+        clip.after_model_and_loss_is_applied()
+        self.assertTrue(torch.allclose(self.trainer.get_state('gradient_norm'), expected_norm))
+        for p, expected_gradient in zip(model.parameters(), expected):
+            self.assertTrue(torch.allclose(p.grad, expected_gradient))
+        # Thresholds per parameter group (only the last layer is clipped)
+        last_layer = list(model[-1].parameters())
+        self.trainer.build_optimizer('SGD', [{'params': list(model[:-1].parameters())},
+                                             {'params': last_layer}], lr=0.1)
+        set_gradients()
+        clip = GradientClip(clip_value=[None, 0.01])
+        self.trainer.register_callback(clip)
+        clip.after_model_and_loss_is_applied()
+        self.assertTrue(torch.allclose(self.trainer.get_state('gradient_norm'), expected_norm))
+        for p, gradient in zip(model.parameters(), gradients):
+            if any(p is q for q in last_layer):
+                self.assertLessEqual(p.grad.abs().max().item(), 0.01)
+            else:
+                self.assertTrue(torch.equal(p.grad, gradient))
+
+    def test_gradient_clip_with_grad_scaler(self):
+        scaler = torch.amp.GradScaler('cpu', init_scale=2. ** 10)
+        norms = []
+
+        def record_norms(**_):
+            # Norm of the (unscaled and clipped) gradients the optimizer stepped with
+            gradient_norm = torch.linalg.vector_norm(
+                torch.stack([p.grad.norm() for p in self.trainer.model.parameters()]))
+            norms.append((gradient_norm, self.trainer.get_state('gradient_norm')))
+
+        self.trainer\
+            .set_grad_scaler(scaler)\
+            .set_max_num_iterations(4)\
+            .register_callback(GradientClip(clip_norm=1.))\
+            .register_callback(record_norms, trigger='end_of_training_iteration')
+        self.trainer.fit()
+        self.assertEqual(self.trainer.iteration_count, 4)
+        self.assertEqual(len(norms), 4)
+        for gradient_norm, norm_before_clipping in norms:
+            self.assertTrue(torch.isclose(gradient_norm,
+                                          torch.clamp(norm_before_clipping, max=1.),
+                                          rtol=1e-4))
+
     def tearDown(self):
         shutil.rmtree(join(self.WORKING_DIRECTORY, 'Weights'))
 
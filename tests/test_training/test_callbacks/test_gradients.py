@@ -0,0 +1,47 @@
+import unittest
+import torch.nn as nn
+from inferno.trainers.basic import Trainer
+from inferno.trainers.callbacks.logging.base import Logger
+from inferno.trainers.callbacks.gradients import LogLayerStatistics
+from inferno.utils.test_utils import generate_random_dataloader
+from inferno.extensions.layers import AsMatrix
+
+
+class ScalarRecorder(Logger):
+    def __init__(self):
+        super(ScalarRecorder, self).__init__()
+        self.scalars = []
+
+    def log_scalar(self, tag, value, step):
+        self.scalars.append((tag, value, step))
+
+    def end_of_fit(self, **_):
+        pass
+
+
+class TestGradients(unittest.TestCase):
+    def test_log_layer_statistics(self):
+        model = nn.Sequential(nn.Conv2d(3, 4, 3), nn.ReLU(), nn.AdaptiveAvgPool2d(1),
+                              AsMatrix(), nn.Linear(4, 10))
+        logger = ScalarRecorder()
+        trainer = Trainer(model)\
+            .build_criterion('CrossEntropyLoss')\
+            .build_optimizer('Adam')\
+            .bind_loader('train', generate_random_dataloader(32, (3, 8, 8), 10, dtype='float32',
+                                                           batch_size=4))\
+            .build_logger(logger)\
+            .register_callback(LogLayerStatistics((3, 'iterations'), num_sampled_layers=1,
+                                                  buffer_size=2))\
+            .set_max_num_iterations(8)
+        trainer.fit()
+        steps = sorted({step for _, _, step in logger.scalars})
+        self.assertSequenceEqual(steps, [0, 3, 6])
+        # One layer per sample, with four statistics of activations and gradients
+        self.assertEqual(len(logger.scalars), 3 * 2 * 4)
+        self.assertTrue(all(tag.startswith('layer_statistics/') for tag, _, _ in logger.scalars))
+        # No hooks are left behind
+        self.assertEqual(len(model[0]._forward_hooks) + len(model[4]._forward_hooks), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+from unittest import mock
 
 import os
 from shutil import rmtree
@@ -86,6 +87,57 @@ class TestTensorboard(unittest.TestCase):
         trainer = self.get_trainer(1)
         trainer.fit()
 
+    def test_extract_images_from_batch(self):
+        logger = TensorboardLogger(send_image_at_batch_indices=[0, 2, 7],
+                                   send_image_at_channel_indices=1,
+                                   send_volume_at_z_indices='mid')
+        volume = torch.rand(3, 2, 5, 8, 8)
+        images = logger.extract_images_from_batch(volume, base_tag='volume', normalize=True)
+        self.assertSequenceEqual([image.tag for image in images],
+                                 ['volume/instance_0/channel_1/slice_2',
+                                  'volume/instance_2/channel_1/slice_2'])
+        expected = volume[2, 1, 2].numpy()
+        expected = (expected - expected.min()) / (expected - expected.min()).max()
+        self.assertTrue(np.allclose(images[1].array, expected))
+        # Lists of batches are prefixed
+        images = logger.extract_images_from_batch([volume[:, :, 0], volume[:, :, 1]],
+                                                  base_tag='image')
+        self.assertEqual(images[-1].tag, 'image/batch_1/instance_2/channel_1')
+
+    def test_asynchronous_writer(self):
+        trainer = self.get_trainer(3)
+        trainer.fit()
+        # The pending logs are flushed at the end of fit
+        self.assertTrue(trainer.logger.asynchronous)
+        self.assertTrue(trainer.logger.worker.is_alive)
+        self.assertEqual(trainer.logger.worker._queue.unfinished_tasks, 0)
+        self.assertTrue(len(os.listdir(self.LOG_DIRECTORY)) > 0)
+
+    def test_histograms(self):
+        trainer = self.get_trainer(3)
+        trainer.logger.log_histograms_every = (1, 'epochs')
+        trainer.fit()
+        histogram_tags = set(trainer.logger._histograms.keys())
+        self.assertIn('parameters/0.weight', histogram_tags)
+        self.assertIn('gradients/0.weight', histogram_tags)
+        # Histograms are reset after having been written
+        self.assertTrue(all(histogram.is_empty
+                            for histogram in trainer.logger._histograms.values()))
+
+    def test_histogram_accumulation(self):
+        for accumulate_histograms in [False, True]:
+            trainer = self.get_trainer(3)
+            trainer.logger._config['accumulate_histograms'] = accumulate_histograms
+            trainer.logger.log_histograms_every = (4, 'iterations')
+            trainer.set_max_num_iterations(8)
+            with mock.patch.object(TensorboardLogger, 'accumulate_histograms',
+                                   autospec=True,
+                                   side_effect=TensorboardLogger.accumulate_histograms) \
+                    as accumulate:
+                trainer.fit()
+            # Without accumulation, histograms are only computed when they're logged
+            self.assertEqual(accumulate.call_count, 8 if accumulate_histograms else 2)
+
     def test_serialization(self):
         trainer = self.get_trainer(3)
         # Serialize
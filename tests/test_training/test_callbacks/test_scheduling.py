@@ -1,5 +1,6 @@
 import unittest
-from inferno.trainers.callbacks.scheduling import ManualLR
+import torch
+from inferno.trainers.callbacks.scheduling import ManualLR, AutoLR
 from torch import nn
 from torch.optim import Adam
 
@@ -30,5 +31,32 @@ class TestSchedulers(unittest.TestCase):
         trainer.iteration_count = 300
         self.assertEqual(trainer.optimizer.param_groups[0]['lr'], 0.025)
 
+    def test_auto_lr_monitor_every(self):
+        class DummyTrainer(object):
+            def __init__(self):
+                self.iteration_count = 0
+                self.epoch_count = 0
+                self.optimizer = Adam(nn.Linear(10, 10).parameters(), lr=1.)
+                self.training_loss = None
+
+            def get_state(self, key, default=None):
+                return self.training_loss if key == 'training_loss' else default
+
+        auto_lr = AutoLR(0.5, patience='2 iterations', monitor='training_loss',
+                         monitor_every=3)
+        trainer = DummyTrainer()
+        auto_lr._trainer = trainer
+        # The loss (on the device) doesn't improve
+        for iteration_count in range(9):
+            trainer.iteration_count = iteration_count
+            trainer.training_loss = torch.tensor(1.)
+            auto_lr.end_of_training_iteration()
+            # The monitor is only fetched every 3 iterations
+            self.assertEqual(auto_lr._monitor_accumulator.count, (iteration_count + 1) % 3)
+        self.assertEqual(auto_lr._monitor_value_moving_average.val, 1.)
+        # Out of patience at the checks in iterations 5 and 8 (but not in between)
+        self.assertEqual(trainer.optimizer.param_groups[0]['lr'], 0.25)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,121 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import torch.nn as nn
+from torch.utils.data import TensorDataset, DataLoader
+
+
+WORLD_SIZE = 2
+
+
+class _CountingCallback(object):
+    def __init__(self, rank_zero_only):
+        self.rank_zero_only = rank_zero_only
+        self.num_calls = 0
+
+    def __call__(self, **_):
+        self.num_calls += 1
+
+
+def _train(rank, init_file, save_directory, results):
+    from inferno.trainers.basic import Trainer
+    torch.manual_seed(rank)
+    dataset = TensorDataset(torch.rand(64, 4), torch.randint(0, 2, (64,)))
+    loader = DataLoader(dataset, batch_size=8, shuffle=True)
+    # The models start out differently, DDP syncs them
+    model = nn.Sequential(nn.Linear(4, 8), nn.ReLU(), nn.Linear(8, 2))
+    # An odd number of validation samples (the same in all processes), which the shards must
+    # not pad with duplicates
+    generator = torch.Generator().manual_seed(0)
+    validation_dataset = TensorDataset(torch.rand(63, 4, generator=generator),
+                                       torch.randint(0, 2, (63,), generator=generator))
+    everywhere, rank_zero = _CountingCallback(False), _CountingCallback(True)
+    trainer = Trainer(model) \
+        .build_optimizer('SGD', lr=0.1) \
+        .build_criterion('CrossEntropyLoss') \
+        .build_metric('CategoricalError') \
+        .bind_loader('train', loader) \
+        .distributed(init_method='file://' + init_file, world_size=WORLD_SIZE, rank=rank) \
+        .bind_loader('validate', DataLoader(validation_dataset, batch_size=8)) \
+        .bind_loader('test', DataLoader(dataset, batch_size=8, num_workers=1,
+                                        persistent_workers=True, prefetch_factor=3)) \
+        .validate_every((1, 'epochs')) \
+        .save_every((1, 'epochs'), to_directory=save_directory) \
+        .set_max_num_epochs(2)
+    trainer.register_callback(everywhere, trigger='end_of_training_iteration')
+    trainer.register_callback(rank_zero, trigger='end_of_training_iteration')
+    trainer.fit()
+    # Gather the parameters of all processes
+    parameters = torch.cat([p.detach().reshape(-1) for p in model.parameters()])
+    gathered = [torch.empty_like(parameters) for _ in range(WORLD_SIZE)]
+    dist.all_gather(gathered, parameters)
+    # The validation results of the shards add up to those on the whole set
+    trainer.validate_for()
+    with torch.no_grad():
+        model.eval()
+        expected_loss = nn.functional.cross_entropy(model(validation_dataset.tensors[0]),
+                                                    validation_dataset.tensors[1]).item()
+    test_loader = trainer._loaders['test']
+    results.put({'rank': rank,
+                 'in_sync': all(torch.allclose(gathered[0], other) for other in gathered),
+                 'num_batches': len(trainer.train_loader),
+                 'iteration_count': trainer.iteration_count,
+                 'validation_loss': trainer.get_state('validation_loss_averaged'),
+                 'expected_validation_loss': expected_loss,
+                 'num_validation_samples': len(trainer._loaders['validate'].sampler),
+                 'test_loader_options': (test_loader.persistent_workers,
+                                         test_loader.prefetch_factor),
+                 'calls': (everywhere.num_calls, rank_zero.num_calls)})
+    dist.destroy_process_group()
+
+
+class TestDistributed(unittest.TestCase):
+    @unittest.skipUnless(dist.is_available(), "torch.distributed is not available")
+    def test_distributed_training(self):
+        with tempfile.TemporaryDirectory() as directory:
+            save_directory = os.path.join(directory, 'saves')
+            context = mp.get_context('spawn')
+            results = context.Queue()
+            processes = [context.Process(target=_train,
+                                         args=(rank, os.path.join(directory, 'init'),
+                                               save_directory, results))
+                         for rank in range(WORLD_SIZE)]
+            for process in processes:
+                process.start()
+            results = sorted([results.get(timeout=300) for _ in processes],
+                             key=lambda result: result['rank'])
+            for process in processes:
+                process.join()
+                self.assertEqual(process.exitcode, 0)
+            # Only rank 0 saves
+            self.assertTrue(os.path.exists(os.path.join(save_directory, 'checkpoint.pytorch')))
+            # Resuming without Trainer.distributed warns
+            from inferno.trainers.basic import Trainer
+            from inferno.trainers.callbacks.console import Console
+            with mock.patch.object(Console, 'warning') as warning:
+                trainer = Trainer().load(from_directory=save_directory)
+            self.assertFalse(trainer.is_distributed)
+            self.assertEqual(warning.call_count, 1)
+        for result in results:
+            self.assertTrue(result['in_sync'])
+            # Each process sees half of the data
+            self.assertEqual(result['num_batches'], 4)
+            self.assertEqual(result['test_loader_options'], (True, 3))
+            self.assertAlmostEqual(result['validation_loss'], result['expected_validation_loss'],
+                                   places=5)
+        self.assertEqual(sum(result['num_validation_samples'] for result in results), 63)
+        # All processes agree on the iterations and the validation results
+        num_iterations = results[0]['iteration_count']
+        self.assertEqual(results[1]['iteration_count'], num_iterations)
+        self.assertAlmostEqual(results[0]['validation_loss'], results[1]['validation_loss'])
+        # Rank-zero-only callbacks are not called in the other processes
+        self.assertEqual(results[0]['calls'], (num_iterations, num_iterations))
+        self.assertEqual(results[1]['calls'], (num_iterations, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import os
+from os.path import dirname, join
+from shutil import rmtree
+import torch
+import torch.nn as nn
+from inferno.utils.checkpoint_utils import ShardedCheckpointStore, select_checkpoints_to_keep
+
+
+class CheckpointUtilsTest(unittest.TestCase):
+    STORE_DIRECTORY = join(dirname(__file__), 'store')
+
+    def setUp(self):
+        os.makedirs(self.STORE_DIRECTORY, exist_ok=True)
+
+    def tearDown(self):
+        rmtree(self.STORE_DIRECTORY, ignore_errors=True)
+
+    def _num_shards(self, store):
+        return len(os.listdir(store.shard_directory))
+
+    def test_deduplication(self):
+        store = ShardedCheckpointStore(self.STORE_DIRECTORY)
+        frozen = nn.Linear(64, 64)
+        trained = nn.Linear(64, 64)
+        checkpoint = {'frozen': frozen.state_dict(), 'trained': trained.state_dict(),
+                      'step': 3}
+        stats = store.save(checkpoint, 'first')
+        self.assertEqual(stats['written'], 2)
+        # Change only the trained weights
+        with torch.no_grad():
+            trained.weight.add_(1.)
+        checkpoint = {'frozen': frozen.state_dict(), 'trained': trained.state_dict(),
+                      'step': 4}
+        stats = store.save(checkpoint, 'second')
+        self.assertEqual(stats['written'], 1)
+        self.assertEqual(stats['reused'], 1)
+        self.assertEqual(self._num_shards(store), 3)
+        # Load back
+        loaded = store.load('second')
+        self.assertEqual(loaded['step'], 4)
+        self.assertTrue(torch.equal(loaded['trained']['weight'], trained.weight))
+        self.assertTrue(torch.equal(loaded['frozen']['weight'], frozen.weight))
+        # Removing a checkpoint removes its unshared shards only
+        store.remove('first')
+        self.assertEqual(self._num_shards(store), 2)
+        self.assertSequenceEqual(store.names, ['second'])
+
+    def test_retention(self):
+        self.assertEqual(select_checkpoints_to_keep([('a', 3.), ('b', 1.), ('c', 2.), ('d', 4.)],
+                                                    keep_last=1, keep_best=1),
+                         {'b', 'd'})
+        store = ShardedCheckpointStore(self.STORE_DIRECTORY)
+        for num, score in enumerate([3., 1., 2., 4.]):
+            store.save({'weight': torch.full((32, 32), float(num))}, str(num), score=score)
+        removed = store.apply_retention(keep_last=1, keep_best=1)
+        self.assertSequenceEqual(sorted(removed), ['0', '2'])
+        self.assertSequenceEqual(store.names, ['1', '3'])
+        self.assertEqual(self._num_shards(store), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,6 @@
 import unittest
+import os
+import tempfile
 import inferno.utils.model_utils as mu
 from inferno.utils.exceptions import ShapeError
 import torch
@@ -18,5 +20,73 @@ class ModelUtilTester(unittest.TestCase):
         with self.assertRaises(ShapeError):
             mu.ModelTester((1, 10, 32, 32), (1, 30, 32, 32)).cuda()(model)
 
+    def test_export_model(self):
+        from inferno.extensions.models import UNet
+        model = UNet(1, 2, dim=2, depth=2, initial_features=4)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'unet.pt')
+            mu.export_model(model, torch.rand(1, 1, 32, 32), path=path)
+            # The model is left in training mode
+            self.assertTrue(model.training)
+            exported = torch.jit.load(path)
+        # The exported model works on other input shapes
+        input_ = torch.rand(2, 1, 64, 48)
+        with torch.no_grad():
+            self.assertTrue(torch.allclose(exported(input_), model.eval()(input_), atol=1e-5))
+        with self.assertRaises(ValueError):
+            mu.export_model(model, input_, format='onnx')
+
+    def test_fuse_for_inference(self):
+        from inferno.extensions.layers import Conv2D, BNReLUConv2D, Flatten
+        from inferno.extensions.layers.identity import Identity
+        from inferno.extensions.layers.convolutional_blocks import PreActSimpleResidualBlock
+        model = nn.Sequential(Conv2D(3, 8, 3), nn.BatchNorm2d(8),
+                              BNReLUConv2D(8, 8, 3), BNReLUConv2D(8, 8, 3), Identity(),
+                              PreActSimpleResidualBlock(8, 8, downsample=True),
+                              nn.AdaptiveAvgPool2d(1), Flatten(), nn.Linear(8, 2))
+        # Make sure that the batchnorm statistics are not trivial
+        model.train()
+        with torch.no_grad():
+            for _ in range(5):
+                model(torch.randn(4, 3, 16, 16) * 3 + 1)
+        input_ = torch.rand(2, 3, 16, 16)
+        fused_model = mu.fuse_for_inference(model, example_input=input_)
+        # The original model is left alone
+        self.assertTrue(model.training)
+        num_batchnorms = lambda m: sum(isinstance(_m, nn.BatchNorm2d) for _m in m.modules())
+        self.assertEqual(num_batchnorms(model), 6)
+        # Only the batchnorm at the input of the residual block can't be folded
+        self.assertEqual(num_batchnorms(fused_model), 1)
+        self.assertFalse(any(isinstance(_m, (Identity, Flatten)) for _m in fused_model.modules()))
+        with torch.no_grad():
+            self.assertTrue(torch.allclose(model.eval()(input_), fused_model(input_), atol=1e-5))
+        # Without an example input, the check runs with an input built from the first layer
+        fused_model = mu.fuse_for_inference(model)
+        with torch.no_grad():
+            self.assertTrue(torch.allclose(model.eval()(input_), fused_model(input_), atol=1e-5))
+
+    def test_fuse_reshape_layers(self):
+        from inferno.extensions.layers import View, As2D, As3D, AsMatrix
+        model = nn.Sequential(nn.Conv2d(4, 8, 3, padding=1),
+                              As3D(channel_as_z=True, num_channels_or_num_z_slices=2),
+                              nn.Conv3d(2, 2, 3, padding=1),
+                              As2D(), As2D(),
+                              nn.AdaptiveAvgPool2d(1), AsMatrix(),
+                              nn.Linear(8, 16), View(['x', 4, 2, 2]), As2D())
+        input_ = torch.rand(2, 4, 8, 8)
+        fused_model = mu.fuse_for_inference(model, example_input=input_)
+        self.assertFalse(any(isinstance(module, (View, As2D, As3D))
+                             for module in fused_model.modules()))
+        self.assertEqual(sum(isinstance(module, nn.Flatten) for module in fused_model), 2)
+        self.assertEqual(sum(isinstance(module, nn.Unflatten) for module in fused_model), 2)
+        # The reshapes don't depend on the spatial shape of the input
+        input_ = torch.rand(3, 4, 12, 16)
+        with torch.no_grad():
+            self.assertTrue(torch.allclose(model(input_), fused_model(input_), atol=1e-5))
+        # Fusion must be checked
+        with self.assertRaises(ValueError):
+            mu.fuse_for_inference(nn.Sequential(nn.ReLU()))
+
+
 if __name__ == '__main__':
     unittest.main()
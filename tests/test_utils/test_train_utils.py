@@ -1,6 +1,8 @@
 import unittest
+from unittest import mock
 import inferno.utils.train_utils as tu
 import numpy as np
+import torch
 
 
 class FrequencyTest(unittest.TestCase):
@@ -43,5 +45,130 @@ class FrequencyTest(unittest.TestCase):
             duration.match(epoch_count=2)
 
 
+class ScheduleTest(unittest.TestCase):
+    def test_matches_like_frequency(self):
+        frequencies = {'a': tu.Frequency(3, 'iterations'), 'b': tu.Frequency(2, 'epochs'),
+                       'c': tu.Frequency('never')}
+        schedule = tu.Schedule()
+        for name, frequency in frequencies.items():
+            schedule.register(name, frequency, match_zero=False)
+        for iteration_count in range(20):
+            epoch_count = iteration_count // 4
+            for name, frequency in frequencies.items():
+                self.assertEqual(schedule.fires(name, iteration_count=iteration_count,
+                                                epoch_count=epoch_count),
+                                 frequency.match(iteration_count=iteration_count,
+                                                 epoch_count=epoch_count, match_zero=False))
+        # Counts can go back too (e.g. when loading a checkpoint)
+        self.assertTrue(schedule.fires('a', iteration_count=3))
+        self.assertFalse(schedule.fires('a', iteration_count=0))
+
+    def test_persistent_and_modified(self):
+        schedule = tu.Schedule()
+        frequency = tu.Frequency(2, 'iterations')
+        self.assertTrue(schedule.fires('a', frequency, iteration_count=4, persistent=True))
+        self.assertFalse(schedule.fires('a', frequency, iteration_count=4, persistent=True))
+        # Modifying the frequency is picked up
+        frequency.value = 3
+        self.assertFalse(schedule.fires('a', frequency, iteration_count=4))
+        self.assertTrue(schedule.fires('a', frequency, iteration_count=6))
+        # The next match is only computed again once it's passed
+        with mock.patch.object(tu.Frequency, 'next_match', autospec=True,
+                               side_effect=tu.Frequency.next_match) as next_match:
+            for iteration_count in range(7, 13):
+                schedule.fires('a', frequency, iteration_count=iteration_count)
+        self.assertEqual(next_match.call_count, 2)
+
+    def test_events(self):
+        schedule = tu.Schedule()\
+            .register('validate', (5, 'iterations'))\
+            .register('save', (2, 'iterations'))\
+            .register('log_images', (1, 'epoch'))\
+            .register('never', 'never')
+        self.assertSequenceEqual(schedule.firing(iteration_count=10, epoch_count=1),
+                                 ['validate', 'save', 'log_images'])
+        self.assertSequenceEqual(schedule.upcoming(iteration_count=11, epoch_count=1),
+                                 [(12, 'iterations', 'save'), (15, 'iterations', 'validate'),
+                                  (1, 'epochs', 'log_images')])
+        self.assertEqual(schedule.iterations_until('validate', 11), 4)
+        self.assertIsNone(schedule.iterations_until('log_images', 11))
+
+
+class ScalarAccumulatorTest(unittest.TestCase):
+    def test_accumulate_and_flush(self):
+        accumulator = tu.ScalarAccumulator()
+        self.assertIsNone(accumulator.flush())
+        for value in [torch.tensor(1.), torch.tensor([2., 4.]), 5]:
+            accumulator.update(value)
+        summary = accumulator.flush()
+        self.assertEqual(summary, {'last': 5., 'mean': 3., 'all_finite': True, 'count': 3})
+        # Flushing resets
+        accumulator.update(torch.tensor(float('nan'))).update(torch.tensor(1.))
+        summary = accumulator.flush()
+        self.assertFalse(summary['all_finite'])
+        self.assertEqual(summary['last'], 1.)
+        self.assertEqual(summary['count'], 2)
+
+
+class StreamingHistogramTest(unittest.TestCase):
+    def test_exact_for_small_tensors(self):
+        histogram = tu.StreamingHistogram(bins=4)
+        histogram.update(torch.tensor([0., 1., 2., 3., 3.]))
+        summary = histogram.summarize()
+        self.assertEqual(summary['num'], 5)
+        self.assertEqual(summary['min'], 0.)
+        self.assertEqual(summary['max'], 3.)
+        self.assertEqual(summary['sum'], 9.)
+        self.assertSequenceEqual(summary['bucket_counts'], [1., 1., 1., 2.])
+        self.assertEqual(len(summary['bucket_limits']), 4)
+
+    def test_accumulation(self):
+        histogram = tu.StreamingHistogram(bins=10, max_samples=1000)
+        histogram.update(torch.zeros(10000))
+        histogram.update(torch.ones(10000))
+        summary = histogram.summarize()
+        self.assertEqual(summary['num'], 20000)
+        self.assertAlmostEqual(sum(summary['bucket_counts']), 20000, places=2)
+        # Both updates are represented (roughly) equally
+        self.assertAlmostEqual(summary['bucket_counts'][0] / 20000, 0.5, delta=0.1)
+        histogram.reset()
+        self.assertIsNone(histogram.summarize())
+
+
+
+class LayerStatisticsTest(unittest.TestCase):
+    def test_sampling(self):
+        model = torch.nn.Sequential(torch.nn.Linear(4, 8), torch.nn.ReLU(), torch.nn.Linear(8, 1))
+        statistics = tu.LayerStatistics(model, buffer_size=2)
+        self.assertSequenceEqual([name for name, _ in statistics.layers], ['0', '2'])
+        input = torch.rand(16, 4)
+        with statistics.sample(step=3):
+            model(input).sum().backward()
+        # Not sampling: no hooks
+        self.assertEqual(len(model[0]._forward_hooks), 0)
+        model(input).sum().backward()
+        (step, values), = statistics.flush()
+        self.assertEqual(step, 3)
+        self.assertEqual(len(values), 2 * 2 * 4)
+        activation = model[0](input)
+        self.assertAlmostEqual(values['activations/0/norm'], activation.norm().item(), places=4)
+        self.assertAlmostEqual(values['activations/0/mean'], activation.mean().item(), places=5)
+        # The gradient of the sum w.r.t. the output is all ones
+        self.assertAlmostEqual(values['gradients/2/norm'], 4.)
+        self.assertAlmostEqual(values['gradients/2/sparsity'], 0.)
+        self.assertEqual(statistics.flush(), [])
+        # Sample a random subset of the layers, and overflow the ring buffer
+        statistics = tu.LayerStatistics(model, layer_types=torch.nn.ReLU, buffer_size=2)
+        statistics.num_sampled_layers = 1
+        for step in range(3):
+            with statistics.sample(step):
+                model(input)
+        samples = statistics.flush()
+        self.assertSequenceEqual([step for step, _ in samples], [1, 2])
+        self.assertSequenceEqual(sorted(samples[0][1]),
+                                 ['activations/1/mean', 'activations/1/norm',
+                                  'activations/1/sparsity', 'activations/1/variance'])
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file